@@ -0,0 +1,180 @@
+#!/usr/bin/python3 -u
+
+'''Compares the offset-based dump decoder with the legacy one
+which popped values from the head of a list.
+
+Decodes 60 program dumps (as the factory bank) from complete sysex
+messages, as received by Engine.receive_sysex.'''
+
+import argparse
+from pathlib import Path
+import random
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import (
+    EffectOnOff, AmpModel, AmpParam, Pedal1Type, Pedal2Type,
+    ReverbType, EffectStatus, ReverbParam)
+from engine import SYSEX_BEGIN
+from midi_enums import FunctionCode
+from vox_program import VoxProgram
+
+
+def legacy_data_read(self: VoxProgram, shargs: list[int]):
+    unused = shargs.pop(0)
+    pname_intor, shargs = shargs[:18], shargs[18:]
+    pname_int = pname_intor[:7] + pname_intor[8:15] + pname_intor[16:18]
+    self.program_name = ''.join([chr(p) for p in pname_int]).strip()
+
+    self.nr_sens = shargs.pop(0)
+
+    self.set_effect_status(EffectStatus(shargs.pop(0)))        
+
+    self.amp_model = AmpModel(shargs.pop(0))
+
+    amp_params = self.amp_params
+    amp_params[AmpParam.GAIN] = shargs.pop(0)
+    amp_params[AmpParam.TREBLE] = shargs.pop(0)
+    
+    # undocumented number
+    unused = shargs.pop(0)
+    
+    amp_params[AmpParam.MIDDLE] = shargs.pop(0)
+    amp_params[AmpParam.BASS] = shargs.pop(0)
+    amp_params[AmpParam.VOLUME] = shargs.pop(0)
+    amp_params[AmpParam.TONE] = shargs.pop(0)
+    amp_params[AmpParam.RESONANCE] = shargs.pop(0)
+    amp_params[AmpParam.BRIGHT_CAP] = shargs.pop(0)
+    amp_params[AmpParam.LOW_CUT] = shargs.pop(0)
+    
+    # undocumented number
+    pedal1_exceed_i = shargs.pop(0)
+    
+    amp_params[AmpParam.MID_BOOST] = shargs.pop(0)
+    amp_params[AmpParam.BIAS_SHIFT] = shargs.pop(0)
+    amp_params[AmpParam.CLASS] = shargs.pop(0)
+    
+    pedal1_type_int = shargs.pop(0)
+    pedal1_values, shargs = shargs[:8], shargs[8:]
+    
+    # delete one unused number
+    pedal2_exceed_i = pedal1_values.pop(3)
+
+    self.pedal1_type = Pedal1Type(pedal1_type_int)
+
+    self.pedal1_values[0] = pedal1_values[0] + pedal1_values[1] * 256
+    if pedal1_exceed_i & 0x10:
+        self.pedal1_values[0] += 128
+
+    for i in range(1, 6):
+        self.pedal1_values[i] = pedal1_values[i + 1]
+    
+    pedal2_type_int = shargs.pop(0)
+    pedal2_values, shargs = shargs[:9], shargs[9:]
+    
+    # delete one unused number
+    pedal2_values.__delitem__(2)
+    
+    self.pedal2_type = Pedal2Type(pedal2_type_int)
+    
+    self.pedal2_values[0] = pedal2_values[0] + pedal2_values[1] * 256
+    if pedal2_exceed_i & 0x20:
+        self.pedal2_values[0] += 128
+
+    for i in range(1, 6):
+        self.pedal2_values[i] = pedal2_values[i + 1]
+    
+    # 8 documented reserved numbers + 2 undocumented
+    shargs = shargs[8:]
+                
+    reverb_type_int = shargs.pop(0)
+    reverb_values, shargs = shargs[:6], shargs[6:]
+    reverb_values.__delitem__(0)
+
+    self.reverb_type = ReverbType(reverb_type_int)
+
+    for reverb_param in ReverbParam:
+        self.reverb_values[reverb_param.value] = \
+            reverb_values[reverb_param.value]
+
+
+def legacy_receive(msgs: list[list[int]], programs: list[VoxProgram]):
+    for msg in msgs:
+        shargs = msg
+        header, shargs = shargs[:6], shargs[6:]
+        function_code_int = shargs.pop(0)
+        voxmode_int = shargs.pop(0)
+        prog_num = shargs.pop(0)
+        legacy_data_read(programs[prog_num], shargs)
+
+def offset_receive(msgs: list[list[int]], programs: list[VoxProgram]):
+    for msg in msgs:
+        data = memoryview(bytes(msg))
+        shargs = data[7:]
+        programs[shargs[1]].data_read(shargs[2:])
+
+def random_program(rnd: random.Random) -> VoxProgram:
+    program = VoxProgram()
+    program.program_name = ''.join(
+        [chr(rnd.randint(32, 126)) for i in range(16)]).strip()
+    program.nr_sens = rnd.randint(0, 100)
+    for effect_on_off in (EffectOnOff.PEDAL1, EffectOnOff.PEDAL2,
+                          EffectOnOff.REVERB):
+        program.active_effects[effect_on_off] = rnd.randint(0, 1)
+
+    program.amp_model = rnd.choice(list(AmpModel))
+    for amp_param in AmpParam:
+        program.amp_params[amp_param] = rnd.randint(
+            *amp_param.range_unit()[:2])
+
+    program.pedal1_type = rnd.choice(list(Pedal1Type))
+    program.pedal2_type = rnd.choice(list(Pedal2Type))
+    program.reverb_type = rnd.choice(list(ReverbType))
+
+    for i, param in enumerate(program.pedal1_type.param_type()):
+        program.pedal1_values[i] = rnd.randint(*param.range_unit()[:2])
+    for i, param in enumerate(program.pedal2_type.param_type()):
+        program.pedal2_values[i] = rnd.randint(*param.range_unit()[:2])
+    for param in ReverbParam:
+        program.reverb_values[param.value] = rnd.randint(
+            *param.range_unit()[:2])
+    return program
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='number of decodings of the 60 dumps')
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    sources = [random_program(rnd) for i in range(60)]
+    msgs = [SYSEX_BEGIN + [FunctionCode.PROGRAM_DATA_DUMP.value, 1, i]
+            + list(sources[i].data_write()) + [247]
+            for i in range(60)]
+
+    legacy_pgs = [VoxProgram() for i in range(60)]
+    offset_pgs = [VoxProgram() for i in range(60)]
+
+    # legacy decoder consumes the messages, give it copies
+    legacy_receive([m.copy() for m in msgs], legacy_pgs)
+    offset_receive(msgs, offset_pgs)
+    for i in range(60):
+        assert (legacy_pgs[i].to_json_dict()
+                == offset_pgs[i].to_json_dict()
+                == sources[i].to_json_dict())
+
+    copies = [[m.copy() for m in msgs] for i in range(args.repeat)]
+    legacy_time = timeit.timeit(
+        lambda: legacy_receive(copies.pop(), legacy_pgs), number=args.repeat)
+    offset_time = timeit.timeit(
+        lambda: offset_receive(msgs, offset_pgs), number=args.repeat)
+
+    for name, dur in (('legacy', legacy_time), ('offsets', offset_time)):
+        print(f'{name:>8}: {dur / args.repeat * 1000:.3f} ms for 60 dumps')
+    print(f' speedup: {legacy_time / offset_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
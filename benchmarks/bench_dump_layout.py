@@ -0,0 +1,107 @@
+#!/usr/bin/python3 -u
+
+'''Checks that the compiled dump layouts write and read back
+every combination of amp model, pedal types, reverb type and
+effect status, then times writing and reading them.
+
+Parameter values are derived from the combination number,
+covering the range of each parameter.'''
+
+import argparse
+from itertools import product
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import (
+    EffectOnOff, AmpModel, AmpParam, Pedal1Type, Pedal2Type,
+    ReverbType, ReverbParam, EffParam)
+from dump_layout import RAW_SIZE
+from vox_program import VoxProgram, PROGRAM_LAYOUT, AMPFX_LAYOUT
+
+
+def param_value(param: EffParam, n: int) -> int:
+    mini, maxi, unit = param.range_unit()
+    return mini + n * 7919 % (maxi - mini + 1)
+
+def all_programs() -> list[VoxProgram]:
+    programs = list[VoxProgram]()
+    
+    for n, (amp_model, pedal1_type, pedal2_type, reverb_type, status) \
+            in enumerate(product(AmpModel, Pedal1Type, Pedal2Type,
+                                 ReverbType, range(8))):
+        program = VoxProgram()
+        program.program_name = f'combi {n}'
+        program.nr_sens = n % 101
+        program.active_effects[EffectOnOff.PEDAL1] = status & 0x01
+        program.active_effects[EffectOnOff.PEDAL2] = status >> 1 & 0x01
+        program.active_effects[EffectOnOff.REVERB] = status >> 2 & 0x01
+        program.amp_model = amp_model
+        program.pedal1_type = pedal1_type
+        program.pedal2_type = pedal2_type
+        program.reverb_type = reverb_type
+
+        for amp_param in AmpParam:
+            program.amp_params[amp_param] = param_value(amp_param, n)
+        for param in pedal1_type.param_type():
+            program.pedal1_values[param.value] = param_value(param, n)
+        for param in pedal2_type.param_type():
+            program.pedal2_values[param.value] = param_value(param, n)
+        for param in ReverbParam:
+            program.reverb_values[param.value] = param_value(param, n)
+
+        programs.append(program)
+    return programs
+
+def check_round_trip(programs: list[VoxProgram]):
+    for program in programs:
+        read_pg = VoxProgram()
+        PROGRAM_LAYOUT.read(read_pg, PROGRAM_LAYOUT.write(program))
+        assert read_pg.to_json_dict() == program.to_json_dict(), \
+            f'program round trip failed for {program.program_name}'
+
+        read_pg = VoxProgram()
+        AMPFX_LAYOUT.read(read_pg, bytes(AMPFX_LAYOUT.write(program)))
+        assert (read_pg.to_json_dict(for_ampfx=True)
+                == program.to_json_dict(for_ampfx=True)), \
+            f'ampfx round trip failed for {program.program_name}'
+
+        # MIDI data bytes must not exceed 127
+        assert max(PROGRAM_LAYOUT.write(program)) < 0x80
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed passes')
+    args = parser.parse_args()
+
+    programs = all_programs()
+    check_round_trip(programs)
+    print(f'{len(programs)} combinations written and read back')
+
+    buf = bytearray(RAW_SIZE * len(programs))
+    read_pg = VoxProgram()
+    write_into = PROGRAM_LAYOUT.write_into
+    read = PROGRAM_LAYOUT.read
+
+    write_time = read_time = float('inf')
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        for n, program in enumerate(programs):
+            write_into(program, buf, n * RAW_SIZE)
+        write_time = min(write_time, time.perf_counter() - start)
+
+        data = memoryview(buf)
+        start = time.perf_counter()
+        for n in range(len(programs)):
+            read(read_pg, data[n * RAW_SIZE:])
+        read_time = min(read_time, time.perf_counter() - start)
+
+    for name, dur in (('write', write_time), ('read', read_time)):
+        print(f'{name:>6}: {dur / len(programs) * 1e6:.2f} µs per program')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/python3 -u
+
+'''Runs the engine against the software Valvetronix.
+
+For each emulator setting, measures the complete reading of the
+device at connection, the upload of the 8 user banks and 4 ampfxs,
+and a stream of parameter changes (as OSC automation), and checks
+that engine and emulator agree at the end.'''
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import AmpParam, VoxIndex
+from engine import Engine
+from vox_emulator import EmulatorClient, VoxEmulator
+from vox_program import VoxProgram
+
+
+def run(emulator: VoxEmulator, n_changes: int):
+    engine = Engine()
+    client = EmulatorClient(emulator)
+    client.set_engine(engine)
+
+    # reading of the device
+    start = time.monotonic()
+    engine.start_communication(use_cache=False)
+    idle = client.run_until_idle()
+    sync_time = time.monotonic() - start
+    synced = (idle and engine.communication_state.is_ok() and [
+        p.program_name for p in engine.factory_programs] == [
+        p.program_name for p in emulator.factory_programs])
+
+    # full amp upload
+    start = time.monotonic()
+    banks = dict[int, VoxProgram]()
+    for i in range(8):
+        banks[i] = VoxProgram()
+        banks[i].program_name = f'UPLOADED {i}'
+    engine.load_user_slots(banks, {i: VoxProgram() for i in range(4)})
+    idle = client.run_until_idle()
+    upload_time = time.monotonic() - start
+    uploaded = idle and [p.program_name for p in emulator.programs] == [
+        f'UPLOADED {i}' for i in range(8)]
+
+    # automation
+    start = time.monotonic()
+    for i in range(n_changes):
+        engine.set_param_value(VoxIndex.AMP, AmpParam.GAIN, i % 101)
+        if i % 10 == 0:
+            client.run_once()
+    idle = client.run_until_idle()
+    automation_time = time.monotonic() - start
+    automated = (idle and emulator.current_program.amp_params[AmpParam.GAIN]
+                 == (n_changes - 1) % 101)
+
+    engine.callbacks.stop()
+    return ((sync_time, synced), (upload_time, uploaded),
+            (automation_time, automated))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--changes', type=int, default=2000,
+                        help='number of parameter changes')
+    args = parser.parse_args()
+
+    # do not touch the cache of the real device
+    tmp_dir = tempfile.TemporaryDirectory()
+    os.environ['XDG_DATA_HOME'] = tmp_dir.name
+
+    for name, emulator in (
+            ('instant', VoxEmulator(latency=0.0, byte_rate=1e9)),
+            ('midi rate', VoxEmulator()),
+            ('5% lost', VoxEmulator(drop_rate=0.05, seed=0)),
+            ('small buffer', VoxEmulator(buffer_size=128))):
+        results = run(emulator, args.changes)
+        print(f'{name}:')
+        for step, (dur, ok) in zip(
+                ('reading', 'upload', 'automation'), results):
+            print(f'  {step:>10}: {dur * 1000:8.1f} ms '
+                  f'{"ok" if ok else "FAILED"}')
+        print(f'  {emulator.n_received} messages received, '
+              f'{emulator.n_dropped} lost, '
+              f'{emulator.n_overflows} overflows')
+
+
+if __name__ == '__main__':
+    main()
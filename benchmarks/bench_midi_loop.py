@@ -0,0 +1,115 @@
+#!/usr/bin/python3 -u
+
+'''Compares the event-driven MIDI loop with the legacy 1 ms polling loop.
+
+Measures the CPU time used while idle, and the latency between a
+parameter change queued from another thread and its output on the
+ALSA sequencer. Needs pyalsa and a running ALSA sequencer,
+the Valvetronix does not need to be present.'''
+
+import argparse
+from pathlib import Path
+import resource
+import statistics
+import sys
+from threading import Thread
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import AmpParam, VoxIndex
+import engine as engine_mod
+from engine import Engine
+import midi_client
+
+
+class TimedSeq:
+    '''proxy of the sequencer timestamping output events'''
+
+    def __init__(self, seq):
+        self._seq = seq
+        self.out_times = list[float]()
+
+    def __getattr__(self, name: str):
+        return getattr(self._seq, name)
+
+    def output_event(self, event):
+        self.out_times.append(time.perf_counter())
+        return self._seq.output_event(event)
+
+
+def legacy_loop():
+    client = midi_client.midi_client
+    engine = client.engine
+
+    while not client.stopping:
+        engine.process_event_queue()
+        engine.check_pending_requests()
+        client.read_events()
+        client.flush()
+        time.sleep(0.001)
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def run(loop_func, idle_time: float, n_changes: int) -> dict[str, float]:
+    client = midi_client.midi_client
+    client.stopping = False
+    timed_seq = TimedSeq(client._seq)
+    client._seq = timed_seq
+    engine: Engine = client.engine
+
+    thread = Thread(target=loop_func)
+    thread.start()
+    time.sleep(0.1)
+
+    cpu_start = cpu_time()
+    time.sleep(idle_time)
+    idle_cpu = (cpu_time() - cpu_start) / idle_time
+
+    latencies = list[float]()
+    for i in range(n_changes):
+        n_out = len(timed_seq.out_times)
+        queue_time = time.perf_counter()
+        engine.set_param_value(VoxIndex.AMP, AmpParam.GAIN, i % 100)
+        while len(timed_seq.out_times) == n_out:
+            time.sleep(0.0001)
+        latencies.append(timed_seq.out_times[n_out] - queue_time)
+        # let the rate limiter refill
+        time.sleep(0.02)
+
+    midi_client.stop_loop()
+    thread.join()
+    client._seq = timed_seq._seq
+
+    latencies.sort()
+    return {'idle_cpu_percent': idle_cpu * 100,
+            'latency_median_ms': statistics.median(latencies) * 1000,
+            'latency_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--idle-time', type=float, default=5.0,
+                        help='idle measurement duration in seconds')
+    parser.add_argument('--changes', type=int, default=200,
+                        help='number of parameter changes for latency')
+    args = parser.parse_args()
+
+    engine = Engine()
+    # make the engine believe the device is connected,
+    # messages are sent to nobody.
+    engine.communication_state = engine_mod.CommunicationState.OK
+    # nobody answers, retries would be measured as outputs
+    engine.request_pipeline.retries = 0
+    midi_client.init(engine)
+
+    for name, loop_func in (('polling 1 ms', legacy_loop),
+                            ('event-driven', midi_client.run_loop)):
+        results = run(loop_func, args.idle_time, args.changes)
+        print(f'{name:>14}: '
+              + ', '.join([f'{k} {v:.3f}' for k, v in results.items()]))
+
+
+if __name__ == '__main__':
+    main()
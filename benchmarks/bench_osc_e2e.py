@@ -0,0 +1,317 @@
+#!/usr/bin/python3 -u
+
+'''End-to-end benchmark of the OSC interface against the emulated amp.
+
+An OscUdpServer drives an engine whose MIDI client is replaced
+by the software Valvetronix, a local liblo client registers to it.
+Measured are:
+  - the time from cold start to FACTORY_BANKS_READ
+  - the time to upload the 8 user banks and the 4 ampfxs
+  - the latency from an OSC message to the sysex received by the amp
+  - the latency from a knob moved on the amp to the
+    /oscitronix/reg/current/... message received by the client
+  - the OSC messages handled per second at saturation
+
+Results are printed, and written as JSON with --output, to be
+compared with the ones of another commit with --compare.'''
+
+import argparse
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+from threading import Event, Lock, Thread
+import time
+from typing import Optional
+
+import liblo
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import AmpParam, VoxIndex
+from engine import SYSEX_BEGIN, Engine, EngineCallback
+from midi_enums import FunctionCode
+from osc import OscUdpServer
+from vox_emulator import EmulatorClient, VoxEmulator
+from vox_program import VoxProgram
+
+
+GAIN_PATH = '/oscitronix/current/amp/gain'
+REG_GAIN_PATH = '/oscitronix/reg/current/amp/gain'
+
+
+class WatchedEmulator(VoxEmulator):
+    '''emulator telling when it receives a new amp gain value'''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.gain_times = dict[int, float]()
+        self._watch_lock = Lock()
+
+    def receive(self, msg: bytes|list[int]):
+        msg = bytes(msg)
+        if (len(msg) == len(SYSEX_BEGIN) + 6
+                and msg[len(SYSEX_BEGIN)] == FunctionCode.PARAMETER_CHANGE.value
+                and msg[-5] == VoxIndex.AMP.value
+                and msg[-4] == AmpParam.GAIN.value):
+            with self._watch_lock:
+                self.gain_times[msg[-3]] = time.monotonic()
+
+        super().receive(msg)
+
+    def reset_watch(self):
+        with self._watch_lock:
+            self.gain_times.clear()
+
+    def gain_time(self, value: int) -> Optional[float]:
+        with self._watch_lock:
+            return self.gain_times.get(value)
+
+
+class RegClient(liblo.ServerThread):
+    '''OSC client registered to the OscUdpServer'''
+
+    def __init__(self, server_port: int):
+        super().__init__()
+        self.server_addr = liblo.Address(server_port)
+        self.gain_times = dict[int, float]()
+        self.add_method(REG_GAIN_PATH, None, self._reg_gain)
+        self.add_method(None, None, self._any)
+
+    def _reg_gain(self, path: str, args: list, types: str, src_addr):
+        self.gain_times[args[0]] = time.monotonic()
+
+    def _any(self, path: str, args: list, types: str, src_addr):
+        pass
+
+    def register(self):
+        self.send(self.server_addr, '/oscitronix/register')
+
+    def send_gain(self, value: int):
+        self.send(self.server_addr, GAIN_PATH, value)
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    '''p50, p90, p99 and max of values in milliseconds'''
+    if not values:
+        return {}
+
+    values = sorted(values)
+    ret = dict[str, float]()
+    for name, ratio in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        ret[name] = values[min(int(len(values) * ratio), len(values) - 1)]
+    ret['max'] = values[-1]
+    return {k: round(v * 1000, 3) for k, v in ret.items()}
+
+def wait_until(check, timeout: float) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if check():
+            return True
+        time.sleep(0.001)
+    return False
+
+def cold_start(engine: Engine, timeout: float) -> Optional[float]:
+    factory_read = Event()
+
+    def listener(cb: EngineCallback, arg):
+        if cb is EngineCallback.FACTORY_BANKS_READ:
+            factory_read.set()
+
+    engine.add_callback(listener)
+    start = time.monotonic()
+    engine.start_communication(use_cache=False)
+    if not factory_read.wait(timeout):
+        return None
+    return time.monotonic() - start
+
+def full_upload(engine: Engine, emulator: VoxEmulator,
+                timeout: float) -> Optional[float]:
+    names = [f'UPLOADED {i}' for i in range(8)]
+    start = time.monotonic()
+    banks = dict[int, VoxProgram]()
+    for i, name in enumerate(names):
+        banks[i] = VoxProgram()
+        banks[i].program_name = name
+    engine.load_user_slots(banks, {i: VoxProgram() for i in range(4)})
+
+    if not wait_until(
+            lambda: [p.program_name for p in emulator.programs] == names,
+            timeout):
+        return None
+    return time.monotonic() - start
+
+def osc_to_sysex(client: RegClient, emulator: WatchedEmulator,
+                 n_samples: int) -> tuple[list[float], int]:
+    '''send gain changes one by one, returns latencies and losses'''
+    latencies = list[float]()
+    lost = 0
+    emulator.reset_watch()
+
+    for i in range(n_samples):
+        # consecutive values always differ
+        value = i % 101
+        start = time.monotonic()
+        client.send_gain(value)
+
+        if not wait_until(
+                lambda: emulator.gain_time(value) is not None, 1.0):
+            lost += 1
+            continue
+
+        latencies.append(emulator.gain_time(value) - start)
+        emulator.reset_watch()
+
+    return latencies, lost
+
+def amp_to_reg(client: RegClient, emu_client: EmulatorClient,
+               emulator: VoxEmulator,
+               n_samples: int) -> tuple[list[float], int]:
+    '''move the amp gain knob step by step,
+    returns latencies and losses'''
+    latencies = list[float]()
+    lost = 0
+
+    for i in range(n_samples):
+        value = (i * 7) % 101
+        client.gain_times.pop(value, None)
+        start = time.monotonic()
+        emulator.move_param(VoxIndex.AMP, AmpParam.GAIN.value, value)
+        emu_client.wakeup()
+
+        if not wait_until(lambda: value in client.gain_times, 1.0):
+            lost += 1
+            continue
+
+        latencies.append(client.gain_times[value] - start)
+
+    return latencies, lost
+
+def saturation(client: RegClient, emulator: WatchedEmulator,
+               n_messages: int) -> Optional[float]:
+    '''send n_messages gain changes without waiting, returns messages
+    per second until the amp receives the last value'''
+    emulator.reset_watch()
+    # the last value is not sent before
+    last_value = 100
+
+    start = time.monotonic()
+    for i in range(n_messages - 1):
+        client.send_gain(i % 100)
+    client.send_gain(last_value)
+
+    if not wait_until(
+            lambda: emulator.gain_time(last_value) is not None, 10.0):
+        return None
+    return n_messages / (emulator.gain_time(last_value) - start)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except BaseException:
+        return None
+
+def print_comparison(results: dict, previous: dict):
+    print(f'compared with {previous.get("commit")}:')
+    for key, value in results.items():
+        old_value = previous.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            for sub_key, sub_value in value.items():
+                old_sub = old_value.get(sub_key)
+                if (isinstance(sub_value, (int, float))
+                        and isinstance(old_sub, (int, float)) and old_sub):
+                    print(f'  {key}.{sub_key}: {old_sub} -> {sub_value} '
+                          f'({(sub_value / old_sub - 1) * 100:+.1f}%)')
+        elif (isinstance(value, (int, float))
+                and isinstance(old_value, (int, float)) and old_value):
+            print(f'  {key}: {old_value} -> {value} '
+                  f'({(value / old_value - 1) * 100:+.1f}%)')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=300,
+                        help='number of latency samples')
+    parser.add_argument('--saturation', type=int, default=5000,
+                        help='number of messages sent at saturation')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='emulated amp response time, in seconds')
+    parser.add_argument('--output', type=Path,
+                        help='write results to this JSON file')
+    parser.add_argument('--compare', type=Path,
+                        help='JSON results of a previous run to compare')
+    args = parser.parse_args()
+
+    # do not touch the cache of the real device
+    tmp_dir = tempfile.TemporaryDirectory()
+    os.environ['XDG_DATA_HOME'] = tmp_dir.name
+
+    emulator = WatchedEmulator(latency=args.latency)
+    engine = Engine()
+    emu_client = EmulatorClient(emulator)
+    emu_client.set_engine(engine)
+    osc_server = OscUdpServer()
+    osc_server.set_engine(engine)
+    client = RegClient(osc_server.port)
+
+    threads = [Thread(target=emu_client.run_loop),
+               Thread(target=osc_server.run_loop)]
+    for thread in threads:
+        thread.start()
+    client.start()
+
+    results = {'commit': git_commit(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'emulator_latency': args.latency}
+
+    try:
+        cold_start_time = cold_start(engine, 60.0)
+        results['cold_start_ms'] = (
+            None if cold_start_time is None
+            else round(cold_start_time * 1000, 1))
+
+        client.register()
+        time.sleep(0.1)
+
+        upload_time = full_upload(engine, emulator, 60.0)
+        results['full_upload_ms'] = (
+            None if upload_time is None else round(upload_time * 1000, 1))
+
+        latencies, lost = osc_to_sysex(client, emulator, args.samples)
+        results['osc_to_sysex_ms'] = percentiles(latencies)
+        results['osc_to_sysex_lost'] = lost
+
+        latencies, lost = amp_to_reg(
+            client, emu_client, emulator, args.samples)
+        results['amp_to_reg_ms'] = percentiles(latencies)
+        results['amp_to_reg_lost'] = lost
+
+        rate = saturation(client, emulator, args.saturation)
+        results['saturation_msgs_per_s'] = (
+            None if rate is None else round(rate))
+
+    finally:
+        client.stop()
+        emu_client.stop_loop()
+        osc_server.stop_loop()
+        for thread in threads:
+            thread.join()
+        engine.callbacks.stop()
+
+    print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
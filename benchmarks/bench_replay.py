@@ -0,0 +1,114 @@
+#!/usr/bin/python3 -u
+
+'''Replays a MIDI log to the engine, without the device.
+
+Without a log file (recorded with `oscitronix --record-midi FILE`),
+a synthetic session is recorded first: the reading of the device
+at connection, then a knob sweep of parameter changes.
+
+The replay is as fast as possible unless --speed is given,
+the callbacks received by a listener are counted, as a GUI
+or an OSC client would receive them.'''
+
+import argparse
+from pathlib import Path
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import VoxIndex, VoxMode
+from engine import SYSEX_BEGIN, Engine
+from midi_enums import FunctionCode
+from midi_log import INCOMING, MidiRecorder
+from midi_replay import MidiReplay
+from vox_program import VoxProgram
+
+
+def record_session(path: Path, n_changes: int):
+    recorder = MidiRecorder(path)
+    rnd = random.Random(0)
+    timestamp = 0.0
+
+    def incoming(args: list[int], delay: float):
+        nonlocal timestamp
+        timestamp += delay
+        recorder.record(INCOMING, SYSEX_BEGIN + args + [247], timestamp)
+
+    # device reading at connection
+    dump = list(VoxProgram().data_write())
+    ampfx_dump = list(VoxProgram().ampfx_data_write())
+    incoming([FunctionCode.MODE_DATA.value, VoxMode.USER.value, 0], 0.005)
+    incoming([FunctionCode.CURRENT_PROGRAM_DATA_DUMP.value] + dump, 0.020)
+    for i in range(8):
+        incoming([FunctionCode.PROGRAM_DATA_DUMP.value,
+                  VoxMode.USER.value, i] + dump, 0.020)
+    for i in range(4):
+        incoming([FunctionCode.CUSTOM_AMPFX_DATA_DUMP.value, 0, i]
+                 + ampfx_dump, 0.020)
+    for i in range(60):
+        incoming([FunctionCode.PROGRAM_DATA_DUMP.value,
+                  VoxMode.PRESET.value, i] + dump, 0.020)
+
+    # knob sweeps, amp sends about one message each 5ms
+    for i in range(n_changes):
+        incoming([FunctionCode.PARAMETER_CHANGE.value,
+                  VoxIndex.AMP.value, rnd.randint(0, 4),
+                  rnd.randint(0, 100), 0], 0.005)
+
+    recorder.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('log', nargs='?', type=Path,
+                        help='MIDI log file to replay')
+    parser.add_argument('--changes', type=int, default=20000,
+                        help='parameter changes in the synthetic session')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='replay speed, 1.0 for original speed')
+    args = parser.parse_args()
+
+    log_path: Path = args.log
+    if log_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        log_path = Path(tmp_dir.name) / 'session.midilog'
+        record_session(log_path, args.changes)
+
+    replay = MidiReplay(log_path)
+    engine = Engine()
+
+    n_callbacks = 0
+    all_received = threading.Event()
+
+    def listener(cb, arg):
+        nonlocal n_callbacks
+        if cb == 'end':
+            all_received.set()
+            return
+        n_callbacks += 1
+
+    engine.callbacks.add(listener)
+    replay.set_engine(engine)
+    duration = replay.run(args.speed)
+
+    # wait the listener thread has emptied its queue
+    start = time.monotonic()
+    engine.callbacks.dispatch('end')
+    all_received.wait()
+    drain = time.monotonic() - start
+    engine.callbacks.stop()
+
+    n_received = replay.n_recorded_received
+    print(f'  received: {n_received} messages in {duration * 1000:.1f} ms, '
+          f'{n_received / duration:.0f} messages/s')
+    print(f'      sent: {replay.n_sent} messages '
+          f'({replay.n_recorded_sent} in the log)')
+    print(f' callbacks: {n_callbacks} ({engine.callbacks.dropped()} dropped), '
+          f'queue emptied {drain * 1000:.1f} ms after the replay')
+
+
+if __name__ == '__main__':
+    main()
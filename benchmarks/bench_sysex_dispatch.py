@@ -0,0 +1,191 @@
+#!/usr/bin/python3 -u
+
+'''Compares the table-driven dispatch of received sysex messages
+with the legacy if/elif chains over FunctionCode and VoxIndex.
+
+Feeds a stream of PARAMETER_CHANGE messages, as sent by the amp
+when its knobs are turned, to Engine.receive_sysex, and checks
+that both versions give the same program.'''
+
+import argparse
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import (
+    AmpModel, AmpParam, EffectOnOff, Pedal1Type, Pedal2Type,
+    ReverbType, VoxIndex)
+from engine import (
+    _SYSEX_BEGIN_BYTES, DEVICE_INQUIRY_REPLY_BEGIN, SYSEX_BEGIN,
+    CommunicationState, Engine, EngineCallback)
+from midi_enums import FunctionCode
+from request_pipeline import ERROR_CODES, response_key
+
+
+def legacy_receive_sysex(self: Engine, args: list[int]):
+    '''receive_sysex before the handler registries,
+    limited to the PARAMETER_CHANGE branch'''
+    if len(args) < 7:
+        return
+
+    if (args[:2] == DEVICE_INQUIRY_REPLY_BEGIN
+            and args[3:5] == [6, 2]):
+        return
+
+    data = memoryview(bytes(args))
+    if data[:6] != _SYSEX_BEGIN_BYTES:
+        return
+
+    function_code_int = data[6]
+    shargs = data[7:]
+
+    try:
+        function_code = FunctionCode(function_code_int)
+    except:
+        return
+
+    request = self.request_pipeline.response_received(
+        function_code, response_key(function_code, shargs))
+
+    if function_code in ERROR_CODES:
+        return
+
+    if self.request_pipeline.is_busy():
+        self.set_communication_state(CommunicationState.YES_BUT_CHECKING)
+    else:
+        self.set_communication_state(CommunicationState.OK)
+
+    if function_code is FunctionCode.PARAMETER_CHANGE:
+        try:
+            vox_index = VoxIndex(shargs[0])
+        except:
+            return
+
+        if len(shargs) < 4:
+            return
+
+        param_index, value, big_value = shargs[1], shargs[2], shargs[3]
+
+        if vox_index is VoxIndex.NR_SENS:
+            if param_index == 0:
+                self.current_program.nr_sens = min(max(value, 0), 100)
+
+        elif vox_index is VoxIndex.EFFECT_STATUS:
+            try:
+                effect_on_off = EffectOnOff(param_index)
+                self.current_program.active_effects[effect_on_off] = value
+            except:
+                return
+
+        elif vox_index is VoxIndex.EFFECT_MODEL:
+            try:
+                effect = EffectOnOff(param_index)
+            except:
+                return
+
+            if effect is EffectOnOff.AMP:
+                self.current_program.amp_model = AmpModel(value)
+            elif effect is EffectOnOff.PEDAL1:
+                self.current_program.pedal1_type = Pedal1Type(value)
+            elif effect is EffectOnOff.PEDAL2:
+                self.current_program.pedal2_type = Pedal2Type(value)
+            elif effect is EffectOnOff.REVERB:
+                self.current_program.reverb_type = ReverbType(value)
+
+        elif vox_index is VoxIndex.AMP:
+            try:
+                amp_param = AmpParam(param_index)
+            except:
+                return
+            self.current_program.amp_params[amp_param] = value
+
+        elif vox_index is VoxIndex.PEDAL1:
+            try:
+                assert 0 <= param_index <= 5
+            except:
+                return
+            self.current_program.pedal1_values[param_index] = \
+                value + big_value * 128
+
+        elif vox_index is VoxIndex.PEDAL2:
+            try:
+                assert 0 <= param_index <= 5
+            except:
+                return
+            self.current_program.pedal2_values[param_index] = \
+                value + big_value * 128
+
+        elif vox_index is VoxIndex.REVERB:
+            try:
+                assert 0 <= param_index <= 4
+            except:
+                return
+            self.current_program.reverb_values[param_index] = value
+
+        self._send_cb(
+            EngineCallback.PARAM_CHANGED,
+            (self.current_program, vox_index, param_index))
+
+def param_change_stream(rnd: random.Random, size: int) -> list[list[int]]:
+    '''mostly knob moves, with a few switches and model changes'''
+    msgs = list[list[int]]()
+    for i in range(size):
+        choice = rnd.random()
+        if choice < 0.4:
+            args = (VoxIndex.AMP.value, rnd.randint(0, 6),
+                    rnd.randint(0, 100), 0)
+        elif choice < 0.6:
+            value = rnd.randint(1, 500)
+            args = (VoxIndex.PEDAL1.value, 0, value % 128, value // 128)
+        elif choice < 0.8:
+            args = (rnd.choice((VoxIndex.PEDAL2, VoxIndex.REVERB)).value,
+                    rnd.randint(1, 4), rnd.randint(0, 100), 0)
+        elif choice < 0.9:
+            args = (VoxIndex.NR_SENS.value, 0, rnd.randint(0, 100), 0)
+        elif choice < 0.95:
+            args = (VoxIndex.EFFECT_STATUS.value,
+                    rnd.choice((1, 2, 4)), rnd.randint(0, 1), 0)
+        else:
+            args = (VoxIndex.EFFECT_MODEL.value, EffectOnOff.AMP.value,
+                    rnd.randint(0, 10), 0)
+
+        msgs.append(SYSEX_BEGIN + [FunctionCode.PARAMETER_CHANGE.value]
+                    + list(args) + [247])
+    return msgs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000,
+                        help='number of PARAMETER_CHANGE messages')
+    args = parser.parse_args()
+
+    msgs = param_change_stream(random.Random(0), args.messages)
+
+    legacy_engine, table_engine = Engine(), Engine()
+    for engine in (legacy_engine, table_engine):
+        engine.communication_state = CommunicationState.OK
+
+    start = time.perf_counter()
+    for msg in msgs:
+        legacy_receive_sysex(legacy_engine, msg)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for msg in msgs:
+        table_engine.receive_sysex(msg)
+    table_time = time.perf_counter() - start
+
+    assert (legacy_engine.current_program.to_json_dict()
+            == table_engine.current_program.to_json_dict())
+
+    for name, dur in (('legacy', legacy_time), ('table', table_time)):
+        print(f'{name:>8}: {dur * 1000:.1f} ms, '
+              f'{args.messages / dur:.0f} messages/s')
+    print(f' speedup: {legacy_time / table_time:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
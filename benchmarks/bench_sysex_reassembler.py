@@ -0,0 +1,96 @@
+#!/usr/bin/python3 -u
+
+'''Checks and times the sysex reassembler of the MIDI client.
+
+A stream of messages (parameter changes and program dumps) is fed
+as one message per event, then cut at random places, with several
+messages per event and real-time bytes inserted, and finally
+with garbage between messages. All cases must give back
+the same messages.'''
+
+import argparse
+import logging
+from pathlib import Path
+import random
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from engine import SYSEX_BEGIN
+from midi_enums import FunctionCode
+from sysex_reassembler import SysexReassembler
+from vox_program import VoxProgram
+
+
+def message_stream(rnd: random.Random, size: int) -> list[bytes]:
+    dump = list(VoxProgram().data_write())
+    msgs = list[bytes]()
+    for i in range(size):
+        if rnd.random() < 0.05:
+            msgs.append(bytes(
+                SYSEX_BEGIN + [FunctionCode.PROGRAM_DATA_DUMP.value,
+                               1, rnd.randint(0, 59)] + dump + [247]))
+        else:
+            msgs.append(bytes(
+                SYSEX_BEGIN + [FunctionCode.PARAMETER_CHANGE.value,
+                               4, rnd.randint(0, 11), rnd.randint(0, 100),
+                               0, 247]))
+    return msgs
+
+def split_events(rnd: random.Random, msgs: list[bytes],
+                 garbage=False) -> list[bytes]:
+    '''cut the stream at random places, with real-time bytes
+    (and garbage out of messages) inserted'''
+    stream = bytearray()
+    for msg in msgs:
+        if garbage and rnd.random() < 0.1:
+            # data bytes and an aborted message
+            stream += bytes([rnd.randint(0, 127) for i in range(5)])
+            stream += bytes(SYSEX_BEGIN[:4] + [0x90, 60, 100])
+
+        for byte in msg:
+            if rnd.random() < 0.01:
+                stream.append(0xF8)
+            stream.append(byte)
+
+    events = list[bytes]()
+    pos = 0
+    while pos < len(stream):
+        size = rnd.randint(1, 200)
+        events.append(bytes(stream[pos:pos + size]))
+        pos += size
+    return events
+
+def reassemble(events: list[bytes]) -> tuple[list[bytes], float]:
+    reassembler = SysexReassembler()
+    frames = list[bytes]()
+    start = time.perf_counter()
+    for event in events:
+        frames += reassembler.feed(event)
+    return frames, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000,
+                        help='number of messages in the stream')
+    args = parser.parse_args()
+
+    # aborted messages are expected in the garbage case
+    logging.getLogger('sysex_reassembler').setLevel(logging.ERROR)
+
+    rnd = random.Random(0)
+    msgs = message_stream(rnd, args.messages)
+
+    for name, events in (
+            ('one per event', msgs),
+            ('split', split_events(rnd, msgs)),
+            ('garbage', split_events(rnd, msgs, garbage=True))):
+        frames, dur = reassemble(events)
+        assert frames == msgs, f'{name}: messages differ'
+        print(f'{name:>14}: {len(events)} events, {dur * 1000:.1f} ms, '
+              f'{len(msgs) / dur:.0f} messages/s')
+
+
+if __name__ == '__main__':
+    main()
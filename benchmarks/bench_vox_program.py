@@ -0,0 +1,104 @@
+#!/usr/bin/python3 -u
+
+'''Compares the array based VoxProgram with the legacy one,
+made of two Enum keyed dicts and three lists: memory used by
+a library of programs, and time to copy them.'''
+
+import argparse
+from pathlib import Path
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import (
+    EffectOnOff, AmpModel, AmpParam, Pedal1Type, Pedal2Type, ReverbType)
+from vox_program import VoxProgram
+
+
+class LegacyVoxProgram:
+    def __init__(self):
+        self.program_name = ''
+        self.nr_sens = 0
+        self.active_effects = dict[EffectOnOff, int]()
+        for effect_on_off in EffectOnOff:
+            self.active_effects[effect_on_off] = 0
+        self.amp_model = AmpModel.DELUXE_CL_VIBRATO
+        self.amp_params = dict[AmpParam, int]()
+        for amp_param in AmpParam:
+            self.amp_params[amp_param] = 0
+        self.pedal1_type = Pedal1Type.COMP
+        self.pedal2_type = Pedal2Type.FLANGER
+        self.reverb_type = ReverbType.ROOM
+        self.pedal1_values = [0, 0, 0, 0, 0, 0]
+        self.pedal2_values = [0, 0, 0, 0, 0, 0]
+        self.reverb_values = [0, 0, 0, 0, 0]
+
+    def copy(self) -> 'LegacyVoxProgram':
+        p = LegacyVoxProgram()
+        p.program_name = self.program_name
+        p.nr_sens = self.nr_sens
+
+        for effonoff, value in self.active_effects.items():
+            p.active_effects[effonoff] = value
+
+        p.amp_model = self.amp_model
+        for amp_param, value in self.amp_params.items():
+            p.amp_params[amp_param] = value
+
+        p.pedal1_type = self.pedal1_type
+        p.pedal2_type = self.pedal2_type
+        p.reverb_type = self.reverb_type
+
+        for i in range(6):
+            p.pedal1_values[i] = self.pedal1_values[i]
+            p.pedal2_values[i] = self.pedal2_values[i]
+            if i < 5:
+                p.reverb_values[i] = self.reverb_values[i]
+        
+        return p
+
+
+def fill(program, n: int):
+    program.program_name = f'program {n}'
+    program.nr_sens = n % 101
+    program.amp_model = AmpModel(n % len(AmpModel))
+    for amp_param in AmpParam:
+        program.amp_params[amp_param] = (n + amp_param.value) % 101
+    for i in range(6):
+        program.pedal1_values[i] = (n * 3 + i) % 101
+        program.pedal2_values[i] = (n * 5 + i) % 101
+
+def library_size(program_cls: type, n_programs: int) -> int:
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    library = [program_cls() for i in range(n_programs)]
+    for i, program in enumerate(library):
+        fill(program, i)
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--programs', type=int, default=5000,
+                        help='number of programs in the library')
+    args = parser.parse_args()
+
+    for name, program_cls in (('legacy', LegacyVoxProgram),
+                              ('array', VoxProgram)):
+        size = library_size(program_cls, args.programs)
+
+        library = [program_cls() for i in range(args.programs)]
+        for i, program in enumerate(library):
+            fill(program, i)
+        copy_time = min(timeit.repeat(
+            lambda: [p.copy() for p in library], number=1, repeat=5))
+
+        print(f'{name:>7}: {size / args.programs:.0f} bytes per program, '
+              f'copy {copy_time / args.programs * 1e6:.2f} µs')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,6 @@ APP_NAME = 'OsciTronix'
 
 CONFIG_FILE = 'config.json'
 CURRENT_PROGRAM_FILE = 'current_program.json'
-LOCAL_PROGRAMS_DIRNAME = 'local_programs'
\ No newline at end of file
+LOCAL_PROGRAMS_DIRNAME = 'local_programs'
+FACTORY_CACHE_FILE = 'factory_presets.json'
+USER_BANKS_CACHE_FILE = 'user_banks.json'
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import logging
+from threading import Condition, Thread
+import time
+from typing import Any, Callable, Hashable, Optional
+
+
+_logger = logging.getLogger(__name__)
+
+# Returns the key of a callback, pending callbacks with the same key
+# are replaced by the newest one. None means the callback is never
+# replaced (errors for example).
+CoalesceKeyFunc = Callable[[Any, Any], Optional[Hashable]]
+
+
+class _Listener:
+    '''Queue and worker thread of one callback.'''
+
+    # time between two warnings about dropped callbacks
+    DROP_WARNING_PERIOD = 5.0
+
+    def __init__(self, cb: Callable[[Any, Any], None], max_size: int,
+                 coalesce_key: Optional[CoalesceKeyFunc],
+                 latency_cb: Optional[Callable[[float], None]]):
+        self.cb = cb
+        self.max_size = max_size
+        self.dropped = 0
+        self._coalesce_key = coalesce_key
+        self._latency_cb = latency_cb
+        # cb_type, arg and time of push of the pending callbacks
+        self._pending = OrderedDict[Hashable, tuple[Any, Any, float]]()
+        self._n_uniques = 0
+        self._cond = Condition()
+        self._stopping = False
+        self._last_drop_warning = 0.0
+
+        self._thread = Thread(target=self._run, daemon=True,
+                              name=f'callback {getattr(cb, "__name__", cb)}')
+        self._thread.start()
+
+    def push(self, cb_type: Any, arg: Any):
+        key = None
+        if self._coalesce_key is not None:
+            key = self._coalesce_key(cb_type, arg)
+
+        if key is None:
+            # unique key, never replaced
+            self._n_uniques += 1
+            key = ('unique', self._n_uniques)
+
+        with self._cond:
+            # the newest one takes the place at the end of the queue,
+            # order between different keys is kept.
+            self._pending.pop(key, None)
+            self._pending[key] = (cb_type, arg, time.monotonic())
+
+            if len(self._pending) > self.max_size:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                self._warn_drop()
+
+            self._cond.notify()
+
+    def _warn_drop(self):
+        now = time.monotonic()
+        if now - self._last_drop_warning < self.DROP_WARNING_PERIOD:
+            return
+
+        self._last_drop_warning = now
+        _logger.warning(
+            f'listener {self.cb} is too slow, '
+            f'{self.dropped} callbacks dropped')
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+
+                if self._stopping:
+                    return
+
+                key, (cb_type, arg, push_time) = \
+                    self._pending.popitem(last=False)
+
+            if self._latency_cb is not None:
+                self._latency_cb(time.monotonic() - push_time)
+
+            try:
+                self.cb(cb_type, arg)
+            except BaseException as e:
+                _logger.warning(
+                    f'callback {self.cb} failed with {cb_type}: {str(e)}')
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+    def join(self, timeout: Optional[float]):
+        self._thread.join(timeout)
+
+
+class CallbackDispatcher:
+    '''Hands the engine callbacks to listeners, each one has its own
+    bounded queue and worker thread, so that a slow listener
+    (an OSC client not responding for example) never delays the
+    MIDI thread nor the other listeners.
+
+    When a queue is full, the oldest pending callback is dropped.
+
+    If given, latency_cb is called with the time in seconds each
+    callback waited in its queue.'''
+
+    def __init__(self, max_size=256,
+                 coalesce_key: Optional[CoalesceKeyFunc] = None,
+                 latency_cb: Optional[Callable[[float], None]] = None):
+        self.max_size = max_size
+        self._coalesce_key = coalesce_key
+        self._latency_cb = latency_cb
+        self._listeners = dict[Callable, _Listener]()
+
+    def add(self, cb: Callable[[Any, Any], None]):
+        if cb in self._listeners:
+            return
+        self._listeners[cb] = _Listener(
+            cb, self.max_size, self._coalesce_key, self._latency_cb)
+
+    def remove(self, cb: Callable[[Any, Any], None]):
+        listener = self._listeners.pop(cb, None)
+        if listener is not None:
+            listener.stop()
+
+    def dispatch(self, cb_type: Any, arg: Any = None):
+        for listener in list(self._listeners.values()):
+            listener.push(cb_type, arg)
+
+    def dropped(self) -> int:
+        return sum([lt.dropped for lt in self._listeners.values()])
+
+    def stop(self, timeout: Optional[float] = 1.0):
+        '''stops the worker threads, pending callbacks are lost'''
+        listeners = list(self._listeners.values())
+        self._listeners.clear()
+
+        for listener in listeners:
+            listener.stop()
+        for listener in listeners:
+            listener.join(timeout)
@@ -15,10 +15,21 @@ class NsmMode(Enum):
 class Config:
     auto_connect_device = True
     nsm_mode = NsmMode.LOAD_SAVED_PROGRAM
+    
+    # max number of dump requests waiting for an answer
+    # while reading the device at startup
+    request_window = 4
+    
+    # At connection, restore user banks and ampfxs from the cache,
+    # and read them from the device only when they are used.
+    # The cache can not tell apart two identical amps.
+    lazy_user_sync = False
 
     def to_dict(self) -> dict[str, Any]:
         return {'auto_connect_device': self.auto_connect_device,
-                'nsm_mode': self.nsm_mode.name.lower()}
+                'nsm_mode': self.nsm_mode.name.lower(),
+                'request_window': self.request_window,
+                'lazy_user_sync': self.lazy_user_sync}
 
     def adjust_from_dict(self, conf_dict: dict[str, Any]):
         try:
@@ -34,6 +45,22 @@ class Config:
             _logger.warning(
                 'config file does not contain correct value '
                 f'for nsm_mode. {str(e)}')
+
+        try:
+            self.request_window = max(
+                int(conf_dict.get('request_window', self.request_window)), 1)
+        except BaseException as e:
+            _logger.warning(
+                'config file does not contain correct value '
+                f'for request_window. {str(e)}')
+
+        try:
+            self.lazy_user_sync = bool(
+                conf_dict.get('lazy_user_sync', self.lazy_user_sync))
+        except BaseException as e:
+            _logger.warning(
+                'config file does not contain correct value '
+                f'for lazy_user_sync. {str(e)}')
     
     def load_from_file(self, config_path: Path):
         if config_path.exists():
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Optional
+
+import xdg
+from app_infos import APP_NAME, FACTORY_CACHE_FILE, USER_BANKS_CACHE_FILE
+from vox_program import VoxProgram
+
+
+_logger = logging.getLogger(__name__)
+
+# increment it each time the cache files format changes,
+# or when VoxProgram decoding changes.
+CACHE_VERSION = 1
+
+
+def cache_path(file_name: str) -> Path:
+    return xdg.xdg_data_home() / APP_NAME / file_name
+
+def program_hash(program: VoxProgram) -> str:
+    return hashlib.sha1(bytes(program.data_write())).hexdigest()
+
+def ampfx_hash(program: VoxProgram) -> str:
+    return hashlib.sha1(bytes(program.ampfx_data_write())).hexdigest()
+
+def _load(file_name: str, device_identity: tuple[int, ...]) -> Optional[dict]:
+    path = cache_path(file_name)
+    if not path.exists():
+        return None
+    
+    try:
+        with open(path, 'r') as f:
+            cache_dict = json.load(f)
+
+        if cache_dict['version'] != CACHE_VERSION:
+            _logger.info(f'{file_name} cache has an old version')
+            return None
+        
+        if tuple(cache_dict['device']) != device_identity:
+            _logger.info(f'{file_name} cache is for another device')
+            return None
+    except BaseException as e:
+        _logger.warning(f'Failed to read cache {path}\n{str(e)}')
+        return None
+
+    return cache_dict
+
+def _save(file_name: str, device_identity: tuple[int, ...], cache_dict: dict):
+    path = cache_path(file_name)
+    cache_dict['version'] = CACHE_VERSION
+    cache_dict['device'] = list(device_identity)
+
+    try:
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, 'w') as f:
+            json.dump(cache_dict, f)
+    except BaseException as e:
+        _logger.warning(f'Failed to save cache {path}\n{str(e)}')
+
+def load_factory(
+        device_identity: tuple[int, ...]) -> Optional[list[VoxProgram]]:
+    '''returns the cached factory programs if they have been
+    read from a device with the same identity, else None.'''
+    cache_dict = _load(FACTORY_CACHE_FILE, device_identity)
+    if cache_dict is None:
+        return None
+    
+    try:
+        programs = [VoxProgram.from_json_dict(d)
+                    for d in cache_dict['programs']]
+        assert len(programs) == 60
+    except BaseException as e:
+        _logger.warning(
+            f'Failed to read factory presets cache\n{str(e)}')
+        return None
+    
+    return programs
+
+def save_factory(device_identity: tuple[int, ...],
+                 programs: list[VoxProgram]):
+    _save(FACTORY_CACHE_FILE, device_identity,
+          {'programs': [p.to_json_dict() for p in programs]})
+
+def load_user_slots(device_identity: tuple[int, ...]) -> Optional[
+        tuple[list[VoxProgram], list[str], list[VoxProgram], list[str]]]:
+    '''returns the last known user programs and ampfxs of the device
+    with their hashes, or None if they are unknown.'''
+    cache_dict = _load(USER_BANKS_CACHE_FILE, device_identity)
+    if cache_dict is None:
+        return None
+    
+    try:
+        programs = [VoxProgram.from_json_dict(d)
+                    for d in cache_dict['programs']]
+        ampfxs = [VoxProgram.from_json_dict(d)
+                  for d in cache_dict['ampfxs']]
+        programs_hashes = [str(h) for h in cache_dict['programs_hashes']]
+        ampfxs_hashes = [str(h) for h in cache_dict['ampfxs_hashes']]
+        assert len(programs) == len(programs_hashes) == 8
+        assert len(ampfxs) == len(ampfxs_hashes) == 4
+    except BaseException as e:
+        _logger.warning(
+            f'Failed to read user banks cache\n{str(e)}')
+        return None
+    
+    return programs, programs_hashes, ampfxs, ampfxs_hashes
+
+def save_user_slots(
+        device_identity: tuple[int, ...],
+        programs: list[VoxProgram], programs_hashes: list[str],
+        ampfxs: list[VoxProgram], ampfxs_hashes: list[str]):
+    _save(USER_BANKS_CACHE_FILE, device_identity,
+          {'programs': [p.to_json_dict() for p in programs],
+           'programs_hashes': programs_hashes,
+           'ampfxs': [p.to_json_dict() for p in ampfxs],
+           'ampfxs_hashes': ampfxs_hashes})
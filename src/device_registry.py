@@ -0,0 +1,158 @@
+import logging
+from threading import Lock
+from typing import Callable, Optional
+
+from engine import Engine
+
+
+_logger = logging.getLogger(__name__)
+
+MAX_DEVICES = 8
+
+
+class DeviceRegistry:
+    '''Engines of the Valvetronix devices driven by the process,
+    indexed by device number.
+
+    Device 0 is the primary engine, it exists before any device
+    is found and it is the one of the GUI and of NSM.
+    Other engines are created when more devices are found,
+    and kept when their device leaves, to be used by the next one.
+
+    Devices can be linked in named groups, a parameter changed
+    on an engine (from GUI or OSC) is then changed on all the attached
+    devices of its groups, in the MIDI thread.
+
+    Devices are attached and detached from the MIDI thread,
+    engines and groups are read from any thread.'''
+
+    def __init__(self, primary: Engine):
+        self.primary = primary
+        self._engines = [primary]
+        self._attached = set[int]()
+        self._groups = dict[str, set[int]]()
+        self._new_engine_cbs = list[Callable[[int, Engine], None]]()
+        self._groups_changed_cbs = list[Callable[[], None]]()
+        self._lock = Lock()
+
+        primary.set_param_fanout(self._fan_out)
+        primary.set_identity_shared_func(self._identity_shared)
+        primary.set_identity_received_callback(self._identity_received)
+
+    def add_new_engine_callback(self, cb: Callable[[int, Engine], None]):
+        '''cb will be called with the device number and the engine
+        each time an engine is created for a new device.'''
+        self._new_engine_cbs.append(cb)
+
+    def add_groups_changed_callback(self, cb: Callable[[], None]):
+        '''cb will be called each time a group is set or removed,
+        from the thread changing the group.'''
+        self._groups_changed_cbs.append(cb)
+
+    def engine(self, num: int) -> Optional[Engine]:
+        with self._lock:
+            if 0 <= num < len(self._engines):
+                return self._engines[num]
+        return None
+
+    def engines(self) -> list[Engine]:
+        with self._lock:
+            return self._engines.copy()
+
+    def attach(self) -> Optional[int]:
+        '''returns the lowest free device number for a found device,
+        or None if too many devices are attached.'''
+        with self._lock:
+            for num in range(MAX_DEVICES):
+                if num not in self._attached:
+                    break
+            else:
+                _logger.warning(
+                    f'More than {MAX_DEVICES} devices, device ignored')
+                return None
+
+            self._attached.add(num)
+            if num < len(self._engines):
+                return num
+
+            engine = Engine()
+            # devices share the config and the local programs
+            engine.config = self.primary.config
+            engine.share_local_programs(self.primary)
+            engine.set_param_fanout(self._fan_out)
+            engine.set_identity_shared_func(self._identity_shared)
+            engine.set_identity_received_callback(self._identity_received)
+            self._engines.append(engine)
+
+        _logger.info(f'engine created for device {num}')
+        for cb in self._new_engine_cbs:
+            cb(num, engine)
+        return num
+
+    def detach(self, num: int):
+        with self._lock:
+            self._attached.discard(num)
+
+    def _same_identity_engines(self, engine: Engine) -> list[Engine]:
+        '''other attached engines whose device has the identity
+        of the device of engine'''
+        if engine.device_identity is None:
+            return []
+
+        with self._lock:
+            num = self._engines.index(engine)
+            return [self._engines[n] for n in self._attached
+                    if n != num and n < len(self._engines)
+                    and self._engines[n].device_identity
+                        == engine.device_identity]
+
+    def _identity_shared(self, engine: Engine) -> bool:
+        '''True if another attached device has the identity of the
+        device of engine'''
+        return bool(self._same_identity_engines(engine))
+
+    def _identity_received(self, engine: Engine):
+        # other devices with this identity may have restored their
+        # user slots from the cache of this one, they are read again.
+        for other in self._same_identity_engines(engine):
+            other.fetch_unverified_slots()
+
+    def set_group(self, name: str, nums: list[int]):
+        '''link the devices nums, replacing the group name if it exists'''
+        with self._lock:
+            self._groups[name] = set(
+                [n for n in nums if 0 <= n < MAX_DEVICES])
+
+        for cb in self._groups_changed_cbs:
+            cb()
+
+    def remove_group(self, name: str):
+        with self._lock:
+            self._groups.pop(name, None)
+
+        for cb in self._groups_changed_cbs:
+            cb()
+
+    def groups(self) -> dict[str, list[int]]:
+        with self._lock:
+            return {name: sorted(nums) for name, nums in self._groups.items()}
+
+    def _fan_out(self, engine: Engine, changes: list[tuple[int, int, int]]):
+        with self._lock:
+            if not self._groups:
+                return
+
+            num = self._engines.index(engine)
+            linked = set[int]()
+            for nums in self._groups.values():
+                if num in nums:
+                    linked |= nums
+            linked.discard(num)
+
+            engines = [self._engines[n] for n in sorted(linked)
+                       if n in self._attached and n < len(self._engines)]
+
+        # linked devices receive the changes in the same loop, they share
+        # a rate limiter in the MIDI client and get them together.
+        for linked_engine in engines:
+            linked_engine.apply_linked_params(changes)
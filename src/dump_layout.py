@@ -0,0 +1,306 @@
+'''Layout of the program and custom ampfx dumps,
+see TABLE 1, TABLE 2 and NOTE 4 in VTX_Midi_Implementation.txt.
+
+Addresses are the ones of the documentation. In the MIDI message,
+data is sent as groups of 7 bytes, each group preceded by a byte
+containing the most significant bits of the 7 following ones.
+
+Each layout is described once as a table of fields,
+used to read and to write the dump.'''
+
+from enum import Enum
+from typing import TYPE_CHECKING, Any, Optional
+
+from effects import (
+    AmpModel, AmpParam, EffectOnOff, EffectStatus,
+    Pedal1Type, Pedal2Type, ReverbType)
+
+if TYPE_CHECKING:
+    from vox_program import VoxProgram
+
+
+PROGRAM_NAME = 0x00
+NR_SENS = 0x10
+EFFECT_STATUS = 0x11
+AMP_MODEL = 0x12
+PEDAL1_TYPE = 0x1F
+PEDAL1_PARAMS = 0x20
+PEDAL2_TYPE = 0x27
+PEDAL2_PARAMS = 0x28
+REVERB_TYPE = 0x37
+REVERB_PARAMS = 0x38
+
+# data size, without MIDI bytes of most significant bits
+DATA_SIZE = 0x3E
+
+
+def raw_offset(address: int) -> int:
+    '''offset in the MIDI message of the byte at address'''
+    return address // 7 * 8 + 1 + address % 7
+
+def msb_offset(address: int) -> int:
+    '''offset in the MIDI message of the byte containing
+    the most significant bit of the byte at address'''
+    return address // 7 * 8
+
+RAW_SIZE = raw_offset(DATA_SIZE - 1) + 1
+
+# (offset, offset of the most significant bits byte, bit shift)
+# for each address, computed once.
+OFFSETS = tuple([(raw_offset(a), msb_offset(a), a % 7)
+                 for a in range(DATA_SIZE)])
+
+
+class FieldKind(Enum):
+    # string, key is the number of chars, padded with spaces
+    NAME = 0
+
+    # int attribute
+    INT = 1
+
+    # Enum attribute, key is the Enum class
+    ENUM = 2
+
+    # active_effects dict, as EffectStatus flags
+    EFFECT_STATUS = 3
+
+    # value of a dict or list attribute, key is the dict key or list index
+    ITEM = 4
+
+    # same as ITEM, but on 2 bytes, low byte first
+    WORD = 5
+
+
+# address, kind, attribute name, key
+Field = tuple[int, FieldKind, str, Any]
+
+_EFFECT_FLAGS = ((EffectOnOff.PEDAL1, EffectStatus.PEDAL1_ON),
+                 (EffectOnOff.PEDAL2, EffectStatus.PEDAL2_ON),
+                 (EffectOnOff.REVERB, EffectStatus.REVERB_ON))
+
+_NAME = FieldKind.NAME
+_INT = FieldKind.INT
+_ENUM = FieldKind.ENUM
+_ITEM = FieldKind.ITEM
+_WORD = FieldKind.WORD
+
+# fields at the same address in both dumps
+COMMON_FIELDS: tuple[Field, ...] = (
+    (NR_SENS, _INT, 'nr_sens', None),
+    (EFFECT_STATUS, FieldKind.EFFECT_STATUS, 'active_effects', None),
+    (AMP_MODEL, _ENUM, 'amp_model', AmpModel),
+    (0x18, _ITEM, 'amp_params', AmpParam.TONE),
+    (0x19, _ITEM, 'amp_params', AmpParam.RESONANCE),
+    (0x1A, _ITEM, 'amp_params', AmpParam.BRIGHT_CAP),
+    (0x1B, _ITEM, 'amp_params', AmpParam.LOW_CUT),
+    (0x1C, _ITEM, 'amp_params', AmpParam.MID_BOOST),
+    (0x1D, _ITEM, 'amp_params', AmpParam.BIAS_SHIFT),
+    (0x1E, _ITEM, 'amp_params', AmpParam.CLASS),
+    (PEDAL1_TYPE, _ENUM, 'pedal1_type', Pedal1Type),
+    # first value of pedals may exceed 255 (delay time for example)
+    (PEDAL1_PARAMS, _WORD, 'pedal1_values', 0),
+    *[(PEDAL1_PARAMS + i + 1, _ITEM, 'pedal1_values', i)
+      for i in range(1, 6)],
+    (PEDAL2_TYPE, _ENUM, 'pedal2_type', Pedal2Type),
+    (PEDAL2_PARAMS, _WORD, 'pedal2_values', 0),
+    *[(PEDAL2_PARAMS + i + 1, _ITEM, 'pedal2_values', i)
+      for i in range(1, 6)],
+    (REVERB_TYPE, _ENUM, 'reverb_type', ReverbType),
+    *[(REVERB_PARAMS + i, _ITEM, 'reverb_values', i) for i in range(5)])
+
+PROGRAM_FIELDS: tuple[Field, ...] = (
+    (PROGRAM_NAME, _NAME, 'program_name', 16),
+    (0x13, _ITEM, 'amp_params', AmpParam.GAIN),
+    (0x14, _ITEM, 'amp_params', AmpParam.TREBLE),
+    (0x15, _ITEM, 'amp_params', AmpParam.MIDDLE),
+    (0x16, _ITEM, 'amp_params', AmpParam.BASS),
+    (0x17, _ITEM, 'amp_params', AmpParam.VOLUME),
+    *COMMON_FIELDS)
+
+# in ampfx dump, name and GAIN to VOLUME addresses are reserved
+AMPFX_FIELDS = COMMON_FIELDS
+
+
+class DumpLayout:
+    '''Reads and writes a dump from its table of fields.
+
+    At init, the table is compiled into `read` and `write_into`
+    functions, with all offsets resolved, so that a dump is read or
+    written without any loop nor computing of position.
+
+    `read(program, data)` reads data (list, bytes or memoryview)
+    into program.
+    `write_into(program, buf, start=0)` writes program into buf
+    from start, replacing RAW_SIZE bytes, reserved bytes are zeros.
+
+    If slots is given, it contains the index in `program._data`
+    of each (attribute, key) of the fields, key being None for
+    INT and ENUM fields, and the effect for EFFECT_STATUS fields.
+    Values are then read and written directly in this array.'''
+
+    def __init__(self, fields: tuple[Field, ...],
+                 slots: Optional[dict[tuple[str, Any], int]] = None):
+        self.fields = fields
+        self.slots = slots
+
+        # objects needed by the compiled functions
+        self._namespace: dict[str, Any] = {'EffectOnOff': EffectOnOff}
+        self._n_consts = 0
+
+        self.read = self._compile('read', self._read_lines())
+        self.write_into = self._compile('write_into', self._write_lines())
+
+    def _const(self, value: Any) -> str:
+        name = f'_k{self._n_consts}'
+        self._n_consts += 1
+        self._namespace[name] = value
+        return name
+
+    def _compile(self, func_name: str, lines: list[str]):
+        source = '\n'.join(lines)
+        exec(compile(source, f'<dump layout {func_name}>', 'exec'),
+             self._namespace)
+        return self._namespace.pop(func_name)
+
+    def _value_ref(self, attr: str, key: Any, lines: list[str],
+                   bound: set[str]) -> str:
+        '''returns the expression to access the value of a field
+        (or of one effect for EFFECT_STATUS), an int except for
+        ENUM fields without slots.'''
+        if self.slots is not None and (attr, key) in self.slots:
+            if 'data' not in bound:
+                lines.append('    d = program._data')
+                bound.add('data')
+            return f'd[{self.slots[(attr, key)]}]'
+
+        if key is None:
+            return f'program.{attr}'
+
+        # dict or list attribute, got only once from the program
+        if attr not in bound:
+            lines.append(f'    c_{attr} = program.{attr}')
+            bound.add(attr)
+
+        if isinstance(key, Enum):
+            return f'c_{attr}[{self._const(key)}]'
+        return f'c_{attr}[{key}]'
+
+    @staticmethod
+    def _read_expr(address: int) -> str:
+        off, msb, shift = OFFSETS[address]
+        return f'(data[{off}] | (data[{msb}] >> {shift} & 1) << 7)'
+
+    def _read_lines(self) -> list[str]:
+        lines = ['def read(program, data):']
+        bound = set[str]()
+
+        for address, kind, attr, key in self.fields:
+            value = self._read_expr(address)
+
+            if kind is FieldKind.NAME:
+                chars = ', '.join([f'chr({self._read_expr(a)})'
+                                   for a in range(address, address + key)])
+                lines.append(
+                    f'    program.{attr} = "".join(({chars})).strip()')
+
+            elif kind is FieldKind.INT or kind is FieldKind.ITEM:
+                target = self._value_ref(attr, key, lines, bound)
+                lines.append(f'    {target} = {value}')
+
+            elif kind is FieldKind.ENUM:
+                target = self._value_ref(attr, None, lines, bound)
+                if target.startswith('program.'):
+                    lines.append(f'    {target} = {self._const(key)}({value})')
+                else:
+                    # fails like the Enum on a wrong value
+                    values = dict([(m.value, m.value) for m in key])
+                    lines.append(f'    {target} = '
+                                 f'{self._const(values)}[{value}]')
+
+            elif kind is FieldKind.EFFECT_STATUS:
+                lines.append(f'    status = {value}')
+                for effect, flag in _EFFECT_FLAGS:
+                    target = self._value_ref(attr, effect, lines, bound)
+                    lines.append(
+                        f'    {target} = int(bool(status & {flag.value}))')
+
+            elif kind is FieldKind.WORD:
+                target = self._value_ref(attr, key, lines, bound)
+                lines.append(
+                    f'    {target} = '
+                    f'{value} + {self._read_expr(address + 1)} * 256')
+
+        return lines
+
+    def _write_lines(self) -> list[str]:
+        '''Each 8 bits value is computed in a variable,
+        then 7 bits are written at their offset, and each byte
+        of most significant bits is written once.'''
+        lines = ['def write_into(program, buf, start=0):']
+        bound = set[str]()
+
+        # variable name of the value at each address
+        values = dict[int, str]()
+
+        for address, kind, attr, key in self.fields:
+            var = f'v{address}'
+
+            if kind is FieldKind.NAME:
+                lines.append(
+                    f'    name = program.{attr}[:{key}].ljust({key}).encode('
+                    f'"ascii", "replace")')
+                for i in range(key):
+                    values[address + i] = f'name[{i}]'
+
+            elif kind is FieldKind.INT or kind is FieldKind.ITEM:
+                source = self._value_ref(attr, key, lines, bound)
+                lines.append(f'    {var} = {source}')
+                values[address] = var
+
+            elif kind is FieldKind.ENUM:
+                source = self._value_ref(attr, None, lines, bound)
+                if source.startswith('program.'):
+                    source += '.value'
+                lines.append(f'    {var} = {source}')
+                values[address] = var
+
+            elif kind is FieldKind.EFFECT_STATUS:
+                lines.append(f'    {var} = 0')
+                for effect, flag in _EFFECT_FLAGS:
+                    source = self._value_ref(attr, effect, lines, bound)
+                    lines.append(f'    if {source}: {var} |= {flag.value}')
+                values[address] = var
+
+            elif kind is FieldKind.WORD:
+                source = self._value_ref(attr, key, lines, bound)
+                lines.append(f'    v{address + 1}, {var} = divmod('
+                             f'{source}, 256)')
+                values[address] = var
+                values[address + 1] = f'v{address + 1}'
+
+        # expression of each byte of the MIDI data,
+        # all written at once.
+        exprs = ['0'] * RAW_SIZE
+        msb_parts = dict[int, list[str]]()
+
+        for address, var in values.items():
+            off, msb, shift = OFFSETS[address]
+            exprs[off] = f'{var} & 0x7F'
+            msb_parts.setdefault(msb, []).append(
+                f'({var} >> 7 & 1) << {shift}')
+
+        for msb, parts in msb_parts.items():
+            exprs[msb] = ' | '.join(parts)
+
+        lines.append(f'    buf[start:start + {RAW_SIZE}] = (')
+        for expr in exprs:
+            lines.append(f'        {expr},')
+        lines.append('    )')
+
+        return lines
+
+    def write(self, program: 'VoxProgram') -> bytearray:
+        '''returns the MIDI data of program'''
+        buf = bytearray(RAW_SIZE)
+        self.write_into(program, buf)
+        return buf
@@ -1,37 +1,45 @@
-from enum import IntEnum, Enum
+from enum import Enum
+from functools import wraps
 import logging
 from pathlib import Path
 from queue import Queue
 from typing import Any, Callable, Optional
 import json
+import math
 import time
 
 from unidecode import unidecode
 from app_infos import APP_NAME
 
 import xdg
+import device_cache
+import program_diff
+from callback_dispatcher import CallbackDispatcher
 from config import Config
-from midi_enums import MidiConnectState
+from latency_stats import CALLBACKS, QUEUE, LatencyStats
+from midi_enums import FunctionCode, MidiConnectState
 from effects import (
     DummyParam, EffParam, EffectOnOff, Pedal1Type,
     AmpModel, AmpParam, Pedal2Type, ReverbType,
     VoxIndex, VoxMode)
 from vox_program import VoxProgram
+from sysex_handlers import FUNCTION_CODES, PARAM_HANDLERS, SYSEX_HANDLERS
+from request_pipeline import (
+    ERROR_CODES, DeviceRequest, RequestPipeline, response_key)
+from upload_job import UploadJob, UploadSlot
 
 
 _logger = logging.getLogger(__name__)
 
 
 class CommunicationState(Enum):
-    # No message received since at least 100ms, 
-    # despite the fact we were waiting a response
+    # A request got no answer, despite its retries
     LOSED = 0
 
-    # No message sent since last message received
+    # No request waiting for an answer
     OK = 1
     
-    # At least one message send waiting 
-    # for an answer for less than 100ms
+    # At least one request waiting for an answer
     YES_BUT_CHECKING = 2
     
     # Same as YES_BUT_CHECKING, but previous state was LOSED
@@ -58,28 +66,21 @@ class EngineCallback(Enum):
     FACTORY_BANKS_READ = 6
     PROGRAM_NAME_CHANGED = 7
     LOCAL_PROGRAMS_CHANGED = 8
+    SYNC_PROGRESS = 9
+    PARAMS_CHANGED = 10
+    UPLOAD_PROGRESS = 11
+    UPLOAD_FINISHED = 12
 
 
-class FunctionCode(IntEnum):
-    MODE_REQUEST = 0x12
-    CURRENT_PROGRAM_DATA_DUMP_REQUEST = 0x10
-    PROGRAM_DATA_DUMP_REQUEST = 0x1c
-    CUSTOM_AMPFX_DATA_DUMP_REQUEST = 0x31
-    PROGRAM_WRITE_REQUEST = 0x11
-    MODE_DATA = 0x42
-    CURRENT_PROGRAM_DATA_DUMP = 0x40
-    PROGRAM_DATA_DUMP = 0x4c
-    CUSTOM_AMPFX_DATA_DUMP = 0x65
-    MODE_CHANGE = 0x4e
-    PARAMETER_CHANGE = 0x41
-    DATA_FORMAT_ERROR = 0x26
-    DATA_LOAD_COMPLETED = 0x23
-    DATA_LOAD_ERROR = 0x24
-    WRITE_COMPLETED = 0x21
-    WRITE_ERROR = 0x22
-
+# delays between two probes of the device while it does not answer
+PROBE_MIN_DELAY = 0.200
+PROBE_MAX_DELAY = 5.0
 
 SYSEX_BEGIN = [240, 66, 48, 0, 1, 52]
+_SYSEX_BEGIN_BYTES = bytes(SYSEX_BEGIN)
+DEVICE_INQUIRY_REQUEST = [240, 126, 127, 6, 1, 247]
+DEVICE_INQUIRY_REPLY_BEGIN = [240, 126]
+_DEVICE_INQUIRY_REPLY_BEGIN_BYTES = bytes(DEVICE_INQUIRY_REPLY_BEGIN)
 
 
 def rail_int(value: int, mini: int, maxi: int) -> int:
@@ -87,9 +88,12 @@ def rail_int(value: int, mini: int, maxi: int) -> int:
 
 def in_midi_thread():
     def decorator(func: Callable):
+        @wraps(func)
         def wrapper(*args, **kwargs):
             engine: 'Engine' = args[0]
-            engine.event_queue.put((func, args, kwargs))
+            engine.event_queue.put((func, args, kwargs, time.monotonic()))
+            if engine._wakeup_func is not None:
+                engine._wakeup_func()
         return wrapper
     return decorator
 
@@ -103,36 +107,197 @@ class Engine:
         self.programs = [VoxProgram() for i in range(8)]
         self.factory_programs = [VoxProgram() for i in range(60)]
         self.local_programs = dict[str, VoxProgram]()
+
+        # engine owning the local programs and their project path,
+        # and engines sharing the local programs of this one.
+        self._local_owner: 'Engine' = self
+        self._local_sharers = list['Engine']()
         self.current_local_pg_name = ''
 
         # There are 4 user ampfxs in the amp,
         # even if physically, only 3 exists
         self.user_ampfxs = [VoxProgram() for i in range(4)]
         
+        # manufacturer, family, member and version numbers
+        # given by the device inquiry reply
+        self.device_identity: Optional[tuple[int, ...]] = None
+        # time the device inquiry left the output queue,
+        # infinite until it left, 0.0 if no reply is expected.
+        self._identity_asked_time = 0.0
+        self._use_cache = True
+
+        # while communication is not OK, MODE_REQUEST probes are sent
+        # with an increasing delay, the device is read at first answer.
+        # _probe_time is the time of the next probe, 0.0 if not probing.
+        self._probe_time = 0.0
+        self._probe_delay = PROBE_MIN_DELAY
+        self._factory_nums_read = set[int]()
+        
+        # hashes of the raw data of user programs and ampfxs,
+        # saved with them to resync only what is needed at next connection.
+        self.programs_hashes = ['' for i in range(8)]
+        self.ampfxs_hashes = ['' for i in range(4)]
+        
+        # slots restored from the cache, not read from the device yet
+        self._unverified_banks = set[int]()
+        self._unverified_ampfxs = set[int]()
+        self._current_dump_read = False
+        self._user_slots_dirty = False
+
+        # full amp file to write once unverified slots are read
+        self._amp_export: Optional[tuple[Path, bool]] = None
+
         self.voxmode = VoxMode.PRESET
         self.prog_num = 0
         self.communication_state = CommunicationState.LOSED
-        self._send_count = 0
-        self.last_send_time = 0.0
-
-        self._last_sent_message = tuple[FunctionCode, tuple[int]]()
         self._midi_connect_state = MidiConnectState.ABSENT_DEVICE
 
         self._midi_out_func: Optional[Callable] = None
-        self._cbs = set[Callable]() # callbacks (GUI and OSC)
+        self._latency_cb: Optional[Callable[[FunctionCode, float], None]] = None
+        self._overrun_cb: Optional[Callable[[], None]] = None
+        self._param_fanout: Optional[
+            Callable[['Engine', list[tuple[int, int, int]]], None]] = None
+        self._identity_shared: Optional[Callable[['Engine'], bool]] = None
+        self._identity_received_cb: Optional[
+            Callable[['Engine'], None]] = None
+        
+        # response times of the device, time spent by events
+        # in the queue and by callbacks before to be called
+        self.latency_stats = LatencyStats()
+
+        # callbacks (GUI and OSC), called from their own threads
+        self.callbacks = CallbackDispatcher(
+            max_size=256, coalesce_key=self._callback_key,
+            latency_cb=self._callback_latency)
         self._ready_cbs = set[Callable]()
         
         self.event_queue = Queue()
+        
+        # called each time an event is queued,
+        # to wake up the MIDI thread.
+        self._wakeup_func: Optional[Callable[[], None]] = None
+        
+        # table of the requests waiting for an answer from the device
+        self.request_pipeline = RequestPipeline(
+            self._write_vox, window=self.config.request_window)
+        self.request_pipeline.set_progress_callback(self._sync_progress)
+        self.request_pipeline.set_failure_callback(self._request_failed)
+
+        # user banks and ampfxs being written to the device
+        self._upload_job: Optional[UploadJob] = None
+
+    @staticmethod
+    def _param_change_key(args: tuple) -> Optional[tuple[int, int]]:
+        '''returns the (vox_index, param) key of a queued
+        set_param_value call, or None if it can not be coalesced'''
+        if len(args) != 4:
+            return None
+        
+        engine, vox_index, param, value = args
+        if isinstance(vox_index, VoxIndex):
+            vox_index = vox_index.value
+        if isinstance(param, EffParam):
+            param = param.value
+
+        if vox_index == VoxIndex.EFFECT_MODEL.value:
+            # changing an effect model changes the meaning
+            # of the next pedal params.
+            return None
+        return (vox_index, param)
+
+    def process_event_queue(self):
+        '''execute all the events queued for the MIDI thread.
+        Pending set_param_value calls for the same parameter
+        are collapsed into the newest value.'''
+        events = list[Optional[tuple[Callable, tuple, dict, float]]]()
+        while self.event_queue.qsize():
+            events.append(self.event_queue.get())
+        
+        # index in events of the last change of each parameter,
+        # since the last event which is not a parameter change.
+        param_indexes = dict[tuple[int, int], int]()
+        set_param_value = Engine.set_param_value.__wrapped__
+
+        for i in range(len(events)):
+            func, args, kwargs, queued_time = events[i]
+            key = None
+            if func is set_param_value and not kwargs:
+                key = self._param_change_key(args)
+
+            if key is None:
+                param_indexes.clear()
+                continue
+            
+            prev_index = param_indexes.get(key)
+            if prev_index is not None:
+                # newest value takes place of the older one
+                events[prev_index] = events[i]
+                events[i] = None
+            else:
+                param_indexes[key] = i
+        
+        now = time.monotonic()
+        for event in events:
+            if event is None:
+                continue
+            func, args, kwargs, queued_time = event
+            self.latency_stats.record(QUEUE, now - queued_time)
+            func(*args, **kwargs)
 
     @in_midi_thread()
-    def add_callback(self, cb: Callable[[FunctionCode, Any], None]):
-        self._cbs.add(cb)
+    def add_callback(self, cb: Callable[[EngineCallback, Any], None]):
+        self.callbacks.add(cb)
     
     def set_a_ready_cb(self, cb: Callable):
         self._ready_cbs.add(cb)
     
     def set_midi_out_func(self, midi_out_func: Callable):
+        '''midi_out_func is called with the message and an optional
+        callback to call when the message is sent to the device.'''
         self._midi_out_func = midi_out_func
+    
+    def set_wakeup_func(self, wakeup_func: Callable[[], None]):
+        self._wakeup_func = wakeup_func
+
+    def _callback_latency(self, latency: float):
+        self.latency_stats.record(CALLBACKS, latency)
+
+    def set_latency_callback(
+            self, latency_cb: Callable[[FunctionCode, float], None]):
+        '''latency_cb will be called with the function code of each
+        answered request and its response time in seconds.'''
+        self._latency_cb = latency_cb
+
+    def set_overrun_callback(self, overrun_cb: Callable[[], None]):
+        '''overrun_cb will be called each time the device answers
+        with an error, its input buffer may be full.'''
+        self._overrun_cb = overrun_cb
+
+    def set_param_fanout(
+            self, fanout: Callable[['Engine', list[tuple[int, int, int]]],
+                                   None]):
+        '''fanout will be called in the MIDI thread with this engine
+        and the (vox_index, param, value) changes made with
+        set_param_value or set_params, to apply them to linked devices.'''
+        self._param_fanout = fanout
+
+    def set_identity_shared_func(
+            self, identity_shared: Callable[['Engine'], bool]):
+        '''identity_shared returns True if another device driven by the
+        process has the same identity as the device of this engine.
+        The device inquiry gives no serial number, the user slots cache
+        can not tell these devices apart, so it is not used.'''
+        self._identity_shared = identity_shared
+
+    def set_identity_received_callback(
+            self, identity_received_cb: Callable[['Engine'], None]):
+        '''identity_received_cb will be called with this engine
+        once for each device inquiry reply.'''
+        self._identity_received_cb = identity_received_cb
+
+    def _identity_is_shared(self) -> bool:
+        return (self._identity_shared is not None
+                and self._identity_shared(self))
 
     def set_midi_connect_state(self, connect_state: MidiConnectState):
         if (self.communication_state.is_ok()
@@ -146,6 +311,13 @@ class Engine:
         self._midi_connect_state = connect_state
         self._send_cb(EngineCallback.MIDI_CONNECT_STATE, connect_state)
 
+        if connect_state is MidiConnectState.CONNECTED:
+            if not self.communication_state.is_ok():
+                self._start_probing()
+        else:
+            # device can not answer, probes will restart at connection
+            self._probe_time = 0.0
+
     def set_communication_state(self, comm_state: CommunicationState):
         if comm_state.is_ok() is not self.communication_state.is_ok():
             self._send_cb(EngineCallback.COMMUNICATION_STATE,
@@ -154,336 +326,584 @@ class Engine:
         self.communication_state = comm_state
 
         if comm_state is CommunicationState.OK:
-            self._send_count -= 1
-        elif comm_state.is_checking():
-            self._send_count += 1
-            self.last_send_time = time.time()
-
-        if self._send_count == 0:
             for ready_cb in self._ready_cbs:
                 ready_cb()
 
     def _send_vox(self, function_code: FunctionCode, *args: tuple[int]):
-        self._last_sent_message = (function_code, args)
+        self.request_pipeline.send(function_code, *args)
 
+    def _write_vox(self, function_code: FunctionCode, *args: tuple[int],
+                   release_cb: Optional[Callable[[], None]] = None):
+        '''release_cb is called when the message
+        really leaves to the device'''
         if self._midi_out_func is None:
             _logger.warning(
                 "Trying to send midi message while midi port is not ready !")
+            if release_cb is not None:
+                release_cb()
             return
 
         self._midi_out_func(
-            SYSEX_BEGIN + [function_code.value] + list(args) + [247])
+            SYSEX_BEGIN + [function_code.value] + list(args) + [247],
+            release_cb)
 
         if self.communication_state.is_ok():
             self.set_communication_state(CommunicationState.YES_BUT_CHECKING)
         else:
             self.set_communication_state(CommunicationState.NO_BUT_CHECKING)
     
+    @staticmethod
+    def _callback_key(engine_callback: EngineCallback, arg: Any):
+        '''pending callbacks with the same key are replaced
+        by the newest one, listeners read the state when they
+        receive it, so only the last one matters.
+        PARAMS_CHANGED callbacks are never replaced,
+        each one carries its own list of parameters.
+        LOCAL_PROGRAMS_CHANGED is replaced only by the same
+        program name, the one to select.'''
+        if engine_callback in (EngineCallback.DATA_ERROR,
+                               EngineCallback.PARAMS_CHANGED):
+            return None
+        if engine_callback is EngineCallback.PARAM_CHANGED:
+            program, vox_index, param_index = arg
+            return (engine_callback, vox_index, param_index)
+        if engine_callback is EngineCallback.LOCAL_PROGRAMS_CHANGED:
+            return (engine_callback, arg)
+        return engine_callback
+
     def _send_cb(self, engine_callback: EngineCallback, arg=None):
-        for cb in self._cbs:
-            cb(engine_callback, arg)
+        self.callbacks.dispatch(engine_callback, arg)
+    
+    def _sync_progress(self, done: int, total: int):
+        self._send_cb(EngineCallback.SYNC_PROGRESS, (done, total))
+    
+    def _request_failed(self, request: DeviceRequest):
+        # content of a user slot not read is still unknown
+        if (request.function_code is FunctionCode.PROGRAM_DATA_DUMP_REQUEST
+                and request.args[0] == VoxMode.USER.value):
+            self._unverified_banks.add(request.args[1])
+        elif (request.function_code
+                is FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST):
+            self._unverified_ampfxs.add(request.args[1])
+
+        if request.error_code is not None:
+            # device answered, the link works. Refusal is reported
+            # with DATA_ERROR, upload jobs retry their refused slots.
+            return
+
+        # request got no answer despite all retries
+        self.set_communication_state(CommunicationState.LOSED)
+        if self._midi_connect_state is MidiConnectState.CONNECTED:
+            self._start_probing()
+    
+    @in_midi_thread()
+    def start_communication(self, use_cache=True):
+        '''read the device, after a first answer to a probe
+        if the communication is not OK.'''
+        self._use_cache = use_cache
+        if self.communication_state.is_ok():
+            self._start_sync()
+        else:
+            self._start_probing()
+
+    def is_probing(self) -> bool:
+        return bool(self._probe_time)
+
+    def _start_probing(self):
+        if self._probe_time:
+            return
+
+        _logger.info('probing the device')
+
+        # requests of a previous sync would never be answered
+        self._abort_upload()
+        self.request_pipeline.clear()
+        if self._amp_export is not None:
+            _logger.error(
+                f'device lost, full amp {self._amp_export[0]} not saved')
+            self._amp_export = None
+        self._identity_asked_time = 0.0
+        self._probe_delay = PROBE_MIN_DELAY
+        self._send_probe()
+
+    def _send_probe(self):
+        # not sent through the pipeline, probes are never retried
+        self._write_vox(FunctionCode.MODE_REQUEST)
+        self._probe_time = time.time() + self._probe_delay
+        self._probe_delay = min(self._probe_delay * 2, PROBE_MAX_DELAY)
+
+    def _start_sync(self):
+        self._probe_time = 0.0
+        self._factory_nums_read.clear()
+        self._unverified_banks.clear()
+        self._unverified_ampfxs.clear()
+        self._current_dump_read = False
+        
+        self._abort_upload()
+        pipeline = self.request_pipeline
+        pipeline.clear()
+        pipeline.window = self.config.request_window
+
+        pipeline.add(DeviceRequest(FunctionCode.MODE_REQUEST, ()))
+        pipeline.add(DeviceRequest(
+            FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST, ()))
+
+        # user slots and factory presets are requested only once we know
+        # they are not in the cache for this device.
+        self._ask_device_identity()
+        pipeline.start()
     
-    def start_communication(self):
-        self._send_count = 0
-        self._send_vox(FunctionCode.MODE_REQUEST)
+    def _ask_device_identity(self):
+        if self._midi_out_func is None:
+            return
+
+        self.device_identity = None
+        self._identity_asked_time = math.inf
+        self._midi_out_func(DEVICE_INQUIRY_REQUEST,
+                            self._device_inquiry_released)
+
+    def _device_inquiry_released(self):
+        # the timeout starts when the inquiry really leaves,
+        # as for the requests of the pipeline.
+        if self._identity_asked_time:
+            self._identity_asked_time = time.time()
+
+    def _device_identity_received(self, identity: tuple[int, ...]):
+        if not self._identity_asked_time:
+            return
         
-        for bank_n in range(8):
-            self._send_vox(
-                FunctionCode.PROGRAM_DATA_DUMP_REQUEST,
-                VoxMode.USER.value,
-                bank_n)
+        self._identity_asked_time = 0.0
+        self.device_identity = identity
+        if self._identity_received_cb is not None:
+            self._identity_received_cb(self)
+        
+        user_slots = None
+        if (self._use_cache and self.config.lazy_user_sync
+                and not self._identity_is_shared()):
+            user_slots = device_cache.load_user_slots(identity)
 
-        for factobank_n in range(60):
-            self._send_vox(
-                FunctionCode.PROGRAM_DATA_DUMP_REQUEST,
-                VoxMode.PRESET.value,
-                factobank_n)
+        if user_slots is None:
+            self._request_user_slots()
+        else:
+            _logger.info('user banks and ampfxs restored from cache')
+            (self.programs, self.programs_hashes,
+             self.user_ampfxs, self.ampfxs_hashes) = user_slots
+            self._unverified_banks = set(range(len(self.programs)))
+            self._unverified_ampfxs = set(range(len(self.user_ampfxs)))
+            self._send_cb(EngineCallback.USER_BANKS_READ)
+            self._verify_current_user_bank()
+
+        if self._use_cache:
+            programs = device_cache.load_factory(identity)
+            if programs is not None:
+                _logger.info('factory presets loaded from cache')
+                self.factory_programs = programs
+                self._send_cb(EngineCallback.FACTORY_BANKS_READ)
+                return
+        
+        self._request_factory_programs()
+    
+    def _request_user_bank(self, bank_num: int):
+        self.request_pipeline.add(DeviceRequest(
+            FunctionCode.PROGRAM_DATA_DUMP_REQUEST,
+            (VoxMode.USER.value, bank_num)))
+
+    def _request_user_ampfx(self, ampfx_num: int):
+        self.request_pipeline.add(DeviceRequest(
+            FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST, (0, ampfx_num)))
 
-        self._send_vox(FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
+    def _request_user_slots(self):
+        for bank_n in range(8):
+            self._request_user_bank(bank_n)
         
         for user_preset_n in range(4):
-            self._send_vox(
-                FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST, 0, user_preset_n)
+            self._request_user_ampfx(user_preset_n)
+
+        self.request_pipeline.start()
+
+    def _user_slots_requested(self) -> bool:
+        '''True if user banks or ampfxs are still requested to the device'''
+        for request in self.request_pipeline.pending():
+            if (request.function_code
+                    is FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST):
+                return True
+        return self._user_banks_requested()
+
+    def _user_banks_requested(self) -> bool:
+        '''True if user banks are still requested to the device'''
+        for request in self.request_pipeline.pending():
+            if (request.function_code
+                        is FunctionCode.PROGRAM_DATA_DUMP_REQUEST
+                    and request.args[0] == VoxMode.USER.value):
+                return True
+        return False
+
+    def _ensure_user_bank(self, bank_num: int):
+        '''refetch the user bank if it has been restored from the cache
+        and not verified yet. Return True if the bank is refetched.'''
+        if bank_num not in self._unverified_banks:
+            return False
 
-    def receive_sysex(self, args: list[int]):
-        shargs = args
+        self._unverified_banks.discard(bank_num)
+        self._request_user_bank(bank_num)
+        self.request_pipeline.start()
+        return True
+    
+    def _verify_current_user_bank(self):
+        '''The current program dump is always read,
+        if the amp is on a user bank, it is the only user bank we can verify
+        without requesting it.'''
+        if not (self._current_dump_read
+                and self.voxmode is VoxMode.USER
+                and self.prog_num in self._unverified_banks):
+            return
         
-        if len(shargs) < 6:
+        if (device_cache.program_hash(self.current_program)
+                == self.programs_hashes[self.prog_num]):
+            self._unverified_banks.discard(self.prog_num)
+        else:
+            # current program may have been modified without being saved,
+            # but user bank may also have changed.
+            self._ensure_user_bank(self.prog_num)
+    
+    def _user_bank_read(self, bank_num: int):
+        new_hash = device_cache.program_hash(self.programs[bank_num])
+        if new_hash != self.programs_hashes[bank_num]:
+            self.programs_hashes[bank_num] = new_hash
+            self._user_slots_dirty = True
+
+    def _user_ampfx_read(self, ampfx_num: int):
+        new_hash = device_cache.ampfx_hash(self.user_ampfxs[ampfx_num])
+        if new_hash != self.ampfxs_hashes[ampfx_num]:
+            self.ampfxs_hashes[ampfx_num] = new_hash
+            self._user_slots_dirty = True
+    
+    def _request_factory_programs(self):
+        pipeline = self.request_pipeline
+
+        for factobank_n in range(60):
+            pipeline.add(DeviceRequest(
+                FunctionCode.PROGRAM_DATA_DUMP_REQUEST,
+                (VoxMode.PRESET.value, factobank_n)))
+        
+        pipeline.start()
+
+    def _factory_program_read(self, prog_num: int):
+        self._factory_nums_read.add(prog_num)
+        if (len(self._factory_nums_read) == len(self.factory_programs)
+                and self.device_identity is not None):
+            device_cache.save_factory(
+                self.device_identity, self.factory_programs)
+
+    def next_timeout(self) -> Optional[float]:
+        '''returns the time in seconds before check_pending_requests
+        needs to be called, or None if nothing is expected'''
+        deadlines = list[float]()
+        if self._probe_time:
+            deadlines.append(self._probe_time)
+
+        if self._identity_asked_time not in (0.0, math.inf):
+            deadlines.append(
+                self._identity_asked_time + self.request_pipeline.timeout)
+        
+        if (self._amp_export is not None
+                and not self._user_slots_requested()):
+            # full amp file can be written now
+            deadlines.append(time.time())
+
+        pipeline_deadline = self.request_pipeline.next_deadline()
+        if pipeline_deadline is not None:
+            deadlines.append(pipeline_deadline)
+        
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.time(), 0.0)
+
+    def check_pending_requests(self):
+        if self._probe_time and time.time() >= self._probe_time:
+            self._send_probe()
+
+        if (self._identity_asked_time
+                and (time.time() - self._identity_asked_time
+                     > self.request_pipeline.timeout)):
+            _logger.info('device did not reply to device inquiry, '
+                         'cache will not be used')
+            self._identity_asked_time = 0.0
+            self._request_user_slots()
+            self._request_factory_programs()
+
+        self.request_pipeline.check_timeouts()
+
+        if (self._amp_export is not None
+                and not self._user_slots_requested()):
+            filepath, with_ampfxs = self._amp_export
+            self._amp_export = None
+            self._write_full_amp(filepath, with_ampfxs)
+        
+        if (self._user_slots_dirty
+                and self.device_identity is not None
+                and not self.request_pipeline.is_busy()):
+            if not self._identity_is_shared():
+                device_cache.save_user_slots(
+                    self.device_identity,
+                    self.programs, self.programs_hashes,
+                    self.user_ampfxs, self.ampfxs_hashes)
+            self._user_slots_dirty = False
+
+    def receive_sysex(self, args: bytes|list[int]):
+        '''receive one complete sysex message, from F0 to F7'''
+        if len(args) < 7:
             _logger.info('Too short sysex message received')
             return
         
-        header, shargs = shargs[:6], shargs[6:]
+        # message is read at fixed offsets without copy,
+        # shargs starts just after the function code.
+        raw = bytes(args)
+
+        if (raw[:2] == _DEVICE_INQUIRY_REPLY_BEGIN_BYTES
+                and raw[3:5] == b'\x06\x02'):
+            self._device_identity_received(tuple(raw[5:14]))
+            return
         
-        if header != SYSEX_BEGIN:
-            header_str = ', '.join([hex(h)[2:] for h in header])
+        data = memoryview(raw)
+
+        if data[:6] != _SYSEX_BEGIN_BYTES:
+            header_str = ', '.join([hex(h)[2:] for h in raw[:6]])
             _logger.info(
                 'Message received sysex message not coming from valvetronix'
                 f' with header ({header_str})')
             return
 
-        function_code_int = shargs.pop(0)
+        function_code_int = data[6]
+        shargs = data[7:]
 
-        try:
-            function_code = FunctionCode(function_code_int)
-        except:
+        function_code = FUNCTION_CODES.get(function_code_int)
+        if function_code is None:
             _logger.critical(
                 f'Received Unknown function code {hex(function_code_int)}')
             return
         
         _logger.debug(f'message received from device {function_code.name}')
 
-        if function_code in (FunctionCode.DATA_LOAD_ERROR,
-                             FunctionCode.DATA_FORMAT_ERROR):
+        request = None
+        if self.request_pipeline.is_busy():
+            request = self.request_pipeline.response_received(
+                function_code, response_key(function_code, shargs))
+        
+        if request is not None:
+            latency = time.time() - request.sent_time
+            self.latency_stats.record(request.function_code.name, latency)
+            if self._latency_cb is not None and request.attempts == 1:
+                # the answer waits behind the ones to previous requests,
+                # this time does not show a device overrun.
+                # The answer to a resent request can not be measured.
+                self._latency_cb(request.function_code,
+                                 max(latency - request.queue_time, 0.0))
+
+        if function_code in ERROR_CODES:
             _logger.warning(
                 f'error received from device {function_code.name}')
-            orig_func_code = self._last_sent_message[0]
-            _logger.warning(f'last sent message is {orig_func_code.name}')
-            self._send_cb(EngineCallback.DATA_ERROR, orig_func_code)
+            if self._overrun_cb is not None:
+                self._overrun_cb()
+            if request is not None and request.done_cb is None:
+                # an upload job retries and reports its own errors
+                _logger.warning(
+                    f'message in error is {request.function_code.name}')
+                self._send_cb(EngineCallback.DATA_ERROR,
+                              request.function_code)
 
-        self.set_communication_state(CommunicationState.OK)
-        
-        if function_code is FunctionCode.CURRENT_PROGRAM_DATA_DUMP:
-            try:
-                self.current_program.data_read(shargs)
-            except BaseException as e:
-                _logger.error(
-                    f'Failed to read current program data.\n{str(e)}')
-                return
+        if self._probe_time:
+            # device answers, it can be read now
+            _logger.info('device answered, reading it')
+            self._start_sync()
 
-            self._send_cb(EngineCallback.CURRENT_CHANGED, self.current_program)
+        # any message from the device proves the communication works
+        if self.request_pipeline.is_busy():
+            self.set_communication_state(CommunicationState.YES_BUT_CHECKING)
+        else:
+            self.set_communication_state(CommunicationState.OK)
         
-        elif function_code is FunctionCode.PROGRAM_DATA_DUMP:
-            voxmode_int = shargs.pop(0)
-            prog_num = shargs.pop(0)
-            
-            try:
-                vox_mode = VoxMode(voxmode_int)
-            except:
-                _logger.critical(
-                    f'Received {function_code.name} with unknown mode')
-                return
+        handler = SYSEX_HANDLERS.get(function_code_int)
+        if handler is None:
+            return
 
-            try:
-                if vox_mode is VoxMode.USER:
-                    self.programs[prog_num].data_read(shargs)
-                    if prog_num == 7:
-                        self._send_cb(EngineCallback.USER_BANKS_READ)
-                    
-                elif vox_mode is VoxMode.PRESET:
-                    self.factory_programs[prog_num].data_read(shargs)
-                    if prog_num == 59:
-                        self._send_cb(EngineCallback.FACTORY_BANKS_READ)
-
-            except BaseException as e:
-                _logger.error(
-                    f"Failed to write incoming program.\n{str(e)}")
-                return
+        if len(shargs) < handler.min_size:
+            _logger.critical(
+                f"Received too short {function_code.name} message")
+            return
         
-        elif function_code is FunctionCode.PARAMETER_CHANGE:
-            try:
-                vox_index = VoxIndex(shargs.pop(0))
-            except:
-                _logger.critical(
-                    f"Received {function_code.name} with wrong first index")
-                return
+        handler.func(self, shargs)
 
-            if len(shargs) < 3:
-                _logger.critical(
-                    f"Received too short {function_code.name} message")
-                return
+    @SYSEX_HANDLERS.register(FunctionCode.CURRENT_PROGRAM_DATA_DUMP)
+    def _current_dump_received(self, shargs: memoryview):
+        try:
+            self.current_program.data_read(shargs)
+        except BaseException as e:
+            _logger.error(
+                f'Failed to read current program data.\n{str(e)}')
+            return
 
-            param_index = shargs.pop(0)
-            value = shargs.pop(0)
-            big_value = shargs.pop(0)
-
-            if vox_index is VoxIndex.NR_SENS:
-                if param_index == 0:
-                    self.current_program.nr_sens = min(max(value, 0), 100)
-
-            elif vox_index is VoxIndex.EFFECT_STATUS:
-                try:
-                    effect_on_off = EffectOnOff(param_index)
-                    self.current_program.active_effects[effect_on_off] = value
-                except:
-                    _logger.critical(
-                        f"unknown effect in {function_code.name}: "
-                        f"{param_index}")
-                    return
-
-            elif vox_index is VoxIndex.EFFECT_MODEL:
-                try:
-                    effect = EffectOnOff(param_index)
-                except:
-                    _logger.critical(
-                        f"unknown effect in {function_code.name}: "
-                        f"{param_index}")
-                    return
-
-                if effect is EffectOnOff.AMP:
-                    self.current_program.amp_model = AmpModel(value)
-                elif effect is EffectOnOff.PEDAL1:
-                    self.current_program.pedal1_type = Pedal1Type(value)
-                elif effect is EffectOnOff.PEDAL2:
-                    self.current_program.pedal2_type = Pedal2Type(value)
-                elif effect is EffectOnOff.REVERB:
-                    self.current_program.reverb_type = ReverbType(value)
-            
-            elif vox_index is VoxIndex.AMP:
-                try:
-                    amp_param = AmpParam(param_index)
-                except:
-                    _logger.critical(
-                        f"Unknown amp param in {function_code.name}: "
-                        f"{amp_param}")
-                    return
-
-                self.current_program.amp_params[amp_param] = value
-                
-            elif vox_index is VoxIndex.PEDAL1:
-                try:
-                    assert 0 <= param_index <= 5
-                except:
-                    _logger.critical(
-                        'Message received with wrong param_index '
-                        f'{param_index}')
-                    return
-                
-                self.current_program.pedal1_values[param_index] = \
-                    value + big_value * 128
-            
-            elif vox_index is VoxIndex.PEDAL2:
-                try:
-                    assert 0 <= param_index <= 5
-                except:
-                    _logger.critical(
-                        'Message received with wrong param_index '
-                        f'{param_index}')
-                    return
-
-                self.current_program.pedal2_values[param_index] = \
-                    value + big_value * 128
-
-            elif vox_index is VoxIndex.REVERB:
-                try:
-                    assert 0 <= param_index <= 4
-                except:
-                    _logger.critical(
-                        'Message received with wrong param_index '
-                        f'{param_index}')
-                    return
-                
-                self.current_program.reverb_values[param_index] = value
-                    
-            self._send_cb(
-                EngineCallback.PARAM_CHANGED,
-                (self.current_program, vox_index, param_index))
+        self._send_cb(EngineCallback.CURRENT_CHANGED, self.current_program)
+        self._current_dump_read = True
+        self._verify_current_user_bank()
 
-        elif function_code is FunctionCode.MODE_DATA:
-            if len(shargs) < 2:
-                _logger.critical(
-                    f"Received {function_code.name} with too short message")
-                return
-            
-            voxmode_int = shargs.pop(0)
-            self.prog_num = shargs.pop(0)
-            
-            try:
-                self.voxmode = VoxMode(voxmode_int)
-            except:
-                _logger.critical(
-                    f"Received {function_code.name} with unknown mode: "
-                    f"{voxmode_int}")
-                return
+    @SYSEX_HANDLERS.register(FunctionCode.PROGRAM_DATA_DUMP, 2)
+    def _program_dump_received(self, shargs: memoryview):
+        voxmode_int, prog_num = shargs[0], shargs[1]
+        
+        try:
+            vox_mode = VoxMode(voxmode_int)
+        except:
+            _logger.critical(
+                f'Received {FunctionCode.PROGRAM_DATA_DUMP.name} '
+                'with unknown mode')
+            return
+
+        try:
+            if vox_mode is VoxMode.USER:
+                self.programs[prog_num].data_read(shargs[2:])
+                self._user_bank_read(prog_num)
+                if not self._user_banks_requested():
+                    # last bank of a full read, or refetched lazily
+                    self._send_cb(EngineCallback.USER_BANKS_READ)
                 
-            self._send_cb(EngineCallback.MODE_CHANGED, self.voxmode)
+            elif vox_mode is VoxMode.PRESET:
+                self.factory_programs[prog_num].data_read(shargs[2:])
+                self._factory_program_read(prog_num)
+                if prog_num == 59:
+                    self._send_cb(EngineCallback.FACTORY_BANKS_READ)
 
-        elif function_code is FunctionCode.MODE_CHANGE:
-            if len(shargs) < 2:
-                _logger.critical(
-                    f"Received {function_code.name} with too short message")
-                return
+        except BaseException as e:
+            _logger.error(
+                f"Failed to write incoming program.\n{str(e)}")
+            return
 
-            voxmode_int = shargs.pop(0)
-            prog_num = shargs.pop(0)
+    @SYSEX_HANDLERS.register(FunctionCode.PARAMETER_CHANGE, 4)
+    def _parameter_change_received(self, shargs: memoryview):
+        vox_index_int, param_index, value, big_value = \
+            shargs[0], shargs[1], shargs[2], shargs[3]
 
-            try:
-                self.voxmode = VoxMode(voxmode_int)
-            except:
-                _logger.critical(
-                    f"Received {function_code.name} with unknown mode: "
-                    f"{voxmode_int}")
-                return
-            
-            if self.voxmode is VoxMode.USER:
-                try:
-                    assert(0 <= prog_num < len(self.programs))
-                except:
-                    _logger.critical(
-                        f"Received {function_code.name} with wrong "
-                        f"prog num :{prog_num}")
-                    return
-                
-                self.prog_num = prog_num
-                self.current_program = self.programs[self.prog_num].copy()
-                self._send_cb(EngineCallback.CURRENT_CHANGED,
-                              self.current_program)
+        param_handler = PARAM_HANDLERS.get(vox_index_int)
+        if param_handler is None:
+            _logger.critical(
+                f"Received {FunctionCode.PARAMETER_CHANGE.name} "
+                f"with wrong first index {vox_index_int}")
+            return
+        
+        if param_index not in param_handler.param_indexes:
+            _logger.critical(
+                'Message received with wrong param_index '
+                f'{param_index} for {param_handler.vox_index.name}')
+            return
+
+        if not param_handler.func(
+                self.current_program, param_index, value, big_value):
+            return
+
+        self._send_cb(
+            EngineCallback.PARAM_CHANGED,
+            (self.current_program, param_handler.vox_index, param_index))
+
+    @SYSEX_HANDLERS.register(FunctionCode.MODE_DATA, 2)
+    def _mode_data_received(self, shargs: memoryview):
+        voxmode_int, self.prog_num = shargs[0], shargs[1]
+        
+        try:
+            self.voxmode = VoxMode(voxmode_int)
+        except:
+            _logger.critical(
+                f"Received {FunctionCode.MODE_DATA.name} with unknown mode: "
+                f"{voxmode_int}")
+            return
             
-            elif self.voxmode is VoxMode.PRESET:
-                try:
-                    assert(0 <= prog_num < len(self.factory_programs))
-                except:
-                    _logger.critical(
-                        f"Received {function_code.name} with wrong "
-                        f"prog num :{prog_num}")
-                    return
-                
-                self.current_program = \
-                    self.factory_programs[self.prog_num].copy()
-                self._send_cb(EngineCallback.CURRENT_CHANGED,
-                              self.current_program)
+        self._send_cb(EngineCallback.MODE_CHANGED, self.voxmode)
+        self._verify_current_user_bank()
 
-            elif self.voxmode is VoxMode.MANUAL:
-                # reask the VOX for all current values
-                self._send_vox(FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
-                
-            self._send_cb(EngineCallback.MODE_CHANGED, self.voxmode)
+    @SYSEX_HANDLERS.register(FunctionCode.MODE_CHANGE, 2)
+    def _mode_change_received(self, shargs: memoryview):
+        function_code = FunctionCode.MODE_CHANGE
+        voxmode_int, prog_num = shargs[0], shargs[1]
 
-        elif function_code is FunctionCode.CUSTOM_AMPFX_DATA_DUMP:
-            if len(shargs) < 2:
+        try:
+            self.voxmode = VoxMode(voxmode_int)
+        except:
+            _logger.critical(
+                f"Received {function_code.name} with unknown mode: "
+                f"{voxmode_int}")
+            return
+        
+        if self.voxmode is VoxMode.USER:
+            try:
+                assert(0 <= prog_num < len(self.programs))
+            except:
                 _logger.critical(
-                    f"Received {function_code.name} with too short message")
+                    f"Received {function_code.name} with wrong "
+                    f"prog num :{prog_num}")
                 return
             
-            unused = shargs.pop(0)
-            ampfx_num = shargs.pop(0)
-            
+            self.prog_num = prog_num
+            if self._ensure_user_bank(self.prog_num):
+                # bank may be outdated, ask the real current program
+                self._send_vox(
+                    FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
+            self.current_program = self.programs[self.prog_num].copy()
+            self._send_cb(EngineCallback.CURRENT_CHANGED,
+                          self.current_program)
+        
+        elif self.voxmode is VoxMode.PRESET:
             try:
-                assert(0 <= ampfx_num <= 3)
+                assert(0 <= prog_num < len(self.factory_programs))
             except:
                 _logger.critical(
-                        f"Received {function_code.name} with wrong "
-                        f"ampfx num :{ampfx_num}")
+                    f"Received {function_code.name} with wrong "
+                    f"prog num :{prog_num}")
                 return
-                
-            self.user_ampfxs[ampfx_num].ampfx_data_read(shargs)
             
-        elif function_code is FunctionCode.WRITE_COMPLETED:
-            if len(shargs) < 2:
-                _logger.critical(
-                    f"Received {function_code.name} with too short message")
-                return
+            self.current_program = \
+                self.factory_programs[self.prog_num].copy()
+            self._send_cb(EngineCallback.CURRENT_CHANGED,
+                          self.current_program)
+
+        elif self.voxmode is VoxMode.MANUAL:
+            # reask the VOX for all current values
+            self._send_vox(FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
             
-            reserved = shargs.pop(0)
-            bank_num = shargs.pop(0)
+        self._send_cb(EngineCallback.MODE_CHANGED, self.voxmode)
+
+    @SYSEX_HANDLERS.register(FunctionCode.CUSTOM_AMPFX_DATA_DUMP, 2)
+    def _ampfx_dump_received(self, shargs: memoryview):
+        ampfx_num = shargs[1]
+        
+        try:
+            assert(0 <= ampfx_num <= 3)
+        except:
+            _logger.critical(
+                    f"Received {FunctionCode.CUSTOM_AMPFX_DATA_DUMP.name} "
+                    f"with wrong ampfx num :{ampfx_num}")
+            return
             
-            try:
-                assert(0 <= bank_num <= 7)
-            except:
-                _logger.critical(
-                    f"Received {function_code.name} with wrong "
-                    f"bank num :{bank_num}")
-                
-            self.programs[bank_num] = self.current_program.copy()
+        self.user_ampfxs[ampfx_num].ampfx_data_read(shargs[2:])
+        self._user_ampfx_read(ampfx_num)
+        
+    @SYSEX_HANDLERS.register(FunctionCode.WRITE_COMPLETED, 2)
+    def _write_completed_received(self, shargs: memoryview):
+        bank_num = shargs[1]
+        
+        try:
+            assert(0 <= bank_num <= 7)
+        except:
+            _logger.critical(
+                f"Received {FunctionCode.WRITE_COMPLETED.name} with wrong "
+                f"bank num :{bank_num}")
+            return
+            
+        self.programs[bank_num] = self.current_program.copy()
+        self._unverified_banks.discard(bank_num)
+        self._user_bank_read(bank_num)
+
+    @SYSEX_HANDLERS.register(FunctionCode.WRITE_ERROR, 2)
+    def _write_error_received(self, shargs: memoryview):
+        _logger.warning(f'device failed to write user bank {shargs[1]}')
 
     @staticmethod
     def _rail_value(param: EffParam, value: int) -> int:
@@ -500,9 +920,12 @@ class Engine:
             return maxi
         return value
     
-    @in_midi_thread()
-    def set_param_value(
-            self, vox_index: VoxIndex|int, param: EffParam|int, value: int):
+    def _apply_param_value(
+            self, vox_index: VoxIndex|int, param: EffParam|int, value: int
+            ) -> Optional[tuple[VoxIndex, int, int, int]]:
+        '''set the value in the current program, returns
+        the args of the PARAMETER_CHANGE message to send,
+        or None if the change is not valid.'''
         if isinstance(vox_index, int):
             try:
                 vox_index = VoxIndex(vox_index)
@@ -510,10 +933,10 @@ class Engine:
                 _logger.warning(
                     f'set_param_value : vox_index {vox_index}'
                     f' does not exists, operation ignored')
-                return
+                return None
         
-        if VoxIndex is VoxIndex.ERROR:
-            return
+        if vox_index is VoxIndex.ERROR:
+            return None
         
         value_big = 0
         
@@ -526,17 +949,23 @@ class Engine:
                 try: param = EffectOnOff(param)
                 except: return
             
-            if param is EffectOnOff.AMP:
-                self.current_program.amp_model = AmpModel(value)
+            try:
+                if param is EffectOnOff.AMP:
+                    self.current_program.amp_model = AmpModel(value)
 
-            elif param is EffectOnOff.PEDAL1:
-                self.current_program.pedal1_type = Pedal1Type(value)
-            
-            elif param is EffectOnOff.PEDAL2:
-                self.current_program.pedal2_type = Pedal2Type(value)
-            
-            elif param is EffectOnOff.REVERB:
-                self.current_program.reverb_type = ReverbType(value)
+                elif param is EffectOnOff.PEDAL1:
+                    self.current_program.pedal1_type = Pedal1Type(value)
+                
+                elif param is EffectOnOff.PEDAL2:
+                    self.current_program.pedal2_type = Pedal2Type(value)
+                
+                elif param is EffectOnOff.REVERB:
+                    self.current_program.reverb_type = ReverbType(value)
+            except ValueError:
+                _logger.warning(
+                    f'set_param_value : model {value} does not exists '
+                    f'for {param.name}, operation ignored')
+                return None
         
         elif vox_index is VoxIndex.AMP:
             if isinstance(param, int):
@@ -587,10 +1016,64 @@ class Engine:
             value = self._rail_value(param, value)
             self.current_program.reverb_values[param.value] = value
         
+        else:
+            return None
+        
+        return (vox_index, param.value, value, value_big)
+    
+    @in_midi_thread()
+    def set_param_value(
+            self, vox_index: VoxIndex|int, param: EffParam|int, value: int):
+        msg_args = self._apply_param_value(vox_index, param, value)
+        if msg_args is None:
+            return
+
+        vox_index, param_index, value_low, value_big = msg_args
         self._send_vox(FunctionCode.PARAMETER_CHANGE,
-                       vox_index.value, param.value, value, value_big)
+                       vox_index.value, param_index, value_low, value_big)
         self._send_cb(EngineCallback.PARAM_CHANGED, 
-                      (self.current_program, vox_index, param.value))
+                      (self.current_program, vox_index, param_index))
+
+        if self._param_fanout is not None:
+            self._param_fanout(self, [(vox_index.value, param_index, value)])
+    
+    @in_midi_thread()
+    def set_params(
+            self, changes: list[tuple[VoxIndex|int, EffParam|int, int]]):
+        '''set many parameters of the current program at once.
+        
+        All changes are applied in order before anything is sent,
+        then the PARAMETER_CHANGE messages are sent back to back,
+        and listeners receive only one PARAMS_CHANGED callback.
+        Invalid changes are ignored.'''
+        if self.apply_linked_params(changes) and self._param_fanout is not None:
+            self._param_fanout(self, changes)
+
+    def apply_linked_params(
+            self, changes: list[tuple[VoxIndex|int, EffParam|int, int]]
+            ) -> bool:
+        '''same as set_params, but executed immediately, and changes are
+        not fanned out. To call only from the MIDI thread, for changes
+        coming from a linked device. Returns True if a change is valid.'''
+        msgs_args = list[tuple[VoxIndex, int, int, int]]()
+        for vox_index, param, value in changes:
+            msg_args = self._apply_param_value(vox_index, param, value)
+            if msg_args is not None:
+                msgs_args.append(msg_args)
+        
+        if not msgs_args:
+            return False
+        
+        for vox_index, param_index, value, value_big in msgs_args:
+            self._send_vox(FunctionCode.PARAMETER_CHANGE,
+                           vox_index.value, param_index, value, value_big)
+        
+        self._send_cb(
+            EngineCallback.PARAMS_CHANGED,
+            (self.current_program,
+             [(vox_index, param_index)
+              for vox_index, param_index, value, value_big in msgs_args]))
+        return True
     
     @in_midi_thread()
     def set_program_name(self, new_name: str):
@@ -639,6 +1122,8 @@ class Engine:
                 i = 0
             
             self._send_vox(FunctionCode.MODE_CHANGE, vox_mode.value, i)
+            if self._ensure_user_bank(i):
+                self._send_vox(FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
             self.current_program = self.programs[i].copy()
             self.prog_num = i
             self._send_cb(EngineCallback.CURRENT_CHANGED, self.current_program)
@@ -648,6 +1133,8 @@ class Engine:
         bank_num = min(max(bank_num, 0), 7)
         self._send_vox(
             FunctionCode.MODE_CHANGE, VoxMode.USER.value, bank_num)
+        if self._ensure_user_bank(bank_num):
+            self._send_vox(FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST)
         self.current_program = self.programs[bank_num].copy()
         self.prog_num = bank_num
         self._send_cb(EngineCallback.MODE_CHANGED, VoxMode.USER)
@@ -670,6 +1157,8 @@ class Engine:
             bank_num,
             *self.current_program.data_write())
         self.programs[bank_num] = self.current_program.copy()
+        self._unverified_banks.discard(bank_num)
+        self._user_bank_read(bank_num)
 
     @in_midi_thread()
     def upload_current_to_user_ampfx(self, ampfx_num: int):
@@ -680,9 +1169,23 @@ class Engine:
             *self.current_program.ampfx_data_write())
 
         self.user_ampfxs[ampfx_num] = self.current_program.copy()
+        self._unverified_ampfxs.discard(ampfx_num)
+        self._user_ampfx_read(ampfx_num)
         
     # file managing
 
+    def share_local_programs(self, owner: 'Engine'):
+        '''use the local programs of owner, saved in its project path.
+        To call before the engine is used.'''
+        self._local_owner = owner
+        self.local_programs = owner.local_programs
+        owner._local_sharers.append(self)
+
+    def _local_programs_changed(self):
+        owner = self._local_owner
+        for engine in [owner] + owner._local_sharers:
+            engine._send_cb(EngineCallback.LOCAL_PROGRAMS_CHANGED, None)
+
     @in_midi_thread()
     def set_project_path(self, project_path: Path):
         self.project_path = project_path
@@ -710,19 +1213,20 @@ class Engine:
             program.program_name = program_name
             self.local_programs[program_name] = program
         
-        self._send_cb(EngineCallback.LOCAL_PROGRAMS_CHANGED, None)
+        self._local_programs_changed()
 
     @in_midi_thread()
     def save_to_local_program(self, program_name: str):
+        project_path = self._local_owner.project_path
         try:
-            self.project_path.mkdir(exist_ok=True, parents=True)
+            project_path.mkdir(exist_ok=True, parents=True)
         except:
             _logger.warning(
-                f'Failed to create {self.project_path} dir, '
+                f'Failed to create {project_path} dir, '
                 'impossible to save program')
             return
         
-        program_path = self.project_path / f'{program_name}.json'
+        program_path = project_path / f'{program_name}.json'
         try:
             with open(program_path, 'w') as f:
                 json.dump(self.current_program.to_json_dict(), f)
@@ -732,7 +1236,7 @@ class Engine:
             return
         
         self.local_programs[program_name] = self.current_program.copy()
-        self._send_cb(EngineCallback.LOCAL_PROGRAMS_CHANGED, None)
+        self._local_programs_changed()
     
     @in_midi_thread()
     def load_local_program(self, program_name: str):
@@ -743,11 +1247,7 @@ class Engine:
             return
         
         self.current_local_pg_name = program_name
-        self._send_vox(
-            FunctionCode.CURRENT_PROGRAM_DATA_DUMP,
-            *local_pg.data_write())
-        self.current_program = local_pg.copy()
-        self._send_cb(EngineCallback.CURRENT_CHANGED, self.current_program)
+        self._send_program(local_pg)
         self._send_cb(EngineCallback.LOCAL_PROGRAMS_CHANGED, program_name)
     
     def save_current_program_to_disk(self, filepath: Path):
@@ -769,13 +1269,44 @@ class Engine:
         
         self.load_program(program)
     
+    def _send_program(self, program: VoxProgram):
+        '''set program as current program on the device,
+        with parameter changes if they are cheaper than a full dump.'''
+        changes: Optional[list[program_diff.ParamChange]] = None
+        
+        # changes can be computed only if we know the device state
+        if self.communication_state.is_ok() and self._current_dump_read:
+            changes = program_diff.param_changes(
+                self.current_program, program)
+
+        self.current_program = program.copy()
+
+        if changes is None or not program_diff.is_cheaper(changes):
+            self._send_vox(
+                FunctionCode.CURRENT_PROGRAM_DATA_DUMP,
+                *self.current_program.data_write())
+            self._send_cb(
+                EngineCallback.CURRENT_CHANGED, self.current_program)
+            return
+
+        for change in changes:
+            self._send_vox(FunctionCode.PARAMETER_CHANGE,
+                           *program_diff.message_args(change))
+
+        params = [(vox_index, param_index)
+                  for vox_index, param_index, value in changes
+                  if vox_index is not VoxIndex.PROGRAM_NAME]
+        if params:
+            self._send_cb(EngineCallback.PARAMS_CHANGED,
+                          (self.current_program, params))
+
+        if len(params) < len(changes):
+            self._send_cb(EngineCallback.PROGRAM_NAME_CHANGED,
+                          self.current_program.program_name)
+
     @in_midi_thread()
     def load_program(self, program: VoxProgram):
-        self._send_vox(
-            FunctionCode.CURRENT_PROGRAM_DATA_DUMP,
-            *program.data_write())
-        self.current_program = program.copy()
-        self._send_cb(EngineCallback.CURRENT_CHANGED, self.current_program)
+        self._send_program(program)
     
     @in_midi_thread()
     def load_bank(self, in_program: VoxProgram, out_bank_index: int):
@@ -791,6 +1322,8 @@ class Engine:
             *in_program.data_write())
         
         self.programs[out_bank_index] = in_program.copy()
+        self._unverified_banks.discard(out_bank_index)
+        self._user_bank_read(out_bank_index)
     
     @in_midi_thread()
     def load_ampfx(self, in_program: VoxProgram, out_ampfx_index: int):
@@ -805,8 +1338,45 @@ class Engine:
             *in_program.ampfx_data_write())
         
         self.user_ampfxs[out_ampfx_index] = in_program.copy()
+        self._unverified_ampfxs.discard(out_ampfx_index)
+        self._user_ampfx_read(out_ampfx_index)
     
+    @in_midi_thread()
+    def fetch_unverified_slots(self):
+        '''Request all user banks and ampfxs restored from the cache
+        and not read from the device since.'''
+        self._fetch_unverified_slots()
+
+    def _fetch_unverified_slots(self):
+        for bank_num in self._unverified_banks:
+            self._request_user_bank(bank_num)
+        for ampfx_num in self._unverified_ampfxs:
+            self._request_user_ampfx(ampfx_num)
+
+        self._unverified_banks.clear()
+        self._unverified_ampfxs.clear()
+        self.request_pipeline.start()
+
+    @in_midi_thread()
     def save_all_amp(self, filepath: Path, with_ampfxs=True):
+        '''write the user banks and ampfxs in a full amp file.
+        Slots restored from the cache are read from the device first,
+        the file is written once they are read.'''
+        if self._unverified_banks or self._unverified_ampfxs:
+            _logger.info('reading user slots from the device before saving')
+            self._amp_export = (Path(filepath), with_ampfxs)
+            self._fetch_unverified_slots()
+            return
+
+        self._write_full_amp(Path(filepath), with_ampfxs)
+
+    def _write_full_amp(self, filepath: Path, with_ampfxs: bool):
+        if self._unverified_banks or self._unverified_ampfxs:
+            # device did not give some of them
+            _logger.error(
+                f'Some user slots could not be read, {filepath} not saved')
+            return
+
         full_dict = {}
         full_dict['banks'] = [p.to_json_dict() for p in self.programs]
         if with_ampfxs:
@@ -821,54 +1391,122 @@ class Engine:
             _logger.error(f"Failed to save json file {filepath}"
                           f"{str(e)}")
     
-    @in_midi_thread()
-    def load_full_amp(self, filepath: Path, with_ampfxs=True) -> False:
+    def load_full_amp(self, filepath: Path, with_ampfxs=True):
+        '''write the user banks and ampfxs saved in a full amp file.
+        The file is read in the calling thread, if it is not valid
+        nothing is written and UPLOAD_FINISHED is sent
+        with all the slots of the file.'''
         try:
             with open(filepath, 'r') as f:
                 full_dict = json.load(f)
         except BaseException as e:
             _logger.error(
                 f'Failed to load full amp file {filepath}\n{str(e)}')
-            return False
-        
-        if not isinstance(full_dict, dict):
-            return False
-        
-        banks_dict = full_dict.get('banks')
-        if not isinstance(banks_dict, list):
-            return False
+            full_dict = None
+
+        banks_dict, ampfxs_dict = None, None
+        if isinstance(full_dict, dict):
+            banks_dict = full_dict.get('banks')
+            ampfxs_dict = full_dict.get('ampfxs') if with_ampfxs else []
+
+        if not all([isinstance(dicts, list)
+                    and all([isinstance(d, dict) for d in dicts])
+                    for dicts in (banks_dict, ampfxs_dict)]):
+            if full_dict is not None:
+                _logger.error(f'{filepath} is not a full amp file')
+
+            failed = [UploadSlot.bank(n, VoxProgram()).name()
+                      for n in range(8)]
+            if with_ampfxs:
+                failed += [UploadSlot.ampfx(n, VoxProgram()).name()
+                           for n in range(4)]
+            self._full_amp_refused(failed)
+            return
 
-        for bank_num in range(len(banks_dict)):
-            if bank_num > 7:
-                break
-            
-            program = VoxProgram.from_json_dict(banks_dict[bank_num])
-            
-            self._send_vox(
-                FunctionCode.PROGRAM_DATA_DUMP,
-                VoxMode.USER.value,
-                bank_num,
-                *program.data_write())
-            
-            self.programs[bank_num] = program
-            
-        if not with_ampfxs:
-            return True
-        
-        ampfxs_dict = full_dict.get('ampfxs')
-        if not isinstance(ampfxs_dict, list):
-            return False
-        
-        for ampfx_n in range(len(ampfxs_dict)):
-            if ampfx_n > 3:
-                break
-            
-            program = VoxProgram.from_json_dict(ampfxs_dict[ampfx_n])
-            
-            self._send_vox(
-                FunctionCode.CUSTOM_AMPFX_DATA_DUMP,
-                0,
-                ampfx_n,
-                *program.ampfx_data_write())
-            
-            self.user_ampfxs[ampfx_n] = program
+        self.load_user_slots(
+            {n: VoxProgram.from_json_dict(bank)
+             for n, bank in enumerate(banks_dict[:8])},
+            {n: VoxProgram.from_json_dict(ampfx)
+             for n, ampfx in enumerate(ampfxs_dict[:4])})
+
+    @in_midi_thread()
+    def _full_amp_refused(self, failed: list[str]):
+        self._send_cb(EngineCallback.UPLOAD_FINISHED, failed)
+
+    @in_midi_thread()
+    def load_user_slots(self, banks: dict[int, VoxProgram],
+                        ampfxs: dict[int, VoxProgram]):
+        '''write programs to user banks and ampfxs to user ampfxs,
+        dicts keys are the slot numbers. UPLOAD_PROGRESS callbacks
+        are sent while the device acknowledges them, then
+        UPLOAD_FINISHED with the slots it failed to write.'''
+        slots = list[UploadSlot]()
+        for bank_num, program in banks.items():
+            if 0 <= bank_num <= 7:
+                slots.append(UploadSlot.bank(bank_num, program.copy()))
+            else:
+                _logger.error(f'can not load bank to bank {bank_num}')
+
+        for ampfx_num, program in ampfxs.items():
+            if 0 <= ampfx_num <= 3:
+                slots.append(UploadSlot.ampfx(ampfx_num, program.copy()))
+            else:
+                _logger.error(f'can not load ampfx to ampfx {ampfx_num}')
+
+        self._upload(slots)
+
+    def is_uploading(self) -> bool:
+        return self._upload_job is not None
+
+    def _upload(self, slots: list[UploadSlot]):
+        if self._upload_job is not None:
+            self._upload_job.add(slots)
+            return
+
+        job = self._upload_job = UploadJob(self._send_upload_slot, slots)
+        job.set_slot_callback(self._upload_slot_done)
+        job.set_progress_callback(self._upload_progress)
+        job.set_finished_callback(self._upload_finished)
+
+        if self._probe_time:
+            # device does not answer
+            job.abort()
+        else:
+            job.start()
+
+    def _abort_upload(self):
+        if self._upload_job is not None:
+            self._upload_job.abort()
+
+    def _send_upload_slot(self, slot: UploadSlot) -> DeviceRequest:
+        return self.request_pipeline.send(slot.function_code, *slot.args())
+
+    def _upload_slot_done(self, slot: UploadSlot, success: bool):
+        if slot.is_bank():
+            if success:
+                self.programs[slot.index] = slot.program
+                self._unverified_banks.discard(slot.index)
+                self._user_bank_read(slot.index)
+            else:
+                # content of the slot in the device is not known
+                self._unverified_banks.add(slot.index)
+            return
+
+        if success:
+            self.user_ampfxs[slot.index] = slot.program
+            self._unverified_ampfxs.discard(slot.index)
+            self._user_ampfx_read(slot.index)
+        else:
+            self._unverified_ampfxs.add(slot.index)
+
+    def _upload_progress(self, done: int, total: int):
+        self._send_cb(EngineCallback.UPLOAD_PROGRESS, (done, total))
+
+    def _upload_finished(self, failed: list[UploadSlot]):
+        job = self._upload_job
+        self._upload_job = None
+
+        if [s for s in job.slots if s.is_bank()]:
+            self._send_cb(EngineCallback.USER_BANKS_READ)
+        self._send_cb(EngineCallback.UPLOAD_FINISHED,
+                      [slot.name() for slot in failed])
@@ -6,7 +6,7 @@ import json
 from qtpy.QtCore import Slot
 from qtpy.QtWidgets import (
     QDialog, QApplication, QDialogButtonBox,
-    QFileDialog)   
+    QFileDialog, QMessageBox, QProgressBar)   
 from effects import BankName, EffectOnOff
 
 import xdg
@@ -114,6 +114,30 @@ class FullAmpImportDialog(QDialog):
         self.ui.buttonBox.button(QDialogButtonBox.Apply).clicked.connect(
             self._apply_import)
 
+        # shows the upload of a full amp config, slot by slot
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setVisible(False)
+        self.ui.verticalLayout.insertWidget(
+            self.ui.verticalLayout.indexOf(self.ui.buttonBox),
+            self.progress_bar)
+
+    def set_upload_progress(self, done: int, total: int):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.setVisible(True)
+
+    def upload_finished(self, failed: list[str]):
+        self.progress_bar.setVisible(False)
+        self.ui.buttonBox.button(QDialogButtonBox.Apply).setEnabled(True)
+
+        if failed:
+            QMessageBox.warning(
+                self,
+                _translate('amp_import', 'Upload failed'),
+                _translate('amp_import',
+                           'The amp failed to write these slots:\n%s')
+                % ', '.join(failed))
+
     def _set_amp_file_valid(self, valid: bool):
         self.ui.labelInvalidFile.setVisible(not valid)
         self.ui.groupBoxMainAction.setEnabled(valid)
@@ -240,15 +264,22 @@ class FullAmpImportDialog(QDialog):
         if main_index == 0:
             # global import
             
+            banks = dict[int, VoxProgram]()
+            ampfxs = dict[int, VoxProgram]()
+
             if self.ui.checkBoxUserBanks.isChecked():
-                for i in range(8):
-                    self.engine.load_bank(
-                        self._full_amp_conf.programs[i], i)
+                banks = dict(enumerate(self._full_amp_conf.programs))
                     
             if self.ui.checkBoxAmpFx.isChecked():
-                for i in range(4):
-                    self.engine.load_ampfx(
-                        self._full_amp_conf.user_ampfxs[i], i)
+                ampfxs = dict(enumerate(self._full_amp_conf.user_ampfxs))
+
+            if banks or ampfxs:
+                # slots are written one after the other, the main window
+                # shows the progress here until the amp acknowledged them.
+                self.ui.buttonBox.button(
+                    QDialogButtonBox.Apply).setEnabled(False)
+                self.set_upload_progress(0, len(banks) + len(ampfxs))
+                self.engine.load_user_slots(banks, ampfxs)
                     
             if self.ui.checkBoxCurrentProgram.isChecked():
                 self.engine.load_program(
@@ -23,6 +23,7 @@ from effects import (
 from engine import (CommunicationState, FunctionCode, EngineCallback,
                     VoxProgram, Engine)
 from frontend.progress import ParamProgressBar
+from frontend.param_aggregator import ParamAggregator
 from frontend.amp_import_dialog import FullAmpImportDialog
 from frontend.about_dialog import AboutDialog
 
@@ -54,8 +55,14 @@ class MainWindow(QMainWindow):
         self.bank_icon = BankIcon()
 
         self.engine = engine
+        
+        # parameter changes are displayed at a limited rate
+        self.param_aggregator = ParamAggregator(self._apply_param_changed)
         self.engine.add_callback(self.engine_callback)
 
+        # shows the upload progress while it is open
+        self._amp_import_dialog: Optional[FullAmpImportDialog] = None
+
         self.amp_params_widgets = {
             AmpParam.GAIN: self.ui.progressBarGain,
             AmpParam.TREBLE: self.ui.progressBarTreble,
@@ -214,16 +221,12 @@ class MainWindow(QMainWindow):
         self.ui.menuOptions.clear()
         self.ui.menuOptions.addAction(self.ui.actionAutoConnectMidi)
         
-        self.comm_state_timer = QTimer()
-        self.comm_state_timer.setInterval(100)
-        self.comm_state_timer.setSingleShot(True)
-        self.comm_state_timer.timeout.connect(self._comm_timer_timeout)
-        
-        self.connection_timer = QTimer()
-        self.connection_timer.setInterval(200)
-        self.connection_timer.timeout.connect(self._start_communication)
-        self.connection_timer.start()
-        
+        # latency statistics are shown in the communication label tooltip
+        self.latency_timer = QTimer()
+        self.latency_timer.setInterval(1000)
+        self.latency_timer.timeout.connect(self._update_latency_tooltip)
+        self.latency_timer.start()
+
         # for NSM show/hide optional gui
         self._nsm_visible_cb: Optional[Callable[[bool], None]] = None
         self.nsm_show.connect(self.show)
@@ -369,23 +372,73 @@ class MainWindow(QMainWindow):
         
         self.upload_menu.build()
 
-    def engine_callback(self, *args):
-        self.callback_sig.emit(*args)
+    def engine_callback(self, cb: EngineCallback, arg: Any):
+        # called from the engine callback thread
+        if cb is EngineCallback.PARAM_CHANGED:
+            program, vox_index, param_index = arg
+            self.param_aggregator.push(program, [(vox_index, param_index)])
+            return
+        
+        if cb is EngineCallback.PARAMS_CHANGED:
+            self.param_aggregator.push(*arg)
+            return
+
+        self.callback_sig.emit(cb, arg)
+    
+    def _apply_param_changed(
+            self, program: VoxProgram, vox_index: VoxIndex, param_index: int):
+        self.apply_callback(
+            EngineCallback.PARAM_CHANGED, (program, vox_index, param_index))
     
     @Slot(EngineCallback, object)
     def apply_callback(self, cb: EngineCallback, arg: Any):
+        if cb is EngineCallback.CURRENT_CHANGED:
+            # the whole program will be displayed
+            self.param_aggregator.clear()
+        elif cb not in (EngineCallback.PARAM_CHANGED,
+                        EngineCallback.PARAMS_CHANGED):
+            # keep parameter changes before the other events
+            self.param_aggregator.flush()
+        
         if cb is EngineCallback.COMMUNICATION_STATE:
             comm_state: CommunicationState = arg
             self.set_communication_state(comm_state)
-            if comm_state.is_ok():
-                self.comm_state_timer.stop()
-            else:
-                if not self.comm_state_timer.isActive():
-                    self.comm_state_timer.start()
                 
         elif cb is EngineCallback.MIDI_CONNECT_STATE:
             self.set_midi_connect_state(arg)
 
+        elif cb is EngineCallback.SYNC_PROGRESS:
+            done, total = arg
+            if done < total:
+                self.ui.labelConnected.setText(
+                    _translate('main_win', 'Reading device %i/%i')
+                    % (done, total))
+            else:
+                self.set_communication_state(
+                    self.engine.communication_state)
+
+        elif cb is EngineCallback.UPLOAD_PROGRESS:
+            done, total = arg
+            if done < total:
+                self.ui.labelConnected.setText(
+                    _translate('main_win', 'Uploading %i/%i')
+                    % (done, total))
+            if self._amp_import_dialog is not None:
+                self._amp_import_dialog.set_upload_progress(done, total)
+
+        elif cb is EngineCallback.UPLOAD_FINISHED:
+            failed: list[str] = arg
+            self.set_communication_state(self.engine.communication_state)
+            if self._amp_import_dialog is not None:
+                self._amp_import_dialog.upload_finished(failed)
+            elif failed:
+                QMessageBox.warning(
+                    self,
+                    _translate('main_win', 'Upload failed'),
+                    _translate('main_win',
+                               'The amp failed to write these slots:\n%s')
+                    % ', '.join(failed))
+
         elif cb is EngineCallback.DATA_ERROR:
             function_code: FunctionCode = arg
             QMessageBox.critical(
@@ -513,6 +566,13 @@ class MainWindow(QMainWindow):
                     widget.setValue(program.reverb_values[widget.param.value])
                 return
         
+        elif cb is EngineCallback.PARAMS_CHANGED:
+            program, params = arg
+            for vox_index, param_index in params:
+                self.apply_callback(
+                    EngineCallback.PARAM_CHANGED,
+                    (program, vox_index, param_index))
+
         elif cb is EngineCallback.PROGRAM_NAME_CHANGED:
             cursor_pos = -1
             if self.ui.lineEditProgramName.hasFocus():
@@ -633,24 +693,22 @@ class MainWindow(QMainWindow):
             self._fill_pedal2(pedal2_type)
     
     @Slot()
-    def _comm_timer_timeout(self):
-        self.set_communication_state(CommunicationState.LOSED)
-        if not self.connection_timer.isActive():
-            self.connection_timer.start()
-
-    @Slot()
-    def _start_communication(self):
-        if self.engine.communication_state.is_ok():
-            self.connection_timer.stop()
-            self.ui.labelConnected.setText(
-                _translate('main_win', 'Communication OK'))
+    def _update_latency_tooltip(self):
+        stats = self.engine.latency_stats.summary()
+        if not stats:
+            self.ui.labelConnected.setToolTip('')
             return
-        
-        self.engine.start_communication()
-            
+
+        lines = [_translate('main_win', 'Latencies (p50 / p99 / max):')]
+        for key, summary in stats.items():
+            lines.append(
+                f"{key}: {summary['p50']:.1f} / {summary['p99']:.1f} / "
+                f"{summary['max']:.1f} ms ({summary['count']})")
+        self.ui.labelConnected.setToolTip('\n'.join(lines))
+
     @Slot()
     def _refresh_all(self):
-        self.engine.start_communication()
+        self.engine.start_communication(use_cache=False)
             
     @Slot(str)
     def _set_program_name(self, text: str):
@@ -730,7 +788,9 @@ class MainWindow(QMainWindow):
     @Slot()
     def _load_full_amp(self):
         dialog = FullAmpImportDialog(self, self.engine)
+        self._amp_import_dialog = dialog
         dialog.exec()
+        self._amp_import_dialog = None
     
     @Slot()
     def upload_to_user_program(self):
@@ -0,0 +1,80 @@
+from threading import Lock
+import time
+from typing import Callable
+
+from qtpy.QtCore import QObject, QTimer, Signal, Slot
+
+from effects import VoxIndex
+from vox_program import VoxProgram
+
+
+class ParamAggregator(QObject):
+    '''Collects the parameter changes sent by the engine,
+    from any thread, and applies them in the GUI thread
+    at most FPS times per second.
+
+    Only the newest change of each parameter is kept,
+    so a knob sweep on the amp repaints a widget once per frame
+    instead of once per received message.'''
+
+    FPS = 60
+
+    _pending_sig = Signal()
+
+    def __init__(self, apply_func: Callable[[VoxProgram, VoxIndex, int], None]):
+        super().__init__()
+        self._apply_func = apply_func
+        self._lock = Lock()
+        self._pendings = dict[tuple[VoxIndex, int], VoxProgram]()
+        self._last_flush = 0.0
+
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._pending_sig.connect(self._schedule)
+
+    def push(self, program: VoxProgram,
+             params: list[tuple[VoxIndex, int]]):
+        '''thread safe, params are (vox_index, param_index) tuples'''
+        with self._lock:
+            was_empty = not self._pendings
+            for key in params:
+                # newest one takes the place at the end
+                self._pendings.pop(key, None)
+                self._pendings[key] = program
+
+        if was_empty:
+            # QTimer can only be started from the GUI thread
+            self._pending_sig.emit()
+
+    @Slot()
+    def _schedule(self):
+        if self._timer.isActive():
+            return
+
+        # first change after a quiet time is applied at once
+        wait = self._last_flush + 1.0 / self.FPS - time.monotonic()
+        self._timer.start(max(int(wait * 1000), 0))
+
+    @Slot()
+    def flush(self):
+        '''apply now all pending changes, from the GUI thread'''
+        self._timer.stop()
+
+        with self._lock:
+            pendings = self._pendings
+            self._pendings = dict[tuple[VoxIndex, int], VoxProgram]()
+
+        if not pendings:
+            return
+
+        self._last_flush = time.monotonic()
+        for (vox_index, param_index), program in pendings.items():
+            self._apply_func(program, vox_index, param_index)
+
+    def clear(self):
+        '''forget pending changes, from the GUI thread,
+        when the whole program is displayed again'''
+        self._timer.stop()
+        with self._lock:
+            self._pendings.clear()
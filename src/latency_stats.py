@@ -0,0 +1,91 @@
+'''Histograms of the latencies measured by the engine,
+to know if slowness comes from the device, the engine event queue
+or the callbacks (GUI and OSC).
+
+Histograms are log-linear as HDR histograms: values are counted
+in microseconds, with a relative precision of 1 / SUB_BUCKETS,
+so memory does not grow with the number of recorded values.'''
+
+from threading import Lock
+
+
+# histogram keys other than the device function code names.
+QUEUE = 'queue'
+CALLBACKS = 'callbacks'
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+def _bucket_highest(index: int) -> int:
+    '''highest value counted in the bucket at index'''
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    sub = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.count = 0
+        self.max_us = 0
+        self._buckets = dict[int, int]()
+
+    def record(self, seconds: float):
+        value = max(int(seconds * 1_000_000), 0)
+        index = _bucket_index(value)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.max_us = max(self.max_us, value)
+
+    def percentile(self, percent: float) -> float:
+        '''value in seconds under which are percent % of the values'''
+        if not self.count:
+            return 0.0
+
+        needed = max(self.count * percent / 100, 1)
+        total = 0
+        for index in sorted(self._buckets):
+            total += self._buckets[index]
+            if total >= needed:
+                return min(_bucket_highest(index), self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def summary(self) -> dict[str, float]:
+        '''count, p50, p99 and max, times in milliseconds'''
+        return {'count': self.count,
+                'p50': round(self.percentile(50) * 1000, 3),
+                'p99': round(self.percentile(99) * 1000, 3),
+                'max': round(self.max_us / 1000, 3)}
+
+
+class LatencyStats:
+    '''One histogram per key, values are recorded from the MIDI thread
+    and the callback threads, and read from the GUI or OSC thread.'''
+
+    def __init__(self):
+        self._histograms = dict[str, LatencyHistogram]()
+        self._lock = Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {key: histogram.summary()
+                    for key, histogram in self._histograms.items()}
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
@@ -1,11 +1,20 @@
+from functools import partial
 import logging
+import os
+from pathlib import Path
+import select
 import time
+from typing import Callable, Optional
 
 from pyalsa import alsaseq
 from app_infos import APP_NAME
 
-from engine import CommunicationState, Engine
-from midi_enums import MidiConnectState
+from device_registry import DeviceRegistry
+from engine import Engine
+from midi_enums import FunctionCode, MidiConnectState
+from midi_log import INCOMING, OUTGOING, MidiRecorder
+from rate_limiter import OutputRateLimiter
+from sysex_reassembler import SysexReassembler
 
 
 _logger = logging.getLogger(__name__)
@@ -16,69 +25,267 @@ VALVETRONIX_PORT_NAMES = (
     'Valvetronix X Valvetronix X _ C')
 
 
+class _DeviceSlot:
+    '''Engine, MIDI port and output of one device number.
+    The slot is attached to the port of a Valvetronix
+    while it is present.'''
+
+    def __init__(self, num: int, engine: Engine):
+        self.num = num
+        self.engine = engine
+        self.port_id = 0
+        self.midi_connect_state = MidiConnectState.ABSENT_DEVICE
+        self.rate_limiter = OutputRateLimiter()
+
+        # (client_id, port_id) of the Valvetronix, if attached
+        self.vtronix: Optional[tuple[int, int]] = None
+
+    def port_name(self) -> str:
+        if self.num == 0:
+            return 'Valvetronix'
+        return f'Valvetronix {self.num + 1}'
+
+
 class MidiClient:
+    '''One ALSA client for all the devices,
+    each device has its own port in the client.'''
+
     def __init__(self):
-        self._midi_connect_state = MidiConnectState.ABSENT_DEVICE
-        self.engine: Engine = None
+        self.registry: Optional[DeviceRegistry] = None
         self.stopping = False
         self.restart_asked = False
         self.restart_name = ''
 
+        # accept a software device (the emulator for example)
+        self.allow_virtual_device = False
+
         self._midi_drain_pending = False
         self._pending_send = False
-        
+
+        # linked slots must share their rate limiter
+        self._relink_asked = False
+
+        # slots by device number
+        self._slots = dict[int, _DeviceSlot]()
+
+        # sysex being received, for each (client_id, port_id) source
+        self._reassemblers = dict[tuple[int, int], SysexReassembler]()
+
+        # writes all messages exchanged with the devices, if set
+        self._recorder: Optional[MidiRecorder] = None
+
+        # written to wake up the MIDI loop
+        # when an event is queued from another thread
+        self._wakeup_read_fd, self._wakeup_write_fd = os.pipe()
+        os.set_blocking(self._wakeup_read_fd, False)
+        os.set_blocking(self._wakeup_write_fd, False)
+        self._poll = select.poll()
+
         self._seq = None
-        self._port_id = 0
-        self._vtronix_client_id = 0
-        self._vtronix_port_id = 0
-        self.start_client()
 
     def start_client(self):
         self.restart_asked = False
-        
+
         new_name = self.restart_name
         self.restart_name = ''
 
         if not new_name:
             new_name = APP_NAME
 
-        if self._midi_connect_state is not MidiConnectState.ABSENT_DEVICE:
-            self.set_midi_connect_state(MidiConnectState.DISCONNECTED)
+        for slot in self._slots.values():
+            if slot.vtronix is not None:
+                self.registry.detach(slot.num)
+                slot.vtronix = None
+            if slot.midi_connect_state is not MidiConnectState.ABSENT_DEVICE:
+                self.set_midi_connect_state(
+                    slot, MidiConnectState.ABSENT_DEVICE)
 
         del self._seq
         self._seq = alsaseq.Sequencer(clientname=new_name)
 
+        # ports of the old client are lost
+        for slot in self._slots.values():
+            self._create_port(slot)
+
+        primary = self._slots[0]
+        self._seq.connect_ports(
+            (alsaseq.SEQ_CLIENT_SYSTEM, alsaseq.SEQ_PORT_SYSTEM_ANNOUNCE),
+            (self._seq.client_id, primary.port_id))
+
+        self._midi_drain_pending = False
+        self._pending_send = False
+        for limiter in self._limiters():
+            limiter.clear()
+        self._reassemblers.clear()
+
+        self._poll = select.poll()
+        self._poll.register(self._wakeup_read_fd, select.POLLIN)
+        self._seq.registerpoll(self._poll, input=True)
+
+        self.startup_vox_check()
+
+    def set_registry(self, registry: DeviceRegistry):
+        self.registry = registry
+        registry.add_groups_changed_callback(self._groups_changed)
+        self._add_slot(0, registry.primary)
+        self.start_client()
+
+    def _add_slot(self, num: int, engine: Engine) -> _DeviceSlot:
+        slot = _DeviceSlot(num, engine)
+        self._slots[num] = slot
+
+        engine.set_midi_out_func(partial(self.send_to_vox, slot))
+        engine.set_latency_callback(partial(self._response_latency, slot))
+        engine.set_overrun_callback(partial(self._device_error, slot))
+        engine.set_wakeup_func(self.wake_up)
+        engine.set_midi_connect_state(slot.midi_connect_state)
+        self._relink_asked = True
+        return slot
+
+    def _groups_changed(self):
+        # called from any thread
+        self._relink_asked = True
+        self.wake_up()
+
+    def _limiters(self) -> list[OutputRateLimiter]:
+        # linked slots share the same limiter
+        return list(dict.fromkeys(
+            [slot.rate_limiter for slot in self._slots.values()]))
+
+    def _relink_limiters(self):
+        '''Linked slots share one rate limiter, their messages are
+        released in the order of the changes and linked devices
+        can not drift apart when the output is slowed down.'''
+        self._relink_asked = False
+
+        # slots linked directly or through other groups
+        linkeds = list[set[int]]()
+        for nums in ([[num] for num in self._slots]
+                     + list(self.registry.groups().values())):
+            linked = set([num for num in nums if num in self._slots])
+            for other in [o for o in linkeds if o & linked]:
+                linkeds.remove(other)
+                linked |= other
+            if linked:
+                linkeds.append(linked)
+
+        for linked in linkeds:
+            slots = [self._slots[num] for num in sorted(linked)]
+            limiters = list(dict.fromkeys(
+                [slot.rate_limiter for slot in slots]))
+            if (len(limiters) == 1
+                    and [s for s in self._slots.values()
+                         if s.rate_limiter is limiters[0]] == slots):
+                # already shared by these slots only
+                continue
+
+            limiter = OutputRateLimiter(n_devices=len(slots))
+            for old_limiter in limiters:
+                limiter.take_pending(old_limiter)
+            for slot in slots:
+                slot.rate_limiter = limiter
+
+    def _create_port(self, slot: _DeviceSlot):
         port_type = (alsaseq.SEQ_PORT_TYPE_MIDI_GENERIC
                      | alsaseq.SEQ_PORT_TYPE_APPLICATION)
         port_caps = (alsaseq.SEQ_PORT_CAP_WRITE
                      | alsaseq.SEQ_PORT_CAP_SUBS_WRITE
                      | alsaseq.SEQ_PORT_CAP_READ
                      | alsaseq.SEQ_PORT_CAP_SUBS_READ)
-        self._port_id = self._seq.create_simple_port(
-            "Valvetronix", port_type, port_caps)
+        slot.port_id = self._seq.create_simple_port(
+            slot.port_name(), port_type, port_caps)
 
-        self._seq.connect_ports(
-            (alsaseq.SEQ_CLIENT_SYSTEM, alsaseq.SEQ_PORT_SYSTEM_ANNOUNCE),
-            (self._seq.client_id, self._port_id))
+    def set_recorder(self, recorder: Optional[MidiRecorder]):
+        self._recorder = recorder
 
-        self._midi_drain_pending = False
-        self._pending_send = False
-        self.startup_vox_check()
+    def _response_latency(self, slot: _DeviceSlot,
+                          function_code: FunctionCode, latency: float):
+        slot.rate_limiter.report_latency(function_code, latency)
 
-    def set_engine(self, engine: Engine):
-        self.engine = engine
-        self.engine.set_midi_connect_state(self._midi_connect_state)
-        self.engine.set_midi_out_func(self.send_to_vox)
+    def _device_error(self, slot: _DeviceSlot):
+        slot.rate_limiter.report_device_error()
 
     def auto_connect(self) -> bool:
-        if self.engine is not None:
-            return self.engine.config.auto_connect_device
+        if self.registry is not None:
+            return self.registry.primary.config.auto_connect_device
         return True
 
-    def set_midi_connect_state(self, connect_state: MidiConnectState):
-        self._midi_connect_state = connect_state
-        if self.engine is not None:
-            self.engine.set_midi_connect_state(connect_state)
+    def engines(self) -> list[Engine]:
+        return [slot.engine for slot in self._slots.values()]
+
+    def wake_up(self):
+        try:
+            os.write(self._wakeup_write_fd, b'\0')
+        except BlockingIOError:
+            # pipe is full, loop will wake up anyway
+            pass
+
+    def wait(self, timeout: Optional[float]):
+        '''Block until an incoming MIDI event, a wake up or the timeout
+        (in seconds). timeout None means no timeout.'''
+        for limiter in self._limiters():
+            limiter_delay = limiter.next_delay()
+            if limiter_delay is not None:
+                if timeout is None or limiter_delay < timeout:
+                    timeout = limiter_delay
+
+        if self._midi_drain_pending:
+            # retry the drain soon
+            timeout = 0.001 if timeout is None else min(timeout, 0.001)
+
+        poll_timeout = None if timeout is None else int(timeout * 1000) + 1
+
+        for fd, event in self._poll.poll(poll_timeout):
+            if fd == self._wakeup_read_fd:
+                try:
+                    while os.read(self._wakeup_read_fd, 64):
+                        pass
+                except BlockingIOError:
+                    pass
+
+    def set_midi_connect_state(
+            self, slot: _DeviceSlot, connect_state: MidiConnectState):
+        slot.midi_connect_state = connect_state
+        slot.engine.set_midi_connect_state(connect_state)
+
+    def _slot_of(self, vtronix: tuple[int, int]) -> Optional[_DeviceSlot]:
+        for slot in self._slots.values():
+            if slot.vtronix == vtronix:
+                return slot
+        return None
+
+    def _is_vtronix_port(self, client_id: int, port_id: int) -> bool:
+        port_info = self._seq.get_port_info(port_id, client_id)
+        if port_info['name'] not in VALVETRONIX_PORT_NAMES:
+            return False
+
+        if (port_info['type'] & alsaseq.SEQ_PORT_TYPE_APPLICATION
+                and not self.allow_virtual_device):
+            # port is not physical, it is not the Valvetronix
+            _logger.warning(
+                "Did not accept to recognize Valvetronix "
+                "because it is not an hardware port")
+            return False
+        return True
+
+    def _attach_vtronix(self, client_id: int, port_id: int):
+        if self._slot_of((client_id, port_id)) is not None:
+            return
+
+        num = self.registry.attach()
+        if num is None:
+            return
+
+        slot = self._slots.get(num)
+        if slot is None:
+            slot = self._add_slot(num, self.registry.engine(num))
+            self._create_port(slot)
+
+        _logger.info(f'Valvetronix is present as device {num} !')
+        slot.vtronix = (client_id, port_id)
+        self.set_midi_connect_state(slot, MidiConnectState.DISCONNECTED)
+        if self.auto_connect():
+            self.connect_to_vox(slot)
 
     def startup_vox_check(self):
         clients = self._seq.connection_list()
@@ -87,55 +294,40 @@ class MidiClient:
             client_name, client_id, port_list = client
             if client_name != VALVETRONIX_CLIENT_NAME:
                 continue
-            
+
             for port_name, port_id, connection_list in port_list:
                 if port_name not in VALVETRONIX_PORT_NAMES:
                     continue
-                
-                port_info = self._seq.get_port_info(port_id, client_id)
-                if port_info['type'] & alsaseq.SEQ_PORT_TYPE_APPLICATION:
-                    # port is not physical, it is not the Valvetronix
-                    _logger.warning(
-                        "Did not accept to recognize Valvetronix "
-                        "because it is not an hardware port")
-                    continue
-                
-                _logger.info('Valvetronix is present !')
-                
-                self._vtronix_client_id = client_id
-                self._vtronix_port_id = port_id
-                self.set_midi_connect_state(MidiConnectState.DISCONNECTED)
-                if self.auto_connect():
-                    self.connect_to_vox()
-                return
-
-    def connect_to_vox(self):
-        if self._midi_connect_state is MidiConnectState.ABSENT_DEVICE:
+
+                if self._is_vtronix_port(client_id, port_id):
+                    self._attach_vtronix(client_id, port_id)
+
+    def connect_to_vox(self, slot: _DeviceSlot):
+        if slot.midi_connect_state is MidiConnectState.ABSENT_DEVICE:
             _logger.warning("Will not try to connect to device, "
                             "device is absent.")
             return
-        
-        if self._midi_connect_state is MidiConnectState.CONNECTED:
+
+        if slot.midi_connect_state is MidiConnectState.CONNECTED:
             _logger.warning("Will not try to connect to device, "
                             "already connected to device.")
             return
-        
-        if self._midi_connect_state is not MidiConnectState.OUTPUT_ONLY:
+
+        if slot.midi_connect_state is not MidiConnectState.OUTPUT_ONLY:
             try:
                 self._seq.connect_ports(
-                    (self._seq.client_id, self._port_id),
-                    (self._vtronix_client_id, self._vtronix_port_id),
-                    0, 0, 0, 0)
+                    (self._seq.client_id, slot.port_id),
+                    slot.vtronix, 0, 0, 0, 0)
             except BaseException as e:
                 _logger.error(
                     'Failed to connect to Valvetronix Output !\n'
                     f'{str(e)}')
 
-        if self._midi_connect_state is not MidiConnectState.INPUT_ONLY:   
+        if slot.midi_connect_state is not MidiConnectState.INPUT_ONLY:
             try:
                 self._seq.connect_ports(
-                    (self._vtronix_client_id, self._vtronix_port_id),
-                    (self._seq.client_id, self._port_id),
+                    slot.vtronix,
+                    (self._seq.client_id, slot.port_id),
                     0, 0, 0, 0)
             except BaseException as e:
                 _logger.error(
@@ -143,26 +335,46 @@ class MidiClient:
                     f'{str(e)}')
 
     def read_events(self):
-        midi_events = self._seq.receive_events()
+        # read until there is no more pending event,
+        # else remaining events would not wake up the poll.
+        while True:
+            midi_events = self._seq.receive_events()
+            if not midi_events:
+                break
+            self._read_events(midi_events)
+
+    def _read_events(self, midi_events: list):
         for event in midi_events:
             data = event.get_data()
-            
+
             if event.type is alsaseq.SEQ_EVENT_SYSEX:
-                int_list: list[int] = data['ext']
-                if self.engine is not None:
-                    self.engine.receive_sysex(int_list)
+                slot = self._slot_of(event.source)
+                if slot is None:
+                    continue
+
+                # an event may contain a part of a message,
+                # or several messages.
+                reassembler = self._reassemblers.get(event.source)
+                if reassembler is None:
+                    reassembler = SysexReassembler()
+                    self._reassemblers[event.source] = reassembler
+
+                for frame in reassembler.feed(data['ext']):
+                    if self._recorder is not None:
+                        self._recorder.record(INCOMING, frame)
+                    slot.engine.receive_sysex(frame)
 
             elif event.type is alsaseq.SEQ_EVENT_PORT_START:
                 client_id, port_id = data['addr.client'], data['addr.port']
                 try:
                     client_info = self._seq.get_client_info(client_id)
-                    port_info = self._seq.get_port_info(port_id, client_id)
+                    self._seq.get_port_info(port_id, client_id)
                 except:
                     continue
-                
+
                 n_tries = 0
                 client_outed = False
-                
+
                 while client_info['name'] == f'Client-{client_id}':
                     time.sleep(0.010)
                     try:
@@ -170,109 +382,147 @@ class MidiClient:
                     except:
                         client_outed = True
                         break
-                
+
                     n_tries += 1
                     if n_tries >= 5:
                         break
-                
+
                 if (client_outed
                         or client_info['name'] != VALVETRONIX_CLIENT_NAME
-                        or port_info['name'] not in VALVETRONIX_PORT_NAMES
-                        or port_info['type'] & alsaseq.SEQ_PORT_TYPE_APPLICATION):
+                        or not self._is_vtronix_port(client_id, port_id)):
                     continue
 
-                self._vtronix_client_id = client_id
-                self._vtronix_port_id = port_id
-                self.set_midi_connect_state(MidiConnectState.DISCONNECTED)
-
-                if self.auto_connect():
-                    self.connect_to_vox()                   
+                self._attach_vtronix(client_id, port_id)
 
             elif event.type is alsaseq.SEQ_EVENT_PORT_EXIT:
                 client_id, port_id = data['addr.client'], data['addr.port']
-                if ((client_id, port_id)
-                        == (self._vtronix_client_id, self._vtronix_port_id)):
-                    self.set_midi_connect_state(MidiConnectState.ABSENT_DEVICE)
-                    
+                self._reassemblers.pop((client_id, port_id), None)
+
+                slot = self._slot_of((client_id, port_id))
+                if slot is not None:
+                    _logger.info(f'device {slot.num} left')
+                    slot.vtronix = None
+                    self.registry.detach(slot.num)
+                    self.set_midi_connect_state(
+                        slot, MidiConnectState.ABSENT_DEVICE)
+
             elif event.type is alsaseq.SEQ_EVENT_PORT_SUBSCRIBED:
-                if self._midi_connect_state is MidiConnectState.ABSENT_DEVICE:
+                sender = (data['connect.sender.client'],
+                          data['connect.sender.port'])
+                dest = (data['connect.dest.client'],
+                        data['connect.dest.port'])
+
+                slot = self._slot_of(sender)
+                if (slot is not None
+                        and dest == (self._seq.client_id, slot.port_id)):
+                    if slot.midi_connect_state is MidiConnectState.OUTPUT_ONLY:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.CONNECTED)
+                    elif (slot.midi_connect_state
+                            is MidiConnectState.DISCONNECTED):
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.INPUT_ONLY)
                     continue
-                
-                ex_midi_conn_state = self._midi_connect_state
-                  
-                if (data['connect.sender.client'] == self._vtronix_client_id
-                        and data['connect.sender.port'] == self._vtronix_port_id
-                        and data['connect.dest.client'] == self._seq.client_id
-                        and data['connect.dest.port'] == self._port_id):
-
-                    if self._midi_connect_state is MidiConnectState.OUTPUT_ONLY:
-                        self.set_midi_connect_state(MidiConnectState.CONNECTED)
-                    elif self._midi_connect_state is MidiConnectState.DISCONNECTED:
-                        self.set_midi_connect_state(MidiConnectState.INPUT_ONLY)
-
-                elif (data['connect.sender.client'] == self._seq.client_id
-                        and data['connect.sender.port'] == self._port_id
-                        and data['connect.dest.client'] == self._vtronix_client_id
-                        and data['connect.dest.port'] == self._vtronix_port_id):
-
-                    if self._midi_connect_state is MidiConnectState.INPUT_ONLY:
-                        self.set_midi_connect_state(MidiConnectState.CONNECTED)
-                    elif self._midi_connect_state is MidiConnectState.DISCONNECTED:
-                        self.set_midi_connect_state(MidiConnectState.OUTPUT_ONLY)
-                    
-                if (ex_midi_conn_state is not self._midi_connect_state
-                        and self._midi_connect_state
-                        is MidiConnectState.CONNECTED):
-                    # ask to engine to send the announce messages
-                    self.engine.start_communication()
-            
+
+                slot = self._slot_of(dest)
+                if (slot is not None
+                        and sender == (self._seq.client_id, slot.port_id)):
+                    if slot.midi_connect_state is MidiConnectState.INPUT_ONLY:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.CONNECTED)
+                    elif (slot.midi_connect_state
+                            is MidiConnectState.DISCONNECTED):
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.OUTPUT_ONLY)
+
             elif event.type is alsaseq.SEQ_EVENT_PORT_UNSUBSCRIBED:
-                if self._midi_connect_state is MidiConnectState.ABSENT_DEVICE:
+                sender = (data['connect.sender.client'],
+                          data['connect.sender.port'])
+                dest = (data['connect.dest.client'],
+                        data['connect.dest.port'])
+
+                slot = self._slot_of(sender)
+                if (slot is not None
+                        and dest == (self._seq.client_id, slot.port_id)):
+                    if slot.midi_connect_state is MidiConnectState.INPUT_ONLY:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.DISCONNECTED)
+                    elif slot.midi_connect_state is MidiConnectState.CONNECTED:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.OUTPUT_ONLY)
                     continue
-                
-                if (data['connect.sender.client'] == self._vtronix_client_id
-                        and data['connect.sender.port'] == self._vtronix_port_id
-                        and data['connect.dest.client'] == self._seq.client_id
-                        and data['connect.dest.port'] == self._port_id):
-                    if self._midi_connect_state is MidiConnectState.INPUT_ONLY:
-                        self.set_midi_connect_state(MidiConnectState.DISCONNECTED)
-                    elif self._midi_connect_state is MidiConnectState.CONNECTED:
-                        self.set_midi_connect_state(MidiConnectState.OUTPUT_ONLY)
-
-                elif (data['connect.sender.client'] == self._seq.client_id
-                        and data['connect.sender.port'] == self._port_id
-                        and data['connect.dest.client'] == self._vtronix_client_id
-                        and data['connect.dest.port'] == self._vtronix_port_id):
-                    if self._midi_connect_state is MidiConnectState.OUTPUT_ONLY:
-                        self.set_midi_connect_state(MidiConnectState.DISCONNECTED)
-                    elif self._midi_connect_state is MidiConnectState.CONNECTED:
-                        self.set_midi_connect_state(MidiConnectState.INPUT_ONLY)
-
-    def send_to_vox(self, args: list[int]):
-        event = alsaseq.SeqEvent(alsaseq.SEQ_EVENT_SYSEX)
-        event.set_data({'ext': args})
-        event.source = (self._seq.client_id, self._port_id)
-        self._seq.output_event(event)
+
+                slot = self._slot_of(dest)
+                if (slot is not None
+                        and sender == (self._seq.client_id, slot.port_id)):
+                    if slot.midi_connect_state is MidiConnectState.OUTPUT_ONLY:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.DISCONNECTED)
+                    elif slot.midi_connect_state is MidiConnectState.CONNECTED:
+                        self.set_midi_connect_state(
+                            slot, MidiConnectState.INPUT_ONLY)
+
+    def send_to_vox(self, slot: _DeviceSlot, args: list[int],
+                    release_cb: Optional[Callable[[], None]] = None):
+        if self._recorder is not None:
+            self._recorder.record(OUTGOING, args)
+
+        # message will be really sent at next flush,
+        # when the rate limiter allows it.
+        slot.rate_limiter.push(args, release_cb, slot)
+
+    def _output_ready_messages(self):
+        if self._relink_asked:
+            self._relink_limiters()
+
+        readies = [limiter.pop_ready_with_dests()
+                   for limiter in self._limiters()]
+        n_max = max([len(msgs) for msgs in readies])
+        if not n_max:
+            return
+
+        # linked devices share a limiter, their messages come in the order
+        # of the changes. Messages of other limiters are interleaved.
+        for i in range(n_max):
+            for msgs in readies:
+                if i >= len(msgs):
+                    continue
+
+                # sent to the subscribers of the port, the device
+                msg, slot = msgs[i]
+                event = alsaseq.SeqEvent(alsaseq.SEQ_EVENT_SYSEX)
+                event.set_data({'ext': msg})
+                event.source = (self._seq.client_id, slot.port_id)
+                self._seq.output_event(event)
 
         try:
             self._seq.drain_output()
         except:
             self._midi_drain_pending = True
+            self._report_drain_failure()
             _logger.warning('midi pool unnavailable, trying again')
 
         self._pending_send = True
 
-    def flush(self):
-        if not self._pending_send:
-            return
+    def _report_drain_failure(self):
+        for limiter in self._limiters():
+            limiter.report_drain_failure()
 
+    def flush(self):
         if self._midi_drain_pending:
             try:
                 self._seq.drain_output()
-                self._seq._midi_drain_pending = False
+                self._midi_drain_pending = False
             except:
+                self._report_drain_failure()
                 _logger.warning('midi pool unnavailable, trying again')
 
+        if not self._midi_drain_pending:
+            self._output_ready_messages()
+
+        if not self._pending_send:
+            return
+
         self._seq.sync_output_queue()
         self._pending_send = False
 
@@ -280,36 +530,51 @@ class MidiClient:
 midi_client = MidiClient()
 
 
-def init(engine: Engine):
-    midi_client.set_engine(engine)
+def init(registry: DeviceRegistry):
+    midi_client.set_registry(registry)
+
+def allow_virtual_device():
+    '''accept a software device, as the emulator'''
+    midi_client.allow_virtual_device = True
+    midi_client.startup_vox_check()
+
+def record(path: Path):
+    '''write all messages exchanged with the devices in a MIDI log'''
+    try:
+        midi_client.set_recorder(MidiRecorder(path))
+    except BaseException as e:
+        _logger.error(f'Failed to record MIDI messages in {path}\n{str(e)}')
 
 def restart(new_name: str):
     midi_client.restart_asked = True
     midi_client.restart_name = new_name
+    midi_client.wake_up()
 
 def stop_loop():
     midi_client.stopping = True
+    midi_client.wake_up()
 
 def run_loop():
-    if midi_client.engine is None:
-        _logger.error('engine must be set before to run midi main loop')
+    if midi_client.registry is None:
+        _logger.error('registry must be set before to run midi main loop')
         return
 
-    engine = midi_client.engine
-
     while not midi_client.stopping:
-        while engine.event_queue.qsize():
-            func, args, kwargs = engine.event_queue.get()
-            func(*args, **kwargs)
+        engines = midi_client.engines()
 
-        if engine.communication_state.is_checking():
-            if time.time() - engine.last_send_time > 0.100:
-                engine.set_communication_state(CommunicationState.LOSED)
+        for engine in engines:
+            engine.process_event_queue()
+            engine.check_pending_requests()
 
         if midi_client.restart_asked:
             midi_client.start_client()
 
         midi_client.read_events()
         midi_client.flush()
-        time.sleep(0.001)
-        
\ No newline at end of file
+
+        timeouts = [engine.next_timeout() for engine in engines]
+        timeouts = [t for t in timeouts if t is not None]
+        midi_client.wait(min(timeouts) if timeouts else None)
+
+    if midi_client._recorder is not None:
+        midi_client._recorder.close()
@@ -1,4 +1,4 @@
-from enum import Enum
+from enum import Enum, IntEnum
 
 class MidiConnectState(Enum):
     ABSENT_DEVICE = 0
@@ -6,3 +6,22 @@ class MidiConnectState(Enum):
     INPUT_ONLY = 2
     OUTPUT_ONLY = 3
     CONNECTED = 4
+
+
+class FunctionCode(IntEnum):
+    MODE_REQUEST = 0x12
+    CURRENT_PROGRAM_DATA_DUMP_REQUEST = 0x10
+    PROGRAM_DATA_DUMP_REQUEST = 0x1c
+    CUSTOM_AMPFX_DATA_DUMP_REQUEST = 0x31
+    PROGRAM_WRITE_REQUEST = 0x11
+    MODE_DATA = 0x42
+    CURRENT_PROGRAM_DATA_DUMP = 0x40
+    PROGRAM_DATA_DUMP = 0x4c
+    CUSTOM_AMPFX_DATA_DUMP = 0x65
+    MODE_CHANGE = 0x4e
+    PARAMETER_CHANGE = 0x41
+    DATA_FORMAT_ERROR = 0x26
+    DATA_LOAD_COMPLETED = 0x23
+    DATA_LOAD_ERROR = 0x24
+    WRITE_COMPLETED = 0x21
+    WRITE_ERROR = 0x22
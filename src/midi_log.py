@@ -0,0 +1,88 @@
+'''Binary log of the MIDI messages exchanged with the device,
+to replay real sessions without the device.
+
+The file starts with MAGIC, then each message is written as
+its direction (1 byte), its time in nanoseconds since the start
+of the recording (8 bytes), its size (2 bytes) and its bytes,
+integers being little endian.'''
+
+import logging
+from pathlib import Path
+import struct
+from threading import Lock
+import time
+from typing import Iterator, Optional
+
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'OTXMIDI1'
+
+# message received from the device
+INCOMING = 0
+# message sent to the device
+OUTGOING = 1
+
+_ENTRY = struct.Struct('<BQH')
+
+# direction, time in seconds since the start of the recording, message
+LogEntry = tuple[int, float, bytes]
+
+
+class MidiRecorder:
+    '''Writes the messages to a log file, as they are received
+    from or sent to the device.'''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.n_messages = 0
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._start = time.monotonic_ns()
+
+        # messages may be sent from other threads than the MIDI one
+        self._lock = Lock()
+
+    def record(self, direction: int, data: bytes|list[int],
+               timestamp: Optional[float] = None):
+        '''timestamp is the time in seconds since the start
+        of the recording, now if None.'''
+        data = bytes(data)
+        if timestamp is None:
+            time_ns = time.monotonic_ns() - self._start
+        else:
+            time_ns = int(timestamp * 1_000_000_000)
+
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._file.write(_ENTRY.pack(direction, time_ns, len(data)))
+            self._file.write(data)
+            self.n_messages += 1
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                _logger.info(
+                    f'{self.n_messages} MIDI messages recorded in {self.path}')
+
+
+def read_midi_log(path: Path) -> Iterator[LogEntry]:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a MIDI log file')
+
+        while True:
+            header = f.read(_ENTRY.size)
+            if len(header) < _ENTRY.size:
+                # end of file, or recording interrupted
+                return
+
+            direction, time_ns, size = _ENTRY.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return
+
+            yield direction, time_ns / 1_000_000_000, data
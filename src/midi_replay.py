@@ -0,0 +1,69 @@
+import logging
+from pathlib import Path
+import time
+from typing import Callable, Optional
+
+from engine import Engine
+from midi_enums import MidiConnectState
+from midi_log import INCOMING, OUTGOING, read_midi_log
+
+
+_logger = logging.getLogger(__name__)
+
+
+class MidiReplay:
+    '''Replaces the MIDI client, feeding an engine with the messages
+    received from the device in a MIDI log.
+
+    Messages sent by the engine go nowhere, they are only counted,
+    to be compared with the ones sent during the recording.'''
+
+    def __init__(self, path: Path):
+        # log is read before replay, so that reading is not measured
+        self.entries = list(read_midi_log(path))
+        self.n_recorded_received = len(
+            [e for e in self.entries if e[0] == INCOMING])
+        self.n_recorded_sent = len(
+            [e for e in self.entries if e[0] == OUTGOING])
+        self.n_sent = 0
+        self.engine: Optional[Engine] = None
+
+    def set_engine(self, engine: Engine):
+        self.engine = engine
+        self.engine.set_midi_out_func(self._engine_output)
+        self.engine.set_midi_connect_state(MidiConnectState.CONNECTED)
+
+    def _engine_output(self, args: list[int],
+                       release_cb: Optional[Callable[[], None]] = None):
+        if release_cb is not None:
+            release_cb()
+        self.n_sent += 1
+
+    def run(self, speed: Optional[float] = 1.0) -> float:
+        '''replay the received messages, at original speed
+        multiplied by speed, or as fast as possible if speed is None.
+
+        Returns the duration of the replay in seconds.'''
+        if self.engine is None:
+            _logger.error('engine must be set before to replay')
+            return 0.0
+
+        engine = self.engine
+        start = time.monotonic()
+
+        for direction, timestamp, data in self.entries:
+            if direction != INCOMING:
+                continue
+
+            engine.process_event_queue()
+
+            if speed is not None:
+                delay = start + timestamp / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            engine.receive_sysex(data)
+            engine.check_pending_requests()
+
+        engine.process_event_queue()
+        return time.monotonic() - start
@@ -1,9 +1,12 @@
+from functools import partial
 import logging
+from pathlib import Path
 from typing import Callable, Iterator, Optional
 import json
 
-from liblo import Message, Server, Address
+from liblo import Bundle, Message, Server, Address
 
+from device_registry import MAX_DEVICES, DeviceRegistry
 from engine import CommunicationState, Engine, EngineCallback
 from vox_program import VoxProgram
 from app_infos import APP_NAME
@@ -51,13 +54,21 @@ class OscUdpServer(Server):
             
         self.terminate = False
         self.engine: Optional[Engine] = None
+        self.registry: Optional[DeviceRegistry] = None
 
         self._add_m('register', '', self._register)
         self._add_m('unregister', '', self._unregister)
         self._add_m('load_local_program', 's', self._load_local_program)
         self._add_m('save_to_local_program', 's', self._save_to_local_program)
+        self._add_m('load_full_amp', 's', self._load_full_amp)
         self._add_m('current/set_param_value', 'iii', self._set_param_value)
+        self._add_m('current/set_params', None, self._set_params)
         self._add_m('current/program_name', 's', self._set_program_name)
+        self._add_m('stats/latency', '', self._latency_stats)
+
+        # groups concern all devices, there is no device path for them
+        self.add_method(PFX + 'group/set', None, self._set_group)
+        self.add_method(PFX + 'group/remove', 's', self._remove_group)
 
         # set OSC methods with one int argument
         ipaths = set[str]()
@@ -92,16 +103,127 @@ class OscUdpServer(Server):
         for spath in spaths:
             self._add_m(spath, 's', self._set_current_param_str)
         
-        self._registereds = set[Address]()
+        # for each device number, registered addresses
+        # with the path prefix they used to register.
+        self._registereds = dict[int, dict[Address, str]]()
 
-    def json_short(self) -> str:
+    def json_short(self, engine: Optional[Engine] = None) -> str:
         'returns the current program state in a condensed json format string'
+        if engine is None:
+            engine = self.engine
+
         return json.dumps(
-            self.engine.current_program.to_json_dict(),
+            engine.current_program.to_json_dict(),
             separators=(',', ':'))
 
-    def engine_callback(self, cb: EngineCallback, arg):        
-        PFXREG = PFX + 'reg/'
+    def _engine(self, num: int) -> Optional[Engine]:
+        if num == 0:
+            return self.engine
+        if self.registry is None:
+            return None
+        return self.registry.engine(num)
+
+    def _split_path(self, path: str) -> tuple[int, str, str]:
+        '''returns the device number, the path prefix and the
+        path after it, '/oscitronix/device/2/current/amp/gain' gives
+        (2, '/oscitronix/device/2/', 'current/amp/gain').'''
+        short = path[len(PFX):]
+        if not short.startswith('device/'):
+            return 0, PFX, short
+
+        num_str, _, short = short[len('device/'):].partition('/')
+        num = int(num_str)
+        return num, f'{PFX}device/{num}/', short
+
+    def _path_engine(self, path: str) -> Optional[Engine]:
+        engine = self._engine(self._split_path(path)[0])
+        if engine is None:
+            _logger.warning(f'no device for {path}')
+        return engine
+
+    def _param_message(
+            self, program: VoxProgram, vox_index: VoxIndex,
+            param_index: int, dev_pfx=PFX) -> Optional[Message]:
+        '''returns the message to send to registered clients
+        when a parameter of the current program changes'''
+        PCUR = dev_pfx + 'reg/current/'
+        msg = None
+
+        if vox_index is VoxIndex.NR_SENS:
+            msg = Message(PCUR + 'nr_sens', program.nr_sens, 0, 100, '%')
+
+        elif vox_index is VoxIndex.EFFECT_MODEL:
+            param = EffectOnOff(param_index)
+            path = PCUR + param.name.lower() + '/type'
+
+            if param is EffectOnOff.AMP:
+                msg = Message(path, program.amp_model.name)
+                
+            elif param is EffectOnOff.PEDAL1:
+                msg = Message(path, program.pedal1_type.name)
+
+            elif param is EffectOnOff.PEDAL2:
+                msg = Message(path, program.pedal2_type.name)
+            
+            elif param is EffectOnOff.REVERB:
+                msg = Message(path, program.reverb_type.name)
+                
+        elif vox_index is VoxIndex.AMP:
+            amp_param = AmpParam(param_index)
+            msg = Message(
+                f'{PCUR}amp/{amp_param.name.lower()}',
+                program.amp_params[amp_param],
+                *amp_param.range_unit())
+        
+        elif vox_index is VoxIndex.EFFECT_STATUS:
+            param = EffectOnOff(param_index)
+            if param is EffectOnOff.AMP:
+                return None
+
+            msg = Message(PCUR + param.name.lower() + '/active',
+                          program.active_effects[param])
+        
+        elif vox_index in (
+                VoxIndex.PEDAL1, VoxIndex.PEDAL2, VoxIndex.REVERB):
+            if vox_index is VoxIndex.PEDAL1:
+                param = program.pedal1_type.param_type()(param_index)
+                value = program.pedal1_values[param_index]
+            elif vox_index is VoxIndex.PEDAL2:
+                param = program.pedal2_type.param_type()(param_index)
+                value = program.pedal2_values[param_index]
+            else:
+                param = ReverbParam(param_index)
+                value = program.reverb_values[param_index]
+            
+            msg = Message(
+                f'{PCUR}{vox_index.name.lower()}/{param.name.lower()}',
+                value, *param.range_unit())
+
+        return msg
+
+    def engine_callback(self, cb: EngineCallback, arg):
+        self._device_callback(0, cb, arg)
+
+    def _device_callback(self, num: int, cb: EngineCallback, arg):
+        registereds = self._registereds.get(num)
+        if not registereds:
+            return
+
+        engine = self._engine(num)
+        msgs = dict[str, Message|Bundle]()
+
+        for reg, dev_pfx in list(registereds.items()):
+            if dev_pfx not in msgs:
+                msgs[dev_pfx] = self._callback_message(
+                    engine, dev_pfx, cb, arg)
+
+            if msgs[dev_pfx] is not None:
+                self.send(reg, msgs[dev_pfx])
+
+    def _callback_message(
+            self, engine: Engine, dev_pfx: str,
+            cb: EngineCallback, arg) -> Optional[Message|Bundle]:
+        PFXREG = dev_pfx + 'reg/'
         msg = None
         
         if cb is EngineCallback.COMMUNICATION_STATE:
@@ -111,88 +233,55 @@ class OscUdpServer(Server):
 
         elif cb is EngineCallback.CURRENT_CHANGED:
             msg = Message(
-                PFXREG + 'program_changed', self.json_short())
+                PFXREG + 'program_changed', self.json_short(engine))
 
         elif cb is EngineCallback.MODE_CHANGED:
             vox_mode: VoxMode = arg
             msg = Message(PFXREG + 'mode_changed', vox_mode.name)
 
-        elif cb is EngineCallback.PARAM_CHANGED:
-            program, vox_index, param_index = arg
-            program: VoxProgram
-            vox_index: VoxIndex
-            param_index: int
-            
-            PCUR = PFXREG + 'current/'
-            
-            if vox_index is VoxIndex.NR_SENS:
-                msg = Message(PCUR + 'nr_sens', program.nr_sens, 0, 100, '%')
+        elif cb is EngineCallback.SYNC_PROGRESS:
+            done, total = arg
+            msg = Message(PFXREG + 'sync_progress', done, total)
 
-            elif vox_index is VoxIndex.EFFECT_MODEL:
-                param = EffectOnOff(param_index)
-                path = PCUR + param.name.lower() + '/type'
+        elif cb is EngineCallback.UPLOAD_PROGRESS:
+            done, total = arg
+            msg = Message(PFXREG + 'upload_progress', done, total)
 
-                if param is EffectOnOff.AMP:
-                    msg = Message(path, program.amp_model.name)
-                    
-                elif param is EffectOnOff.PEDAL1:
-                    msg = Message(path, program.pedal1_type.name)
+        elif cb is EngineCallback.UPLOAD_FINISHED:
+            failed: list[str] = arg
+            msg = Message(PFXREG + 'upload_finished', *failed)
 
-                elif param is EffectOnOff.PEDAL2:
-                    msg = Message(path, program.pedal2_type.name)
-                
-                elif param is EffectOnOff.REVERB:
-                    msg = Message(path, program.reverb_type.name)
-                    
-            elif vox_index is VoxIndex.AMP:
-                amp_param = AmpParam(param_index)
-                msg = Message(
-                    f'{PCUR}amp/{amp_param.name.lower()}',
-                    program.amp_params[amp_param],
-                    *amp_param.range_unit())
-            
-            elif vox_index is VoxIndex.EFFECT_STATUS:
-                param = EffectOnOff(param_index)
-                if param is EffectOnOff.AMP:
-                    return
+        elif cb is EngineCallback.PARAM_CHANGED:
+            msg = self._param_message(*arg, dev_pfx)
 
-                msg = Message(PCUR + param.name.lower() + '/active',
-                              program.active_effects[param])
-            
-            elif vox_index in (
-                    VoxIndex.PEDAL1, VoxIndex.PEDAL2, VoxIndex.REVERB):
-                if vox_index is VoxIndex.PEDAL1:
-                    param = program.pedal1_type.param_type()(param_index)
-                    value = program.pedal1_values[param_index]
-                elif vox_index is VoxIndex.PEDAL2:
-                    param = program.pedal2_type.param_type()(param_index)
-                    value = program.pedal2_values[param_index]
-                else:
-                    param = ReverbParam(param_index)
-                    value = program.reverb_values[param_index]
-                
-                msg = Message(
-                    f'{PCUR}{vox_index.name.lower()}/{param.name.lower()}',
-                    value, *param.range_unit())
+        elif cb is EngineCallback.PARAMS_CHANGED:
+            program, params = arg
+            msgs = [self._param_message(
+                        program, vox_index, param_index, dev_pfx)
+                    for vox_index, param_index in params]
+            msgs = [m for m in msgs if m is not None]
+            if msgs:
+                # all changes arrive at the same time to the clients
+                msg = Bundle(*msgs)
 
-        if msg is None:
-            return
-        
-        for reg in self._registereds:
-            self.send(reg, msg)
+        return msg
 
     def _set_current_param_int(
             self, path: str, args: list[int], types: str, src_addr: Address):
-        # here path startswith '/oscitronix/current/'
+        # here path is '/oscitronix/current/...'
+        # or '/oscitronix/device/N/current/...'
         _logger.debug(f'_set_current_param_int {path}, {args[0]}')
-        assert path.startswith('/oscitronix/current/')
+        engine = self._path_engine(path)
+        if engine is None:
+            return
 
         vox_index: Optional[VoxIndex] = None
         param: Optional[EffParam] = None
         value = args[0]
 
-        start_cut = len(PFX) + len('current/')
-        pathcur = path[start_cut:]
+        short = self._split_path(path)[2]
+        assert short.startswith('current/')
+        pathcur = short[len('current/'):]
 
         if pathcur == 'nr_sens':
             vox_index = VoxIndex.NR_SENS
@@ -250,7 +339,7 @@ class OscUdpServer(Server):
             
         elif vox_index is VoxIndex.PEDAL1:
             try:
-                param = self.engine.current_program.pedal1_type.param_type()[
+                param = engine.current_program.pedal1_type.param_type()[
                     param_name.upper()]
             except:
                 _logger.debug(f'incorrect OSC path: {path}')
@@ -258,7 +347,7 @@ class OscUdpServer(Server):
             
         elif vox_index is VoxIndex.PEDAL2:
             try:
-                param = self.engine.current_program.pedal2_type.param_type()[
+                param = engine.current_program.pedal2_type.param_type()[
                     param_name.upper()]
             except:
                 _logger.debug(f'incorrect OSC path: {path}')
@@ -275,15 +364,18 @@ class OscUdpServer(Server):
             _logger.debug(f'incorrect OSC path: {path}')
             return
 
-        self.engine.set_param_value(vox_index, param, value)
+        engine.set_param_value(vox_index, param, value)
 
     def _set_current_param_str(
             self, path: str, args: list[str], types: str, src_addr: Address):
         _logger.debug(f'_set_current_param_str {path}, {args[0]}')
-        assert path.startswith('/oscitronix/current/')
-        
-        start_cut = len(PFX) + len('current/')
-        pathcur = path[start_cut:]
+        engine = self._path_engine(path)
+        if engine is None:
+            return
+
+        short = self._split_path(path)[2]
+        assert short.startswith('current/')
+        pathcur = short[len('current/'):]
         
         vox_index: Optional[VoxIndex] = None
         param: Optional[EffParam] = None
@@ -309,43 +401,116 @@ class OscUdpServer(Server):
         if vox_index is None or param is None:
             return
                 
-        self.engine.set_param_value(vox_index, param, value)
+        engine.set_param_value(vox_index, param, value)
 
     def set_engine(self, engine: Engine):
+        '''set the engine of the device 0'''
         self.engine = engine
         self.engine.add_callback(self.engine_callback)
 
+    def set_device_registry(self, registry: DeviceRegistry):
+        '''make the other devices addressable with
+        '/oscitronix/device/N/' paths'''
+        self.registry = registry
+        for num, engine in enumerate(registry.engines()):
+            if num:
+                self._new_engine(num, engine)
+        registry.add_new_engine_callback(self._new_engine)
+
+    def _new_engine(self, num: int, engine: Engine):
+        engine.add_callback(partial(self._device_callback, num))
+
     def _add_m(self, path: str, type_spec: str, func: Callable):
         self.add_method(PFX + path, type_spec, func)
+        for num in range(MAX_DEVICES):
+            self.add_method(f'{PFX}device/{num}/{path}', type_spec, func)
     
     def _register(self, path: str, args: list, types: str, src_addr: Address):
-        self._registereds.add(src_addr)
+        num, dev_pfx, short = self._split_path(path)
+        engine = self._path_engine(path)
+        if engine is None:
+            return
 
-        cur_prog = self.engine.current_program
-        prog_str = json.dumps(cur_prog.to_json_dict(), separators=(',', ':'))
-        
-        self.send(src_addr, PFX + 'current/get_json', prog_str)
+        self._registereds.setdefault(num, {})[src_addr] = dev_pfx
+        self.send(src_addr, dev_pfx + 'current/get_json',
+                  self.json_short(engine))
         
     def _unregister(self, path: str, args: list, types: str, src_addr: Address):
-        if src_addr in self._registereds:
-            self._registereds.remove(src_addr)
+        num = self._split_path(path)[0]
+        self._registereds.get(num, {}).pop(src_addr, None)
 
     def _load_local_program(
             self, path: str, args: list[str], types: str, src_addr: Address):
-        self.engine.load_local_program(args[0])
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.load_local_program(args[0])
 
     def _save_to_local_program(
             self, path: str, args: list[str], types: str, src_addr: Address):
-        self.engine.save_to_local_program(args[0])
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.save_to_local_program(args[0])
+
+    def _load_full_amp(
+            self, path: str, args: list[str], types: str, src_addr: Address):
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.load_full_amp(Path(args[0]))
 
     def _set_param_value(
             self, path: str, args: list[int], types: str, src_addr: Address):
-        self.engine.set_param_value(*args)
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.set_param_value(*args)
+
+    def _set_params(
+            self, path: str, args: list, types: str, src_addr: Address):
+        # args are (vox_index, param, value) int triplets
+        if not types or len(types) % 3 or set(types) != {'i'}:
+            _logger.warning(
+                f'{path} needs a list of int triplets, received {types}')
+            return
+
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.set_params(
+                [tuple(args[i:i+3]) for i in range(0, len(args), 3)])
 
     def _set_program_name(
             self, path: str, args: list[str], types: str, src_addr: Address):
-        self.engine.set_program_name(args[0])
+        engine = self._path_engine(path)
+        if engine is not None:
+            engine.set_program_name(args[0])
+
+    def _latency_stats(
+            self, path: str, args: list, types: str, src_addr: Address):
+        num, dev_pfx, short = self._split_path(path)
+        engine = self._path_engine(path)
+        if engine is None:
+            return
+
+        self.send(src_addr, dev_pfx + 'stats/latency',
+                  json.dumps(engine.latency_stats.summary(),
+                             separators=(',', ':')))
         
+    def _set_group(
+            self, path: str, args: list, types: str, src_addr: Address):
+        # args are the group name and the device numbers
+        if (not types or types[0] != 's'
+                or (len(types) > 1 and set(types[1:]) != {'i'})):
+            _logger.warning(
+                f'{path} needs a name and device numbers, received {types}')
+            return
+
+        if self.registry is None:
+            return
+        self.registry.set_group(args[0], args[1:])
+
+    def _remove_group(
+            self, path: str, args: list[str], types: str, src_addr: Address):
+        if self.registry is not None:
+            self.registry.remove_group(args[0])
+
     def run_loop(self):
         while not self.terminate:
             self.recv(50)
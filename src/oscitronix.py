@@ -6,6 +6,7 @@ import sys
 import threading
 from ctypes import cdll, byref, create_string_buffer
 from pathlib import Path
+from typing import Optional
 
 from qtpy.QtWidgets import QApplication, QStyleFactory
 from qtpy.QtGui import QIcon
@@ -16,6 +17,7 @@ import midi_client
 import nsm_osci
 import osc
 from app_infos import APP_NAME, CONFIG_FILE, LOCAL_PROGRAMS_DIRNAME
+from device_registry import DeviceRegistry
 from engine import Engine
 from frontend.main_window import MainWindow
 
@@ -46,10 +48,12 @@ def set_proc_name(new_name: str):
 def signal_handler(sig, frame):
     QApplication.quit()
 
-def read_args(*args: str) -> tuple[int, int]:
+def read_args(*args: str) -> tuple[int, int, Optional[Path], bool]:
     reading = ''
     osc_port = 0
     logging_level = logging.WARNING
+    record_path: Optional[Path] = None
+    virtual_device = False
     
     for arg in args:
         if reading == 'osc_port':
@@ -67,23 +71,37 @@ def read_args(*args: str) -> tuple[int, int]:
             except:
                 sys.stderr.write(f'Invalid log level : {arg}\n')
         
+        elif reading == 'record_midi':
+            record_path = Path(arg)
+        
+        reading = ''
+        
         if arg == '--osc-port':
             reading = 'osc_port'
         elif arg == '--log':
             reading = 'log'
+        elif arg == '--record-midi':
+            reading = 'record_midi'
+        elif arg == '--virtual-device':
+            virtual_device = True
         elif arg == '--help':
             sys.stdout.write(
                 f'{APP_NAME.lower()} help\n'
                 '    --osc-port  PORT   set port number for OSC\n'
                 '    --log       LEVEL  log level can be '
                         'DEBUG, INFO, WARNING, ERROR, CRITICAL\n'
+                '    --record-midi FILE write MIDI messages '
+                        'exchanged with the device in FILE\n'
+                '    --virtual-device   accept a software device, '
+                        'as src/vox_emulator.py\n'
                 '    --help             print this help\n')
             sys.exit(0)
 
-    return osc_port, logging_level
+    return osc_port, logging_level, record_path, virtual_device
 
 def main():
-    osc_port, logging_level = read_args(*sys.argv[1:])
+    osc_port, logging_level, record_path, virtual_device = \
+        read_args(*sys.argv[1:])
     logging.basicConfig(level=logging_level)
     set_proc_name(APP_NAME.lower())
     set_proc_name(45)
@@ -112,7 +130,9 @@ def main():
     
     settings = QSettings()
 
+    # engine of the first device, the one of the GUI
     engine = Engine()
+    registry = DeviceRegistry(engine)
     main_win = MainWindow(engine)
 
     config_path = xdg.xdg_config_home() / APP_NAME / CONFIG_FILE
@@ -124,7 +144,17 @@ def main():
     timer.start(200)
     timer.timeout.connect(lambda: None)
 
-    midi_client.init(engine)
+    if not nsm_osci.is_under_nsm():
+        # other devices engines share the config and the local programs
+        engine.config.load_from_file(config_path)
+        engine.set_project_path(
+            xdg.xdg_data_home() / APP_NAME / LOCAL_PROGRAMS_DIRNAME)
+
+    midi_client.init(registry)
+    if record_path is not None:
+        midi_client.record(record_path)
+    if virtual_device:
+        midi_client.allow_virtual_device()
     
     midi_thread = threading.Thread(target=midi_client.run_loop)
     midi_thread.start()
@@ -134,6 +164,7 @@ def main():
 
         nsm_osci.init(osc_port)
         nsm_osci.set_engine(engine)
+        nsm_osci.nsm_object.nsm_server.set_device_registry(registry)
         nsm_osci.set_main_win(main_win)
 
         nsm_thread = threading.Thread(target=nsm_osci.run_loop)
@@ -142,12 +173,9 @@ def main():
         _liblo_servers.append(nsm_osci.nsm_object.nsm_server)
 
     else:
-        engine.config.load_from_file(config_path)
-        engine.set_project_path(
-            xdg.xdg_data_home() / APP_NAME / LOCAL_PROGRAMS_DIRNAME)
-
         osc_server = osc.OscUdpServer(osc_port)
         osc_server.set_engine(engine)
+        osc_server.set_device_registry(registry)
         osc_thread = threading.Thread(target=osc_server.run_loop)
         osc_thread.start()
         _liblo_servers.append(osc_server)
@@ -157,6 +185,8 @@ def main():
     app.exec()
 
     midi_client.stop_loop()
+    for device_engine in registry.engines():
+        device_engine.callbacks.stop()
 
     if nsm_osci.is_under_nsm():
         nsm_osci.stop_loop()
@@ -0,0 +1,89 @@
+'''Parameter changes needed to turn the current program of the device
+into another one, sent instead of a full dump when they are cheaper.'''
+
+from dump_layout import RAW_SIZE
+from effects import AmpParam, EffectOnOff, VoxIndex
+from vox_program import VoxProgram
+
+
+# sizes in bytes of the sysex messages, header and end included
+PARAMETER_CHANGE_SIZE = 6 + 1 + 4 + 1
+CURRENT_DUMP_SIZE = 6 + 1 + RAW_SIZE + 1
+
+NAME_LENGTH = 16
+
+# vox index, param index, value
+ParamChange = tuple[VoxIndex, int, int]
+
+
+def _name_ints(name: str) -> list[int]:
+    return [ord(c) % 128 for c in name[:NAME_LENGTH].ljust(NAME_LENGTH)]
+
+def param_changes(old: VoxProgram, new: VoxProgram) -> list[ParamChange]:
+    '''returns the changes to send to get new from old, in sending order.
+
+    Effect models are changed first, and as the device may reset
+    the values of an effect when its model changes, all the values
+    of an effect are sent after a change of its model.'''
+    changes = list[ParamChange]()
+
+    old_name, new_name = _name_ints(old.program_name), \
+        _name_ints(new.program_name)
+    for i in range(NAME_LENGTH):
+        if old_name[i] != new_name[i]:
+            changes.append((VoxIndex.PROGRAM_NAME, i, new_name[i]))
+
+    if old.nr_sens != new.nr_sens:
+        changes.append((VoxIndex.NR_SENS, 0, new.nr_sens))
+
+    for effect in (EffectOnOff.PEDAL1, EffectOnOff.PEDAL2,
+                   EffectOnOff.REVERB):
+        if old.active_effects[effect] != new.active_effects[effect]:
+            changes.append((VoxIndex.EFFECT_STATUS, effect.value,
+                            new.active_effects[effect]))
+
+    amp_model_changed = old.amp_model is not new.amp_model
+    pedal1_changed = old.pedal1_type is not new.pedal1_type
+    pedal2_changed = old.pedal2_type is not new.pedal2_type
+    reverb_changed = old.reverb_type is not new.reverb_type
+
+    for changed, effect, model in (
+            (amp_model_changed, EffectOnOff.AMP, new.amp_model),
+            (pedal1_changed, EffectOnOff.PEDAL1, new.pedal1_type),
+            (pedal2_changed, EffectOnOff.PEDAL2, new.pedal2_type),
+            (reverb_changed, EffectOnOff.REVERB, new.reverb_type)):
+        if changed:
+            changes.append(
+                (VoxIndex.EFFECT_MODEL, effect.value, model.value))
+
+    for amp_param in AmpParam:
+        if (amp_model_changed
+                or old.amp_params[amp_param] != new.amp_params[amp_param]):
+            changes.append((VoxIndex.AMP, amp_param.value,
+                            new.amp_params[amp_param]))
+
+    for changed, vox_index, old_values, new_values in (
+            (pedal1_changed, VoxIndex.PEDAL1,
+             old.pedal1_values, new.pedal1_values),
+            (pedal2_changed, VoxIndex.PEDAL2,
+             old.pedal2_values, new.pedal2_values),
+            (reverb_changed, VoxIndex.REVERB,
+             old.reverb_values, new.reverb_values)):
+        old_values, new_values = old_values.copy(), new_values.copy()
+        for i in range(len(new_values)):
+            if changed or old_values[i] != new_values[i]:
+                changes.append((vox_index, i, new_values[i]))
+
+    return changes
+
+def message_args(change: ParamChange) -> tuple[int, int, int, int]:
+    '''returns the args of the PARAMETER_CHANGE message for change'''
+    vox_index, param_index, value = change
+    value_big = 0
+    if vox_index in (VoxIndex.PEDAL1, VoxIndex.PEDAL2) and param_index == 0:
+        value_big, value = divmod(value, 128)
+    return (vox_index.value, param_index, value, value_big)
+
+def is_cheaper(changes: list[ParamChange]) -> bool:
+    '''True if changes cost less bytes than a full program dump'''
+    return len(changes) * PARAMETER_CHANGE_SIZE < CURRENT_DUMP_SIZE
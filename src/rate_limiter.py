@@ -0,0 +1,222 @@
+from collections import deque
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from midi_enums import FunctionCode
+
+
+_logger = logging.getLogger(__name__)
+
+# messages sent when the user moves something,
+# all others are considered as bulk transfers (dumps and dump requests).
+INTERACTIVE_CODES = frozenset((
+    FunctionCode.PARAMETER_CHANGE.value,
+    FunctionCode.MODE_CHANGE.value,
+    FunctionCode.MODE_REQUEST.value,
+    FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST.value))
+
+
+class TokenBucket:
+    '''Budget of `rate` bytes per second,
+    with a possible burst of `burst` bytes.'''
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._last_time = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.tokens + (now - self._last_time) * self.rate, self.burst)
+        self._last_time = now
+
+    def consume(self, n_bytes: int, now: float) -> bool:
+        self._refill(now)
+
+        # a message bigger than the burst is accepted with a full bucket
+        if self.tokens >= min(n_bytes, self.burst):
+            self.tokens -= n_bytes
+            return True
+        return False
+
+    def delay_for(self, n_bytes: int, now: float) -> float:
+        self._refill(now)
+        missing = min(n_bytes, self.burst) - self.tokens
+        if missing <= 0.0:
+            return 0.0
+        return missing / self.rate
+
+
+class OutputRateLimiter:
+    '''Holds the sysex messages to send to the device and releases them
+    at a rate the device can follow.
+
+    Interactive messages and bulk messages have their own budgets,
+    interactive ones are always released first.
+    Both rates are scaled by a factor tuned from drain failures,
+    device errors and response latency (additive increase, multiplicative decrease).
+
+    A limiter can be shared by `n_devices` linked devices, messages
+    then carry their destination and are released in the order
+    they were pushed. The interactive budget grows with the number
+    of devices, a change is sent to all of them together.'''
+
+    MIN_FACTOR = 0.05
+    MAX_FACTOR = 4.0
+
+    # troubles closer than this period are considered as the same one
+    TROUBLE_PERIOD = 0.100
+
+    # period without trouble after which the rate grows
+    INCREASE_PERIOD = 1.0
+    INCREASE_STEP = 0.1
+
+    # latency above LATENCY_RATIO * best latency seen is
+    # considered as the sign of a device overrun
+    LATENCY_RATIO = 4.0
+    LATENCY_MIN = 0.020
+
+    def __init__(self, interactive_rate=3000.0, interactive_burst=256,
+                 bulk_rate=3000.0, bulk_burst=512, n_devices=1):
+        interactive_rate *= n_devices
+        interactive_burst *= n_devices
+        self.interactive_rate = interactive_rate
+        self.bulk_rate = bulk_rate
+        self.factor = 1.0
+
+        self._interactive = TokenBucket(interactive_rate, interactive_burst)
+        self._bulk = TokenBucket(bulk_rate, bulk_burst)
+
+        # pending messages, with the callback to call at their release
+        # and their destination
+        self._interactive_msgs = deque[
+            tuple[list[int], Optional[Callable[[], None]], Any]]()
+        self._bulk_msgs = deque[
+            tuple[list[int], Optional[Callable[[], None]], Any]]()
+
+        # best latency seen for each function code, answers to big
+        # messages take longer than answers to small ones.
+        self._best_latencies = dict[FunctionCode, float]()
+        self._last_trouble = 0.0
+        self._last_increase = time.monotonic()
+
+    @staticmethod
+    def is_interactive(msg: list[int]) -> bool:
+        return len(msg) > 6 and msg[6] in INTERACTIVE_CODES
+
+    def push(self, msg: list[int],
+             release_cb: Optional[Callable[[], None]] = None,
+             dest: Any = None):
+        '''queue msg, release_cb will be called when msg is released,
+        so the time it waits here is not counted as device latency.'''
+        if self.is_interactive(msg):
+            self._interactive_msgs.append((msg, release_cb, dest))
+        else:
+            self._bulk_msgs.append((msg, release_cb, dest))
+
+    def has_pending(self) -> bool:
+        return bool(self._interactive_msgs or self._bulk_msgs)
+
+    def clear(self):
+        # dropped messages are considered as sent,
+        # their requests will time out.
+        for msgs in (self._interactive_msgs, self._bulk_msgs):
+            for msg, release_cb, dest in msgs:
+                if release_cb is not None:
+                    release_cb()
+            msgs.clear()
+
+    def take_pending(self, other: 'OutputRateLimiter'):
+        '''move the pending messages of other to this limiter,
+        the lowest rate factor of both is kept.'''
+        self._interactive_msgs.extend(other._interactive_msgs)
+        self._bulk_msgs.extend(other._bulk_msgs)
+        other._interactive_msgs.clear()
+        other._bulk_msgs.clear()
+
+        if other.factor < self.factor:
+            self._set_factor(other.factor)
+
+    def pop_ready(self) -> list[list[int]]:
+        '''returns the messages that can be sent now, in sending order'''
+        return [msg for msg, dest in self.pop_ready_with_dests()]
+
+    def pop_ready_with_dests(self) -> list[tuple[list[int], Any]]:
+        '''returns the messages that can be sent now with their
+        destination, in sending order'''
+        now = time.monotonic()
+        ready = list[tuple[list[int], Any]]()
+
+        for msgs, bucket in ((self._interactive_msgs, self._interactive),
+                             (self._bulk_msgs, self._bulk)):
+            while msgs and bucket.consume(len(msgs[0][0]), now):
+                msg, release_cb, dest = msgs.popleft()
+                if release_cb is not None:
+                    release_cb()
+                ready.append((msg, dest))
+
+        if ready:
+            self._try_increase(now)
+        return ready
+
+    def next_delay(self) -> Optional[float]:
+        '''returns the time before the next message could be released,
+        or None if there is no pending message'''
+        now = time.monotonic()
+        delays = list[float]()
+        if self._interactive_msgs:
+            delays.append(self._interactive.delay_for(
+                len(self._interactive_msgs[0][0]), now))
+        if self._bulk_msgs:
+            delays.append(self._bulk.delay_for(
+                len(self._bulk_msgs[0][0]), now))
+
+        if not delays:
+            return None
+        return min(delays)
+
+    def _set_factor(self, factor: float):
+        self.factor = min(max(factor, self.MIN_FACTOR), self.MAX_FACTOR)
+        self._interactive.rate = self.interactive_rate * self.factor
+        self._bulk.rate = self.bulk_rate * self.factor
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_trouble < self.TROUBLE_PERIOD:
+            return
+
+        self._last_trouble = now
+        self._last_increase = now
+        self._set_factor(self.factor * 0.5)
+        _logger.info(f'MIDI output rate decreased, factor {self.factor:.2f}')
+
+    def _try_increase(self, now: float):
+        if (now - self._last_trouble < self.INCREASE_PERIOD
+                or now - self._last_increase < self.INCREASE_PERIOD
+                or self.factor >= self.MAX_FACTOR):
+            return
+
+        self._last_increase = now
+        self._set_factor(self.factor + self.INCREASE_STEP)
+
+    def report_drain_failure(self):
+        self._decrease()
+
+    def report_device_error(self):
+        self._decrease()
+
+    def report_latency(self, function_code: FunctionCode, latency: float):
+        '''latency is the time between the release of a message
+        and the answer of the device'''
+        best_latency = self._best_latencies.get(function_code)
+        if best_latency is None or latency < best_latency:
+            self._best_latencies[function_code] = latency
+            return
+
+        if (latency > self.LATENCY_MIN
+                and latency > best_latency * self.LATENCY_RATIO
+                and time.monotonic() - self._last_trouble
+                    > self.INCREASE_PERIOD):
+            self._decrease()
@@ -0,0 +1,385 @@
+from collections import deque
+from functools import partial
+import logging
+import math
+import time
+from typing import Callable, Optional
+
+from dump_layout import RAW_SIZE
+from midi_enums import FunctionCode
+
+
+_logger = logging.getLogger(__name__)
+
+# responses the device can send instead of the expected one.
+ERROR_CODES = (FunctionCode.DATA_LOAD_ERROR, FunctionCode.DATA_FORMAT_ERROR)
+
+# answers expected by the requests the device can refuse with
+# DATA_LOAD_ERROR, data sent to it and requests of dumps.
+_LOAD_ERROR_ANSWERS = (
+    FunctionCode.DATA_LOAD_COMPLETED,
+    FunctionCode.CURRENT_PROGRAM_DATA_DUMP,
+    FunctionCode.PROGRAM_DATA_DUMP,
+    FunctionCode.CUSTOM_AMPFX_DATA_DUMP)
+
+# bytes per second on a MIDI cable
+MIDI_BYTE_RATE = 3125.0
+
+# size of the answers carrying a dump, others are 8 to 10 bytes.
+_DUMP_ANSWER_SIZES = {
+    FunctionCode.CURRENT_PROGRAM_DATA_DUMP: 8 + RAW_SIZE,
+    FunctionCode.PROGRAM_DATA_DUMP: 10 + RAW_SIZE,
+    FunctionCode.CUSTOM_AMPFX_DATA_DUMP: 10 + RAW_SIZE}
+
+
+def expected_response(
+        function_code: FunctionCode,
+        args: tuple[int, ...]) -> tuple[FunctionCode, tuple[int, ...]]:
+    '''returns the function code the device should reply with
+    to a message, and the reply fields identifying the slot
+    (mode and program number for a program dump for example).'''
+    if function_code is FunctionCode.MODE_REQUEST:
+        return FunctionCode.MODE_DATA, ()
+    if function_code is FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST:
+        return FunctionCode.CURRENT_PROGRAM_DATA_DUMP, ()
+    if function_code is FunctionCode.PROGRAM_DATA_DUMP_REQUEST:
+        return FunctionCode.PROGRAM_DATA_DUMP, tuple(args[:2])
+    if function_code is FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST:
+        return FunctionCode.CUSTOM_AMPFX_DATA_DUMP, tuple(args[1:2])
+    if function_code is FunctionCode.PROGRAM_WRITE_REQUEST:
+        return FunctionCode.WRITE_COMPLETED, tuple(args[1:2])
+
+    # data sent to the device (dumps, mode and parameter changes)
+    return FunctionCode.DATA_LOAD_COMPLETED, ()
+
+def response_key(
+        function_code: FunctionCode, shargs: list[int]) -> tuple[int, ...]:
+    '''returns the slot fields of a message received from the device,
+    shargs starting just after the function code.'''
+    if function_code is FunctionCode.PROGRAM_DATA_DUMP:
+        return tuple(shargs[:2])
+    if function_code in (FunctionCode.CUSTOM_AMPFX_DATA_DUMP,
+                         FunctionCode.WRITE_COMPLETED,
+                         FunctionCode.WRITE_ERROR):
+        return tuple(shargs[1:2])
+    return ()
+
+
+class DeviceRequest:
+    '''A message sent to the device for which we wait an answer.'''
+
+    def __init__(self, function_code: FunctionCode, args: tuple[int, ...],
+                 retries=2):
+        self.function_code = function_code
+        self.args = args
+        self.response_code, self.key = expected_response(function_code, args)
+        self.retries = retries
+        # time the message left the output queue, and time after
+        # which it is considered lost, infinite until it left.
+        self.sent_time = 0.0
+        self.deadline = math.inf
+
+        # number of times the request has been sent
+        self.attempts = 0
+
+        # time the device needs to handle the requests released before
+        # this one and still not answered, when it left the output queue.
+        self.queue_time = 0.0
+
+        # True if the request is sent by the pipeline,
+        # False if it has been sent directly.
+        self.pipelined = False
+
+        # True if a newer change of the same parameter has been sent,
+        # the request only waits to take its own answer.
+        self.superseded = False
+
+        # error the device answered with, if any
+        self.error_code: Optional[FunctionCode] = None
+
+        # called with the request and True if it succeeded
+        # when it is answered or failed.
+        self.done_cb: Optional[Callable[['DeviceRequest', bool], None]] = None
+
+    def __repr__(self) -> str:
+        return (f'DeviceRequest({self.function_code.name}, '
+                f'{self.response_code.name}, {self.key})')
+
+    def transfer_time(self) -> float:
+        '''time to send the request to the device and to receive
+        its answer, at MIDI rate'''
+        answer_size = _DUMP_ANSWER_SIZES.get(self.response_code, 10)
+        return (8 + len(self.args) + answer_size) / MIDI_BYTE_RATE
+
+    def matches(self, response_code: FunctionCode,
+                key: tuple[int, ...]) -> bool:
+        if response_code is FunctionCode.DATA_LOAD_ERROR:
+            # mode requests and write requests are never refused this way
+            return self.response_code in _LOAD_ERROR_ANSWERS
+        if response_code is FunctionCode.DATA_FORMAT_ERROR:
+            return self.response_code is FunctionCode.DATA_LOAD_COMPLETED
+        if response_code is FunctionCode.WRITE_ERROR:
+            return (self.response_code is FunctionCode.WRITE_COMPLETED
+                    and key == self.key)
+        return response_code is self.response_code and key == self.key
+
+
+class RttEstimator:
+    '''Smoothed round trip time and variance of the answers to one
+    kind of request, giving the timeout as TCP does (RFC 6298).
+
+    Until a first answer, the timeout is initial_timeout.
+    Each request without answer doubles the timeout,
+    until an answer arrives.'''
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    # minimal variation margin, for very regular answers
+    GRANULARITY = 0.010
+    MAX_BACKOFF = 8
+
+    def __init__(self, initial_timeout: float,
+                 min_timeout: float, max_timeout: float):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.backoff = 1
+
+    def sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = ((1 - self.BETA) * self.rttvar
+                           + self.BETA * abs(self.srtt - rtt))
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.backoff = 1
+
+    def timed_out(self):
+        self.backoff = min(self.backoff * 2, self.MAX_BACKOFF)
+
+    def timeout(self) -> float:
+        if self.srtt is None:
+            timeout = self.initial_timeout
+        else:
+            timeout = self.srtt + max(self.K * self.rttvar, self.GRANULARITY)
+        timeout = max(timeout, self.min_timeout) * self.backoff
+        return min(timeout, self.max_timeout)
+
+
+class RequestPipeline:
+    '''Keeps the table of requests sent to the device and waiting
+    for their answer, each one with its own deadline and retry budget.
+
+    Requests can be sent immediately with `send`, or queued with `add`,
+    the pipeline then keeps at most `window` queued requests waiting for
+    their answer at the same time, and sends the next one each time
+    an answer arrives or a request fails.
+
+    The time to wait for an answer is estimated for each function code
+    from the previous answers. Before a first answer, it is seeded from
+    the transfer time of `window` answers, `timeout` being the minimum.
+    Round trip times are measured from the release of the message by the
+    output queue, so they do not follow the depth of this queue, and
+    the transfer time of the answers queued ahead is added to the
+    deadline of a request instead of being measured.'''
+
+    def __init__(self, send_func: Callable[..., None],
+                 window=4, timeout=0.100, retries=2,
+                 min_timeout=0.050, max_timeout=1.0):
+        self.window = window
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+
+        self._send_func = send_func
+        self._waitings = deque[DeviceRequest]()
+        self._in_flight = list[DeviceRequest]()
+        self._progress_cb: Optional[Callable[[int, int], None]] = None
+        self._failure_cb: Optional[Callable[[DeviceRequest], None]] = None
+        self._estimators = dict[FunctionCode, RttEstimator]()
+
+    def set_progress_callback(self, progress_cb: Callable[[int, int], None]):
+        self._progress_cb = progress_cb
+
+    def set_failure_callback(
+            self, failure_cb: Callable[[DeviceRequest], None]):
+        self._failure_cb = failure_cb
+
+    def clear(self):
+        self._waitings.clear()
+        self._in_flight.clear()
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+
+    def is_busy(self) -> bool:
+        return bool(self._waitings or self._in_flight)
+
+    def in_flight(self) -> list[DeviceRequest]:
+        return self._in_flight.copy()
+
+    def pending(self) -> list[DeviceRequest]:
+        '''requests waiting for their answer or to be sent'''
+        return self._in_flight + list(self._waitings)
+
+    def send(self, function_code: FunctionCode, *args: int) -> DeviceRequest:
+        if function_code is FunctionCode.PARAMETER_CHANGE:
+            self._supersede(args[:2])
+
+        request = DeviceRequest(function_code, args, self.retries)
+        self._emit(request)
+        return request
+
+    def _supersede(self, param_key: tuple[int, ...]):
+        '''older changes of the same parameter still waiting for their
+        answer are never retried, a retry would restore an old value.
+        They stay in the table to take their own answers, else these
+        answers would be taken by the next requests.'''
+        for request in self._in_flight:
+            if (request.function_code is FunctionCode.PARAMETER_CHANGE
+                    and request.args[:2] == param_key
+                    and not request.pipelined):
+                request.superseded = True
+
+    def add(self, request: DeviceRequest):
+        request.pipelined = True
+        self._waitings.append(request)
+        self.total += 1
+
+    def start(self):
+        self._fill()
+
+    def _estimator(self, request: DeviceRequest) -> RttEstimator:
+        estimator = self._estimators.get(request.function_code)
+        if estimator is None:
+            # before any answer, the device may have to send
+            # the answers of the whole window first.
+            initial_timeout = max(
+                self.timeout, self.window * request.transfer_time())
+            estimator = self._estimators[request.function_code] = \
+                RttEstimator(initial_timeout,
+                             self.min_timeout, self.max_timeout)
+        return estimator
+
+    def timeout_for(self, request: DeviceRequest) -> float:
+        '''time to wait for the answer to request,
+        after the answers queued ahead of it'''
+        return self._estimator(request).timeout()
+
+    def _emit(self, request: DeviceRequest):
+        # the timeout starts when the output queue releases the message
+        request.sent_time = time.time()
+        request.deadline = math.inf
+        request.attempts += 1
+        if request not in self._in_flight:
+            self._in_flight.append(request)
+        self._send_func(request.function_code, *request.args,
+                        release_cb=partial(self._released, request))
+
+    def _released(self, request: DeviceRequest):
+        if request not in self._in_flight:
+            return
+        request.sent_time = time.time()
+        # each sending of a resent request may be answered
+        request.queue_time = sum(
+            [r.transfer_time() * r.attempts for r in self._in_flight
+             if r is not request and r.deadline != math.inf])
+        request.deadline = (request.sent_time + request.queue_time
+                            + self.timeout_for(request))
+
+    def _n_pipelined(self) -> int:
+        return len([r for r in self._in_flight if r.pipelined])
+
+    def _fill(self):
+        n_pipelined = self._n_pipelined()
+
+        while self._waitings and n_pipelined < self.window:
+            self._emit(self._waitings.popleft())
+            n_pipelined += 1
+
+    def _finish(self, request: DeviceRequest, success: bool):
+        self._in_flight.remove(request)
+
+        if request.superseded:
+            # newer change of the parameter reports for it
+            self._fill()
+            return
+
+        if request.pipelined:
+            self.done += 1
+            if not success:
+                self.failed += 1
+
+            if self._progress_cb is not None:
+                self._progress_cb(self.done, self.total)
+
+        if request.done_cb is not None:
+            request.done_cb(request, success)
+
+        if not success and self._failure_cb is not None:
+            self._failure_cb(request)
+
+        self._fill()
+
+    def response_received(
+            self, response_code: FunctionCode,
+            key: tuple[int, ...] = ()) -> Optional[DeviceRequest]:
+        '''Remove from the table the request matching this response.
+
+        Returns the matching request, or None if this response
+        was not expected (a parameter changed on the amp for example).'''
+
+        # device answers in order, so the oldest matching request
+        # is the one concerned, it is especially important for errors.
+        for request in self._in_flight:
+            if request.matches(response_code, key):
+                if request.attempts == 1 and request.deadline != math.inf:
+                    # the answer of a resent request could be the answer
+                    # to any of its sendings, it can not be measured.
+                    # Nor the answer taken by a request still in the output
+                    # queue (to a request dropped by a clear).
+                    self._estimator(request).sample(max(
+                        time.time() - request.sent_time - request.queue_time,
+                        0.0))
+
+                if (response_code in ERROR_CODES
+                        or response_code is FunctionCode.WRITE_ERROR):
+                    request.error_code = response_code
+                self._finish(request, request.error_code is None)
+                return request
+        return None
+
+    def next_deadline(self) -> Optional[float]:
+        deadlines = [r.deadline for r in self._in_flight
+                     if r.deadline != math.inf]
+        if not deadlines:
+            return None
+        return min(deadlines)
+
+    def check_timeouts(self):
+        if not self._in_flight:
+            return
+
+        now = time.time()
+        for request in self._in_flight.copy():
+            if now < request.deadline:
+                continue
+
+            self._estimator(request).timed_out()
+
+            if request.retries > 0 and not request.superseded:
+                request.retries -= 1
+                _logger.info(f'No response received for {request}, retry')
+                self._emit(request)
+            else:
+                _logger.warning(f'No response received for {request}')
+                self._finish(request, False)
@@ -0,0 +1,170 @@
+'''Registries of the handlers of the sysex messages received
+from the device, filled once at import.
+
+Messages are dispatched with one dict lookup on their function code,
+and PARAMETER_CHANGE messages with one more lookup on their
+parameter ID (see TABLE 1 in VTX_Midi_Implementation.txt).
+Fields are checked before the handler is called,
+so handlers only receive valid ints.
+
+Handlers for other function codes can be added as plug-ins
+with `SYSEX_HANDLERS.register(function_code, min_size)`.'''
+
+import logging
+from typing import TYPE_CHECKING, Callable, Container, Optional
+
+from effects import (
+    AmpModel, AmpParam, EffectOnOff, Pedal1Type, Pedal2Type,
+    ReverbType, VoxIndex)
+from midi_enums import FunctionCode
+from program_diff import NAME_LENGTH
+from vox_program import VoxProgram
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+_logger = logging.getLogger(__name__)
+
+# function code of each int
+FUNCTION_CODES = dict([(fc.value, fc) for fc in FunctionCode])
+
+# called with the engine and the message bytes after the function code
+SysexHandlerFunc = Callable[['Engine', memoryview], None]
+
+# called with the current program, the param index, the value
+# and the big value, returns False if the value is not valid.
+ParamHandlerFunc = Callable[[VoxProgram, int, int, int], bool]
+
+
+class SysexHandler:
+    __slots__ = ('function_code', 'min_size', 'func')
+
+    def __init__(self, function_code: FunctionCode, min_size: int,
+                 func: SysexHandlerFunc):
+        self.function_code = function_code
+        self.min_size = min_size
+        self.func = func
+
+
+class SysexRegistry:
+    '''Handlers of the received messages, by function code.'''
+
+    def __init__(self):
+        self._handlers = dict[int, SysexHandler]()
+
+    def register(self, function_code: FunctionCode, min_size=0):
+        '''decorator registering a handler for function_code,
+        called only if the message has at least min_size bytes
+        after the function code.'''
+        def decorator(func: SysexHandlerFunc) -> SysexHandlerFunc:
+            self._handlers[function_code.value] = SysexHandler(
+                function_code, min_size, func)
+            return func
+        return decorator
+
+    def get(self, function_code_int: int) -> Optional[SysexHandler]:
+        return self._handlers.get(function_code_int)
+
+
+class ParamHandler:
+    __slots__ = ('vox_index', 'param_indexes', 'func')
+
+    def __init__(self, vox_index: VoxIndex, param_indexes: Container[int],
+                 func: ParamHandlerFunc):
+        self.vox_index = vox_index
+        self.param_indexes = param_indexes
+        self.func = func
+
+
+class ParamRegistry:
+    '''Handlers of the PARAMETER_CHANGE messages, by parameter ID.'''
+
+    def __init__(self):
+        self._handlers = dict[int, ParamHandler]()
+
+    def register(self, vox_index: VoxIndex, param_indexes: Container[int]):
+        '''decorator registering a handler for vox_index,
+        called only if the param index is in param_indexes.'''
+        def decorator(func: ParamHandlerFunc) -> ParamHandlerFunc:
+            self._handlers[vox_index.value] = ParamHandler(
+                vox_index, param_indexes, func)
+            return func
+        return decorator
+
+    def get(self, vox_index_int: int) -> Optional[ParamHandler]:
+        return self._handlers.get(vox_index_int)
+
+
+SYSEX_HANDLERS = SysexRegistry()
+PARAM_HANDLERS = ParamRegistry()
+
+_EFFECTS = dict([(e.value, e) for e in EffectOnOff])
+_AMP_PARAMS = tuple(AmpParam)
+
+# attribute and members by value of the model of each effect
+_EFFECT_MODELS = dict([
+    (effect.value, (attr, dict([(m.value, m) for m in enum_cls])))
+    for effect, attr, enum_cls in (
+        (EffectOnOff.AMP, 'amp_model', AmpModel),
+        (EffectOnOff.PEDAL1, 'pedal1_type', Pedal1Type),
+        (EffectOnOff.PEDAL2, 'pedal2_type', Pedal2Type),
+        (EffectOnOff.REVERB, 'reverb_type', ReverbType))])
+
+
+@PARAM_HANDLERS.register(VoxIndex.PROGRAM_NAME, range(NAME_LENGTH))
+def _program_name(program: VoxProgram, param_index: int,
+                  value: int, big_value: int) -> bool:
+    # one character of the name
+    name = program.program_name.ljust(NAME_LENGTH)
+    program.program_name = (
+        name[:param_index] + chr(value) + name[param_index + 1:]).strip()
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.NR_SENS, range(1))
+def _nr_sens(program: VoxProgram, param_index: int,
+             value: int, big_value: int) -> bool:
+    program.nr_sens = min(max(value, 0), 100)
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.EFFECT_STATUS, _EFFECTS)
+def _effect_status(program: VoxProgram, param_index: int,
+                   value: int, big_value: int) -> bool:
+    program.active_effects[_EFFECTS[param_index]] = value
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.EFFECT_MODEL, _EFFECT_MODELS)
+def _effect_model(program: VoxProgram, param_index: int,
+                  value: int, big_value: int) -> bool:
+    attr, models = _EFFECT_MODELS[param_index]
+    model = models.get(value)
+    if model is None:
+        _logger.critical(f'unknown model {value} for {attr}')
+        return False
+
+    setattr(program, attr, model)
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.AMP, range(len(_AMP_PARAMS)))
+def _amp(program: VoxProgram, param_index: int,
+         value: int, big_value: int) -> bool:
+    program.amp_params[_AMP_PARAMS[param_index]] = value
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.PEDAL1, range(6))
+def _pedal1(program: VoxProgram, param_index: int,
+            value: int, big_value: int) -> bool:
+    program.pedal1_values[param_index] = value + big_value * 128
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.PEDAL2, range(6))
+def _pedal2(program: VoxProgram, param_index: int,
+            value: int, big_value: int) -> bool:
+    program.pedal2_values[param_index] = value + big_value * 128
+    return True
+
+@PARAM_HANDLERS.register(VoxIndex.REVERB, range(5))
+def _reverb(program: VoxProgram, param_index: int,
+            value: int, big_value: int) -> bool:
+    program.reverb_values[param_index] = value
+    return True
@@ -0,0 +1,100 @@
+import logging
+import re
+from typing import Iterable
+
+
+_logger = logging.getLogger(__name__)
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+
+# the biggest message of the device is a program dump (81 bytes),
+# anything much longer is garbage.
+MAX_SYSEX_SIZE = 512
+
+_STATUS_BYTE = re.compile(rb'[\x80-\xff]')
+
+
+class SysexReassembler:
+    '''Incremental parser of the sysex data received from one port.
+
+    Data may contain a part of a message, a complete one,
+    or several ones, `feed` returns the completed messages,
+    from F0 to F7 included.
+
+    Real-time bytes (F8 to FF) are ignored, any other status byte
+    aborts the message being read. A message longer
+    than max_size is dropped.'''
+
+    def __init__(self, max_size=MAX_SYSEX_SIZE):
+        self.max_size = max_size
+        self.dropped = 0
+        self._buf = bytearray()
+        self._in_sysex = False
+
+    def reset(self):
+        '''forget the message being read'''
+        self._buf.clear()
+        self._in_sysex = False
+
+    def _drop(self, reason: str):
+        self.dropped += 1
+        _logger.warning(f'sysex message dropped, {reason}')
+        self.reset()
+
+    def feed(self, data: Iterable[int]) -> list[bytes]:
+        data = bytes(data)
+
+        # most common case, a complete message alone
+        if (not self._in_sysex
+                and data[:1] == b'\xf0'
+                and data[-1] == SYSEX_END
+                and len(data) <= self.max_size):
+            if _STATUS_BYTE.search(data, 1).start() == len(data) - 1:
+                return [data]
+
+        frames = list[bytes]()
+        pos = 0
+        size = len(data)
+
+        while pos < size:
+            if not self._in_sysex:
+                start = data.find(SYSEX_START, pos)
+                if start == -1:
+                    # data out of a sysex message, not for us
+                    break
+                self._in_sysex = True
+                self._buf.append(SYSEX_START)
+                pos = start + 1
+                continue
+
+            # read until the next status byte
+            match = _STATUS_BYTE.search(data, pos)
+            end = size if match is None else match.start()
+
+            self._buf += data[pos:end]
+            if len(self._buf) > self.max_size:
+                self._drop(f'longer than {self.max_size} bytes')
+                pos = end
+                continue
+
+            if end == size:
+                break
+
+            status = data[end]
+            if status == SYSEX_END:
+                self._buf.append(SYSEX_END)
+                frames.append(bytes(self._buf))
+                self.reset()
+            elif status >= 0xF8:
+                # real-time message, can be anywhere
+                pass
+            else:
+                self._drop(f'interrupted by status byte {hex(status)}')
+                if status == SYSEX_START:
+                    # next message starts here
+                    end -= 1
+
+            pos = end + 1
+
+        return frames
@@ -0,0 +1,184 @@
+from collections import deque
+import logging
+from typing import Callable, Optional
+
+from effects import VoxMode
+from midi_enums import FunctionCode
+from request_pipeline import DeviceRequest
+from vox_program import VoxProgram
+
+
+_logger = logging.getLogger(__name__)
+
+
+class UploadSlot:
+    '''A program to write in a user bank, or an ampfx
+    to write in a user ampfx of the device.'''
+
+    def __init__(self, function_code: FunctionCode,
+                 index: int, program: VoxProgram):
+        self.function_code = function_code
+        self.index = index
+        self.program = program
+
+        # number of times the slot has been sent
+        self.attempts = 0
+
+    def __repr__(self) -> str:
+        return f'UploadSlot({self.name()})'
+
+    @classmethod
+    def bank(cls, index: int, program: VoxProgram) -> 'UploadSlot':
+        return cls(FunctionCode.PROGRAM_DATA_DUMP, index, program)
+
+    @classmethod
+    def ampfx(cls, index: int, program: VoxProgram) -> 'UploadSlot':
+        return cls(FunctionCode.CUSTOM_AMPFX_DATA_DUMP, index, program)
+
+    def is_bank(self) -> bool:
+        return self.function_code is FunctionCode.PROGRAM_DATA_DUMP
+
+    def name(self) -> str:
+        if self.is_bank():
+            return f'bank{self.index}'
+        return f'ampfx{self.index}'
+
+    def args(self) -> tuple[int, ...]:
+        if self.is_bank():
+            return (VoxMode.USER.value, self.index,
+                    *self.program.data_write())
+        return (0, self.index, *self.program.ampfx_data_write())
+
+
+class UploadJob:
+    '''Writes user banks and ampfxs to the device.
+
+    The device acknowledges each slot with DATA_LOAD_COMPLETED,
+    at most `window` slots wait for their acknowledgement at the same time,
+    the next one is sent each time one is acknowledged.
+    A slot refused by the device (DATA_LOAD_ERROR) is sent again,
+    at most `retries` times, and the window is halved for the rest
+    of the job, the input buffer of the device may be too small for it.
+    A slot without answer is failed,
+    the device is then lost and the job should be aborted.
+
+    The request pipeline gives an error to the oldest request
+    the device could refuse, superseded parameter changes included.
+    But a full input buffer is answered at once, before the
+    slots already in it, so the other slots in flight at a refusal
+    are sent again, even if acknowledged.'''
+
+    def __init__(self, send_func: Callable[[UploadSlot], DeviceRequest],
+                 slots: list[UploadSlot], window=2, retries=2):
+        self.slots = slots
+        self.window = window
+        self.retries = retries
+        self.total = len(slots)
+        self.done = 0
+        self.failed = list[UploadSlot]()
+
+        self._send_func = send_func
+        self._waitings = deque[UploadSlot](slots)
+        self._in_flight = dict[DeviceRequest, UploadSlot]()
+        self._unsure = set[UploadSlot]()
+        self._slot_cb: Optional[Callable[[UploadSlot, bool], None]] = None
+        self._progress_cb: Optional[Callable[[int, int], None]] = None
+        self._finished_cb: Optional[
+            Callable[[list[UploadSlot]], None]] = None
+
+    def set_slot_callback(self, slot_cb: Callable[[UploadSlot, bool], None]):
+        '''slot_cb is called with each slot and True if it is written'''
+        self._slot_cb = slot_cb
+
+    def set_progress_callback(self, progress_cb: Callable[[int, int], None]):
+        self._progress_cb = progress_cb
+
+    def set_finished_callback(
+            self, finished_cb: Callable[[list[UploadSlot]], None]):
+        '''finished_cb is called with the failed slots
+        when all slots are done'''
+        self._finished_cb = finished_cb
+
+    def is_finished(self) -> bool:
+        return self.done >= self.total
+
+    def add(self, slots: list[UploadSlot]):
+        '''add slots to the running job'''
+        self.slots += slots
+        self.total += len(slots)
+        self._waitings.extend(slots)
+        self._fill()
+
+    def start(self):
+        if self.is_finished():
+            self._finish()
+            return
+        self._fill()
+
+    def abort(self):
+        '''fail all the slots not done yet,
+        their requests will never be answered.'''
+        if self.is_finished():
+            return
+
+        slots = list(self._in_flight.values()) + list(self._waitings)
+        self._in_flight.clear()
+        self._waitings.clear()
+        self._unsure.clear()
+
+        for slot in slots:
+            self._slot_done(slot, False)
+        self._finish()
+
+    def _fill(self):
+        while self._waitings and len(self._in_flight) < self.window:
+            slot = self._waitings.popleft()
+            slot.attempts += 1
+            request = self._send_func(slot)
+            request.done_cb = self._request_done
+            self._in_flight[request] = slot
+
+    def _slot_done(self, slot: UploadSlot, success: bool):
+        self.done += 1
+        if not success:
+            self.failed.append(slot)
+        if self._slot_cb is not None:
+            self._slot_cb(slot, success)
+
+    def _finish(self):
+        if self.failed:
+            _logger.warning(
+                'upload failed for '
+                + ', '.join([slot.name() for slot in self.failed]))
+        if self._finished_cb is not None:
+            self._finished_cb(self.failed.copy())
+
+    def _request_done(self, request: DeviceRequest, success: bool):
+        slot = self._in_flight.pop(request, None)
+        if slot is None:
+            # job has been aborted
+            return
+
+        refused = not success and request.error_code is not None
+        if refused:
+            self.window = max(self.window // 2, 1)
+            # their answer may be for the refused slot
+            self._unsure.update(self._in_flight.values())
+
+        if refused and slot.attempts <= self.retries:
+            # device answered, it may accept the slot the next time
+            _logger.info(f'{slot} refused by the device, retry')
+            self._waitings.appendleft(slot)
+        elif success and slot in self._unsure:
+            _logger.info(f'{slot} may have been refused, send it again')
+            self._unsure.discard(slot)
+            self._waitings.appendleft(slot)
+        else:
+            self._slot_done(slot, success)
+            if self._progress_cb is not None:
+                self._progress_cb(self.done, self.total)
+
+        if self.is_finished():
+            self._finish()
+        else:
+            self._fill()
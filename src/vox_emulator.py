@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+'''Software Valvetronix, speaking the protocol described in
+VTX_Midi_Implementation.txt, to test the engine without the device.
+
+It runs in the process with `EmulatorClient` in place of
+the MIDI client, or as an ALSA virtual client when this file
+is executed (oscitronix must then be started with --virtual-device).
+
+The time the device takes to answer, the part of the messages
+it loses and the size of its input buffer are configurable.'''
+
+from collections import deque
+import logging
+import random
+from threading import Event, Lock
+import time
+from typing import Optional
+
+from effects import VoxIndex, VoxMode
+from engine import SYSEX_BEGIN, Engine
+from midi_enums import FunctionCode, MidiConnectState
+from rate_limiter import OutputRateLimiter
+from sysex_handlers import PARAM_HANDLERS
+from vox_program import VoxProgram
+
+
+_logger = logging.getLogger(__name__)
+
+# MIDI transfer rate, in bytes per second
+MIDI_BYTE_RATE = 3125.0
+
+_HEADER = bytes(SYSEX_BEGIN)
+_DEVICE_INQUIRY_REQUEST_BEGIN = b'\xf0\x7e'
+
+# family, member, minor and major versions, as given by the amp
+DEVICE_IDENTITY = (0x42, 0x34, 0x01, 0x00, 0x00, 0x03, 0x00, 0x01, 0x00)
+
+
+class VoxEmulator:
+    '''State and answers of the emulated device.
+
+    The device handles received messages one after the other,
+    each one taking `latency` seconds plus its transfer time.
+    A received message is lost with the probability `drop_rate`.
+    When messages waiting to be handled exceed `buffer_size` bytes,
+    a new message is lost, and answered with DATA LOAD ERROR
+    if `overflow_error` is True.
+
+    `receive` and `process` can be called from any thread.'''
+
+    def __init__(self, latency=0.002, drop_rate=0.0,
+                 buffer_size=1024, overflow_error=True,
+                 byte_rate=MIDI_BYTE_RATE, seed: Optional[int] = None):
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.buffer_size = buffer_size
+        self.overflow_error = overflow_error
+        self.byte_rate = byte_rate
+
+        self.mode = VoxMode.USER
+        self.prog_num = 0
+        self.current_program = VoxProgram()
+        self.programs = [VoxProgram() for i in range(8)]
+        self.factory_programs = [VoxProgram() for i in range(60)]
+        self.user_ampfxs = [VoxProgram() for i in range(4)]
+
+        for i in range(len(self.programs)):
+            self.programs[i].program_name = f'USER {i + 1}'
+        for i in range(len(self.factory_programs)):
+            self.factory_programs[i].program_name = f'PRESET {i + 1}'
+        self.current_program = self.programs[0].copy()
+
+        self.n_received = 0
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.n_overflows = 0
+
+        self._rnd = random.Random(seed)
+        self._lock = Lock()
+
+        # (time it is handled, message) of received messages
+        self._inputs = deque[tuple[float, bytes]]()
+        self._input_bytes = 0
+        self._busy_until = 0.0
+
+        # (time it is completely sent, message) of messages to send
+        self._outputs = deque[tuple[float, bytes]]()
+
+    def receive(self, msg: bytes|list[int]):
+        '''message sent to the device'''
+        msg = bytes(msg)
+        now = time.monotonic()
+
+        with self._lock:
+            self.n_received += 1
+
+            if self.drop_rate and self._rnd.random() < self.drop_rate:
+                self.n_dropped += 1
+                return
+
+            if self._input_bytes + len(msg) > self.buffer_size:
+                self.n_overflows += 1
+                if self.overflow_error:
+                    self._send(now, FunctionCode.DATA_LOAD_ERROR)
+                return
+
+            handle_time = (max(now, self._busy_until)
+                           + len(msg) / self.byte_rate + self.latency)
+            self._busy_until = handle_time
+            self._inputs.append((handle_time, msg))
+            self._input_bytes += len(msg)
+
+    def next_time(self) -> Optional[float]:
+        '''monotonic time of the next thing to do, if any'''
+        with self._lock:
+            times = list[float]()
+            if self._inputs:
+                times.append(self._inputs[0][0])
+            if self._outputs:
+                times.append(self._outputs[0][0])
+            return min(times) if times else None
+
+    def process(self) -> list[bytes]:
+        '''handle the received messages whose time has come,
+        returns the messages sent by the device since last call.'''
+        now = time.monotonic()
+        msgs = list[bytes]()
+
+        with self._lock:
+            while self._inputs and self._inputs[0][0] <= now:
+                handle_time, msg = self._inputs.popleft()
+                self._input_bytes -= len(msg)
+                self._handle(handle_time, msg)
+
+            while self._outputs and self._outputs[0][0] <= now:
+                msgs.append(self._outputs.popleft()[1])
+
+        return msgs
+
+    def move_param(self, vox_index: VoxIndex, param_index: int, value: int):
+        '''as if a knob or a switch was moved on the amp'''
+        value_big = 0
+        if vox_index in (VoxIndex.PEDAL1, VoxIndex.PEDAL2) and param_index == 0:
+            value_big, value = divmod(value, 128)
+
+        with self._lock:
+            self._apply_param(vox_index.value, param_index, value, value_big)
+            self._send(time.monotonic(), FunctionCode.PARAMETER_CHANGE,
+                       vox_index.value, param_index, value, value_big)
+
+    def change_program(self, mode: VoxMode, prog_num: int):
+        '''as if the program was changed with the amp switches'''
+        with self._lock:
+            self._change_program(mode.value, prog_num)
+            self._send(time.monotonic(), FunctionCode.MODE_CHANGE,
+                       mode.value, prog_num)
+
+    def _send(self, now: float, function_code: FunctionCode, *args: int):
+        msg = _HEADER + bytes([function_code.value, *args, 0xF7])
+        self._send_raw(now, msg)
+
+    def _send_raw(self, now: float, msg: bytes):
+        # the device sends its messages in order
+        sent_time = now
+        if self._outputs:
+            sent_time = max(sent_time, self._outputs[-1][0])
+        self._outputs.append((sent_time + len(msg) / self.byte_rate, msg))
+        self.n_sent += 1
+
+    def _apply_param(self, vox_index_int: int, param_index: int,
+                     value: int, value_big: int) -> bool:
+        handler = PARAM_HANDLERS.get(vox_index_int)
+        if handler is None or param_index not in handler.param_indexes:
+            return False
+        return handler.func(
+            self.current_program, param_index, value, value_big)
+
+    def _change_program(self, mode_int: int, prog_num: int) -> bool:
+        if mode_int == VoxMode.USER.value:
+            if not 0 <= prog_num < len(self.programs):
+                return False
+            self.current_program = self.programs[prog_num].copy()
+        elif mode_int == VoxMode.PRESET.value:
+            if not 0 <= prog_num < len(self.factory_programs):
+                return False
+            self.current_program = self.factory_programs[prog_num].copy()
+        elif mode_int != VoxMode.MANUAL.value:
+            return False
+
+        self.mode = VoxMode(mode_int)
+        self.prog_num = prog_num
+        return True
+
+    def _handle(self, now: float, msg: bytes):
+        if msg.startswith(_DEVICE_INQUIRY_REQUEST_BEGIN):
+            if msg[3:5] == b'\x06\x01':
+                self._send_raw(now, bytes(
+                    [0xF0, 0x7E, 0x00, 0x06, 0x02, *DEVICE_IDENTITY, 0xF7]))
+            return
+
+        if len(msg) < 8 or not msg.startswith(_HEADER) or msg[-1] != 0xF7:
+            self._send(now, FunctionCode.DATA_FORMAT_ERROR)
+            return
+
+        function_code_int = msg[6]
+        args = memoryview(msg)[7:-1]
+        ok = True
+
+        if function_code_int == FunctionCode.MODE_REQUEST:
+            self._send(now, FunctionCode.MODE_DATA,
+                       self.mode.value, self.prog_num)
+            return
+
+        if function_code_int == FunctionCode.CURRENT_PROGRAM_DATA_DUMP_REQUEST:
+            self._send(now, FunctionCode.CURRENT_PROGRAM_DATA_DUMP,
+                       *self.current_program.data_write())
+            return
+
+        if function_code_int == FunctionCode.PROGRAM_DATA_DUMP_REQUEST:
+            if len(args) == 2:
+                mode_int, prog_num = args[0], args[1]
+                if (mode_int == VoxMode.USER.value
+                        and prog_num < len(self.programs)):
+                    self._send(now, FunctionCode.PROGRAM_DATA_DUMP,
+                               mode_int, prog_num,
+                               *self.programs[prog_num].data_write())
+                    return
+                if (mode_int == VoxMode.PRESET.value
+                        and prog_num < len(self.factory_programs)):
+                    self._send(now, FunctionCode.PROGRAM_DATA_DUMP,
+                               mode_int, prog_num,
+                               *self.factory_programs[prog_num].data_write())
+                    return
+            self._send(now, FunctionCode.DATA_LOAD_ERROR)
+            return
+
+        if function_code_int == FunctionCode.CUSTOM_AMPFX_DATA_DUMP_REQUEST:
+            if len(args) == 2 and args[1] < len(self.user_ampfxs):
+                self._send(now, FunctionCode.CUSTOM_AMPFX_DATA_DUMP,
+                           0, args[1],
+                           *self.user_ampfxs[args[1]].ampfx_data_write())
+            else:
+                self._send(now, FunctionCode.DATA_LOAD_ERROR)
+            return
+
+        if function_code_int == FunctionCode.PROGRAM_WRITE_REQUEST:
+            if len(args) == 2 and args[1] < len(self.programs):
+                self.programs[args[1]] = self.current_program.copy()
+                self._send(now, FunctionCode.WRITE_COMPLETED, 0, args[1])
+            else:
+                self._send(now, FunctionCode.WRITE_ERROR, 0,
+                           args[1] if len(args) == 2 else 0)
+            return
+
+        try:
+            if function_code_int == FunctionCode.CURRENT_PROGRAM_DATA_DUMP:
+                program = VoxProgram()
+                program.data_read(args)
+                self.current_program = program
+
+            elif function_code_int == FunctionCode.PROGRAM_DATA_DUMP:
+                ok = (args[0] == VoxMode.USER.value
+                      and args[1] < len(self.programs))
+                if ok:
+                    program = VoxProgram()
+                    program.data_read(args[2:])
+                    self.programs[args[1]] = program
+
+            elif function_code_int == FunctionCode.CUSTOM_AMPFX_DATA_DUMP:
+                ok = args[1] < len(self.user_ampfxs)
+                if ok:
+                    program = VoxProgram()
+                    program.ampfx_data_read(args[2:])
+                    self.user_ampfxs[args[1]] = program
+
+            elif function_code_int == FunctionCode.MODE_CHANGE:
+                ok = len(args) == 2 and self._change_program(args[0], args[1])
+
+            elif function_code_int == FunctionCode.PARAMETER_CHANGE:
+                ok = len(args) == 4 and self._apply_param(*args)
+
+            else:
+                self._send(now, FunctionCode.DATA_FORMAT_ERROR)
+                return
+
+        except BaseException as e:
+            _logger.info(
+                f'emulator failed to load {hex(function_code_int)}: {str(e)}')
+            ok = False
+
+        self._send(now, FunctionCode.DATA_LOAD_COMPLETED if ok
+                   else FunctionCode.DATA_LOAD_ERROR)
+
+
+class EmulatorClient:
+    '''Runs the engine with an emulator, in place of the MIDI client.
+
+    As with the MIDI client, messages sent by the engine
+    go through an output rate limiter.'''
+
+    def __init__(self, emulator: VoxEmulator):
+        self.emulator = emulator
+        self.engine: Optional[Engine] = None
+        self.stopping = False
+        self._rate_limiter = OutputRateLimiter()
+        self._wakeup = Event()
+
+    def set_engine(self, engine: Engine):
+        self.engine = engine
+        self.engine.set_midi_out_func(self._rate_limiter.push)
+        self.engine.set_latency_callback(self._response_latency)
+        self.engine.set_overrun_callback(
+            self._rate_limiter.report_device_error)
+        self.engine.set_wakeup_func(self._wakeup.set)
+        self.engine.set_midi_connect_state(MidiConnectState.CONNECTED)
+
+    def _response_latency(self, function_code: FunctionCode, latency: float):
+        self._rate_limiter.report_latency(function_code, latency)
+
+    def run_once(self):
+        engine = self.engine
+        self._wakeup.clear()
+
+        engine.process_event_queue()
+        engine.check_pending_requests()
+        for msg in self.emulator.process():
+            engine.receive_sysex(msg)
+
+        for msg in self._rate_limiter.pop_ready():
+            self.emulator.receive(msg)
+
+    def wait(self):
+        timeouts = list[float]()
+        engine_timeout = self.engine.next_timeout()
+        if engine_timeout is not None:
+            timeouts.append(engine_timeout)
+
+        limiter_delay = self._rate_limiter.next_delay()
+        if limiter_delay is not None:
+            timeouts.append(limiter_delay)
+
+        emulator_time = self.emulator.next_time()
+        if emulator_time is not None:
+            timeouts.append(max(emulator_time - time.monotonic(), 0.0))
+
+        self._wakeup.wait(min(timeouts) if timeouts else None)
+
+    def run_loop(self):
+        if self.engine is None:
+            _logger.error('engine must be set before to run emulator loop')
+            return
+
+        while not self.stopping:
+            self.run_once()
+            self.wait()
+
+    def run_until_idle(self, timeout=30.0) -> bool:
+        '''run in the current thread until nothing is expected
+        from the engine or the emulator. Returns False on timeout.'''
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            self.run_once()
+            if (self.engine.event_queue.empty()
+                    and not self._rate_limiter.has_pending()
+                    and self.engine.next_timeout() is None
+                    and self.emulator.next_time() is None):
+                return True
+            self.wait()
+        return False
+
+    def wakeup(self):
+        '''to call after a change made on the emulator
+        (move_param, change_program) while the loop runs'''
+        self._wakeup.set()
+
+    def stop_loop(self):
+        self.stopping = True
+        self._wakeup.set()
+
+
+def run_alsa_client(emulator: VoxEmulator):
+    '''expose the emulator as an ALSA MIDI client
+    with the name of the device, until interrupted.'''
+    import select
+    from pyalsa import alsaseq
+    from midi_client import VALVETRONIX_CLIENT_NAME, VALVETRONIX_PORT_NAMES
+    from sysex_reassembler import SysexReassembler
+
+    seq = alsaseq.Sequencer(clientname=VALVETRONIX_CLIENT_NAME)
+    port_id = seq.create_simple_port(
+        VALVETRONIX_PORT_NAMES[0],
+        alsaseq.SEQ_PORT_TYPE_MIDI_GENERIC
+        | alsaseq.SEQ_PORT_TYPE_APPLICATION,
+        alsaseq.SEQ_PORT_CAP_WRITE | alsaseq.SEQ_PORT_CAP_SUBS_WRITE
+        | alsaseq.SEQ_PORT_CAP_READ | alsaseq.SEQ_PORT_CAP_SUBS_READ)
+
+    poll = select.poll()
+    seq.registerpoll(poll, input=True)
+    reassemblers = dict[tuple[int, int], SysexReassembler]()
+    _logger.info(f'emulator ready as ALSA client {seq.client_id}')
+
+    while True:
+        for event in seq.receive_events():
+            if event.type is not alsaseq.SEQ_EVENT_SYSEX:
+                continue
+            reassembler = reassemblers.setdefault(
+                event.source, SysexReassembler())
+            for msg in reassembler.feed(event.get_data()['ext']):
+                emulator.receive(msg)
+
+        msgs = emulator.process()
+        for msg in msgs:
+            event = alsaseq.SeqEvent(alsaseq.SEQ_EVENT_SYSEX)
+            event.set_data({'ext': list(msg)})
+            event.source = (seq.client_id, port_id)
+            seq.output_event(event)
+        if msgs:
+            seq.drain_output()
+
+        next_time = emulator.next_time()
+        timeout = None
+        if next_time is not None:
+            timeout = max(int((next_time - time.monotonic()) * 1000), 0) + 1
+        poll.poll(timeout)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='time to handle a message, in seconds')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='probability to lose a received message')
+    parser.add_argument('--buffer-size', type=int, default=1024,
+                        help='size in bytes of the input buffer')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        run_alsa_client(VoxEmulator(
+            latency=args.latency, drop_rate=args.drop_rate,
+            buffer_size=args.buffer_size))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
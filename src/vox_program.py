@@ -1,53 +1,249 @@
+from array import array
+from enum import Enum
 import logging
 
 from effects import (
     EffectOnOff, AmpModel, AmpParam, Pedal1Type, Pedal2Type,
     ReverbType, EffectStatus, ReverbParam, EffParam)
+from dump_layout import DumpLayout, PROGRAM_FIELDS, AMPFX_FIELDS
 
 _logger = logging.getLogger(__name__)
 
 
+# positions of the values in the VoxProgram buffer
+_NR_SENS = 0
+_ACTIVE_EFFECTS = 1 # 5 slots, EffectOnOff values are 0, 1, 2 and 4
+_AMP_MODEL = 6
+_AMP_PARAMS = 7
+_PEDAL1_TYPE = 19
+_PEDAL2_TYPE = 20
+_REVERB_TYPE = 21
+_PEDAL1_VALUES = 22
+_PEDAL2_VALUES = 28
+_REVERB_VALUES = 34
+_SIZE = 39
+
+_EMPTY = array('H', [0] * _SIZE)
+
+# position in the buffer of each (attribute, key) of the dump fields
+_SLOTS = {
+    ('nr_sens', None): _NR_SENS,
+    ('amp_model', None): _AMP_MODEL,
+    ('pedal1_type', None): _PEDAL1_TYPE,
+    ('pedal2_type', None): _PEDAL2_TYPE,
+    ('reverb_type', None): _REVERB_TYPE,
+    **dict([(('active_effects', e), _ACTIVE_EFFECTS + e.value)
+            for e in EffectOnOff]),
+    **dict([(('amp_params', a), _AMP_PARAMS + a.value) for a in AmpParam]),
+    **dict([(('pedal1_values', i), _PEDAL1_VALUES + i) for i in range(6)]),
+    **dict([(('pedal2_values', i), _PEDAL2_VALUES + i) for i in range(6)]),
+    **dict([(('reverb_values', i), _REVERB_VALUES + i) for i in range(5)])}
+
+PROGRAM_LAYOUT = DumpLayout(PROGRAM_FIELDS, _SLOTS)
+AMPFX_LAYOUT = DumpLayout(AMPFX_FIELDS, _SLOTS)
+
+# members of each Enum, at the index of their value
+_AMP_MODELS = tuple(AmpModel)
+_PEDAL1_TYPES = tuple(Pedal1Type)
+_PEDAL2_TYPES = tuple(Pedal2Type)
+_REVERB_TYPES = tuple(ReverbType)
+
+
+class _ItemsView:
+    '''dict like access to the values of an Enum
+    stored in the program buffer at start + member value'''
+    __slots__ = ('_data', '_start', '_enum_cls')
+
+    def __init__(self, data: array, start: int, enum_cls: type[Enum]):
+        self._data = data
+        self._start = start
+        self._enum_cls = enum_cls
+
+    # _value_ is used instead of value, which is far slower.
+
+    def __getitem__(self, key: Enum) -> int:
+        if type(key) is not self._enum_cls:
+            raise KeyError(key)
+        return self._data[self._start + key._value_]
+
+    def __setitem__(self, key: Enum, value: int):
+        if type(key) is not self._enum_cls:
+            raise KeyError(key)
+        self._data[self._start + key._value_] = value
+
+    def __iter__(self):
+        return iter(self._enum_cls)
+
+    def __len__(self) -> int:
+        return len(self._enum_cls)
+
+    def __contains__(self, key) -> bool:
+        return type(key) is self._enum_cls
+
+    def __eq__(self, other) -> bool:
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return list(self._enum_cls)
+
+    def values(self) -> list[int]:
+        return [self._data[self._start + k.value] for k in self._enum_cls]
+
+    def items(self) -> list[tuple[Enum, int]]:
+        return [(k, self._data[self._start + k.value])
+                for k in self._enum_cls]
+
+    def copy(self) -> dict[Enum, int]:
+        return dict(self.items())
+
+
+class _ValuesView:
+    '''list like access to a fixed number of values
+    stored in the program buffer'''
+    __slots__ = ('_data', '_start', '_len')
+
+    def __init__(self, data: array, start: int, length: int):
+        self._data = data
+        self._start = start
+        self._len = length
+
+    def __getitem__(self, index: int | slice):
+        if type(index) is slice:
+            return self.copy()[index]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('program values index out of range')
+        return self._data[self._start + index]
+
+    def __setitem__(self, index: int, value: int):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('program values index out of range')
+        self._data[self._start + index] = value
+
+    def __iter__(self):
+        return iter(self._data[self._start:self._start + self._len])
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __eq__(self, other) -> bool:
+        return self.copy() == list(other)
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def copy(self) -> list[int]:
+        return self._data[self._start:self._start + self._len].tolist()
+
+
 class VoxProgram:
+    '''All values except the name are stored in one array,
+    so a copy is a single buffer copy.'''
+    __slots__ = ('program_name', '_data')
+
     def __init__(self):
         self.program_name = ''
-        self.nr_sens = 0
-        self.active_effects = dict[EffectOnOff, int]()
-        for effect_on_off in EffectOnOff:
-            self.active_effects[effect_on_off] = 0
-        self.amp_model = AmpModel.DELUXE_CL_VIBRATO
-        self.amp_params = dict[AmpParam, int]()
-        for amp_param in AmpParam:
-            self.amp_params[amp_param] = 0
-        self.pedal1_type = Pedal1Type.COMP
-        self.pedal2_type = Pedal2Type.FLANGER
-        self.reverb_type = ReverbType.ROOM
-        self.pedal1_values = [0, 0, 0, 0, 0, 0]
-        self.pedal2_values = [0, 0, 0, 0, 0, 0]
-        self.reverb_values = [0, 0, 0, 0, 0]
+        self._data = array('H', _EMPTY)
 
     def copy(self) -> 'VoxProgram':
-        p = VoxProgram()
+        p = VoxProgram.__new__(VoxProgram)
         p.program_name = self.program_name
-        p.nr_sens = self.nr_sens
+        p._data = self._data[:]
+        return p
 
-        for effonoff, value in self.active_effects.items():
-            p.active_effects[effonoff] = value
+    def _set_values(self, start: int, length: int, values: list[int]):
+        if len(values) != length:
+            raise ValueError(
+                f'{length} values expected, {len(values)} given')
+        self._data[start:start + length] = array('H', values)
 
-        p.amp_model = self.amp_model
-        for amp_param, value in self.amp_params.items():
-            p.amp_params[amp_param] = value
+    @property
+    def nr_sens(self) -> int:
+        return self._data[_NR_SENS]
 
-        p.pedal1_type = self.pedal1_type
-        p.pedal2_type = self.pedal2_type
-        p.reverb_type = self.reverb_type
+    @nr_sens.setter
+    def nr_sens(self, value: int):
+        self._data[_NR_SENS] = value
 
-        for i in range(6):
-            p.pedal1_values[i] = self.pedal1_values[i]
-            p.pedal2_values[i] = self.pedal2_values[i]
-            if i < 5:
-                p.reverb_values[i] = self.reverb_values[i]
-        
-        return p
+    @property
+    def amp_model(self) -> AmpModel:
+        return _AMP_MODELS[self._data[_AMP_MODEL]]
+
+    @amp_model.setter
+    def amp_model(self, amp_model: AmpModel):
+        self._data[_AMP_MODEL] = amp_model._value_
+
+    @property
+    def pedal1_type(self) -> Pedal1Type:
+        return _PEDAL1_TYPES[self._data[_PEDAL1_TYPE]]
+
+    @pedal1_type.setter
+    def pedal1_type(self, pedal1_type: Pedal1Type):
+        self._data[_PEDAL1_TYPE] = pedal1_type._value_
+
+    @property
+    def pedal2_type(self) -> Pedal2Type:
+        return _PEDAL2_TYPES[self._data[_PEDAL2_TYPE]]
+
+    @pedal2_type.setter
+    def pedal2_type(self, pedal2_type: Pedal2Type):
+        self._data[_PEDAL2_TYPE] = pedal2_type._value_
+
+    @property
+    def reverb_type(self) -> ReverbType:
+        return _REVERB_TYPES[self._data[_REVERB_TYPE]]
+
+    @reverb_type.setter
+    def reverb_type(self, reverb_type: ReverbType):
+        self._data[_REVERB_TYPE] = reverb_type._value_
+
+    @property
+    def active_effects(self) -> dict[EffectOnOff, int]:
+        return _ItemsView(self._data, _ACTIVE_EFFECTS, EffectOnOff)
+
+    @active_effects.setter
+    def active_effects(self, active_effects: dict[EffectOnOff, int]):
+        for effect_on_off, value in active_effects.items():
+            self._data[_ACTIVE_EFFECTS + effect_on_off._value_] = value
+
+    @property
+    def amp_params(self) -> dict[AmpParam, int]:
+        return _ItemsView(self._data, _AMP_PARAMS, AmpParam)
+
+    @amp_params.setter
+    def amp_params(self, amp_params: dict[AmpParam, int]):
+        for amp_param, value in amp_params.items():
+            self._data[_AMP_PARAMS + amp_param._value_] = value
+
+    @property
+    def pedal1_values(self) -> list[int]:
+        return _ValuesView(self._data, _PEDAL1_VALUES, 6)
+
+    @pedal1_values.setter
+    def pedal1_values(self, values: list[int]):
+        self._set_values(_PEDAL1_VALUES, 6, values)
+
+    @property
+    def pedal2_values(self) -> list[int]:
+        return _ValuesView(self._data, _PEDAL2_VALUES, 6)
+
+    @pedal2_values.setter
+    def pedal2_values(self, values: list[int]):
+        self._set_values(_PEDAL2_VALUES, 6, values)
+
+    @property
+    def reverb_values(self) -> list[int]:
+        return _ValuesView(self._data, _REVERB_VALUES, 5)
+
+    @reverb_values.setter
+    def reverb_values(self, values: list[int]):
+        self._set_values(_REVERB_VALUES, 5, values)
 
     def to_json_dict(self, for_ampfx=False) -> dict:
         d = {}
@@ -152,274 +348,18 @@ class VoxProgram:
         self.active_effects[EffectOnOff.REVERB] = int(bool(
             effect_status & EffectStatus.REVERB_ON))
     
-    def data_read(self, shargs: list[int]):
-        unused = shargs.pop(0)
-        pname_intor, shargs = shargs[:18], shargs[18:]
-        pname_int = pname_intor[:7] + pname_intor[8:15] + pname_intor[16:18]
-        self.program_name = ''.join([chr(p) for p in pname_int]).strip()
-
-        self.nr_sens = shargs.pop(0)
-
-        self.set_effect_status(EffectStatus(shargs.pop(0)))        
-
-        self.amp_model = AmpModel(shargs.pop(0))
-
-        amp_params = self.amp_params
-        amp_params[AmpParam.GAIN] = shargs.pop(0)
-        amp_params[AmpParam.TREBLE] = shargs.pop(0)
-        
-        # undocumented number
-        unused = shargs.pop(0)
-        
-        amp_params[AmpParam.MIDDLE] = shargs.pop(0)
-        amp_params[AmpParam.BASS] = shargs.pop(0)
-        amp_params[AmpParam.VOLUME] = shargs.pop(0)
-        amp_params[AmpParam.TONE] = shargs.pop(0)
-        amp_params[AmpParam.RESONANCE] = shargs.pop(0)
-        amp_params[AmpParam.BRIGHT_CAP] = shargs.pop(0)
-        amp_params[AmpParam.LOW_CUT] = shargs.pop(0)
-        
-        # undocumented number
-        pedal1_exceed_i = shargs.pop(0)
-        
-        amp_params[AmpParam.MID_BOOST] = shargs.pop(0)
-        amp_params[AmpParam.BIAS_SHIFT] = shargs.pop(0)
-        amp_params[AmpParam.CLASS] = shargs.pop(0)
-        
-        pedal1_type_int = shargs.pop(0)
-        pedal1_values, shargs = shargs[:8], shargs[8:]
-        
-        # delete one unused number
-        pedal2_exceed_i = pedal1_values.pop(3)
-
-        self.pedal1_type = Pedal1Type(pedal1_type_int)
+    def data_read(self, shargs):
+        '''read a program dump, shargs (list, bytes or memoryview)
+        starting just after the mode and program number'''
+        PROGRAM_LAYOUT.read(self, shargs)
 
-        self.pedal1_values[0] = pedal1_values[0] + pedal1_values[1] * 256
-        if pedal1_exceed_i & 0x10:
-            self.pedal1_values[0] += 128
+    def data_write(self) -> bytearray:
+        return PROGRAM_LAYOUT.write(self)
 
-        for i in range(1, 6):
-            self.pedal1_values[i] = pedal1_values[i + 1]
-        
-        pedal2_type_int = shargs.pop(0)
-        pedal2_values, shargs = shargs[:9], shargs[9:]
-        
-        # delete one unused number
-        pedal2_values.__delitem__(2)
-        
-        self.pedal2_type = Pedal2Type(pedal2_type_int)
-        
-        self.pedal2_values[0] = pedal2_values[0] + pedal2_values[1] * 256
-        if pedal2_exceed_i & 0x20:
-            self.pedal2_values[0] += 128
+    def ampfx_data_read(self, shargs):
+        '''read a custom ampfx dump, shargs (list, bytes or memoryview)
+        starting just after the ampfx number'''
+        AMPFX_LAYOUT.read(self, shargs)
 
-        for i in range(1, 6):
-            self.pedal2_values[i] = pedal2_values[i + 1]
-        
-        # 8 documented reserved numbers + 2 undocumented
-        shargs = shargs[8:]
-                    
-        reverb_type_int = shargs.pop(0)
-        reverb_values, shargs = shargs[:6], shargs[6:]
-        reverb_values.__delitem__(0)
-
-        self.reverb_type = ReverbType(reverb_type_int)
-
-        for reverb_param in ReverbParam:
-            self.reverb_values[reverb_param.value] = \
-                reverb_values[reverb_param.value]
-
-    def data_write(self) -> list[int]:
-        out = list[int]()
-        
-        # 1 unused
-        out.append(0)
-        
-        # program name
-        name_ints = [ord(c) for c in self.program_name]
-        
-        if len(name_ints) > 16:
-            name_ints = name_ints[:16]
-        while len(name_ints) < 16:
-            name_ints.append(ord(' '))
-        
-        name_ints.insert(7, 0)
-        name_ints.insert(15, 0)
-        out += name_ints
-        
-        # noise gate
-        out.append(self.nr_sens)
-
-        effect_status = EffectStatus.ALL_OFF
-        if self.active_effects[EffectOnOff.PEDAL1]:
-            effect_status |= EffectStatus.PEDAL1_ON
-        if self.active_effects[EffectOnOff.PEDAL2]:
-            effect_status |= EffectStatus.PEDAL2_ON
-        if self.active_effects[EffectOnOff.REVERB]:
-            effect_status |= EffectStatus.REVERB_ON
-        out.append(effect_status.value)
-                
-        out.append(self.amp_model.value)
-        
-        # amp params
-        out.append(self.amp_params[AmpParam.GAIN])
-        out.append(self.amp_params[AmpParam.TREBLE])
-        out.append(0)
-        out.append(self.amp_params[AmpParam.MIDDLE])
-        out.append(self.amp_params[AmpParam.BASS])
-        out.append(self.amp_params[AmpParam.VOLUME])
-        out.append(self.amp_params[AmpParam.TONE])
-        out.append(self.amp_params[AmpParam.RESONANCE])
-        out.append(self.amp_params[AmpParam.BRIGHT_CAP])
-        out.append(self.amp_params[AmpParam.LOW_CUT])
-        
-        # Amp needs to know if chorus first value exceed 127
-        out.append(0x10 if self.pedal1_values[0] % 256 > 127 else 0)
-
-        out.append(self.amp_params[AmpParam.MID_BOOST])
-        out.append(self.amp_params[AmpParam.BIAS_SHIFT])
-        out.append(self.amp_params[AmpParam.CLASS])
-                
-        out.append(self.pedal1_type.value)
-            
-        big, small = divmod(self.pedal1_values[0], 256)
-        out.append(small % 128)
-        out.append(big)
-        out.append(self.pedal1_values[1])        
-        
-        # Amp needs to know if effect2 first value exceed 127
-        out.append(0x20 if self.pedal2_values[0] % 256 > 127 else 0)
-
-        out += self.pedal1_values[2:]
-        
-        out.append(self.pedal2_type.value)
-        big, small = divmod(self.pedal2_values[0], 256)
-        out.append(small % 128)
-        out.append(big)
-        out.append(0)
-        out += self.pedal2_values[1:]
-        
-        for i in range(9):
-            out.append(0)
-        
-        out.append(self.reverb_type.value)
-        out.append(0)
-        out += self.reverb_values
-        
-        out.append(0)
-        
-        return out
-
-    def ampfx_data_read(self, shargs: list[int]):
-        # 16 samples reserved + 3 undocumented
-        shargs = shargs[19:]
-        self.nr_sens = shargs.pop(0)
-        
-        fake_effect_status = shargs.pop(0)
-
-        data_bits = EffectStatus(fake_effect_status)
-        self.active_effects[EffectOnOff.PEDAL1] = int(bool(
-            data_bits & EffectStatus.PEDAL1_ON))
-        self.active_effects[EffectOnOff.PEDAL2] = int(bool(
-            data_bits & EffectStatus.PEDAL2_ON))
-        self.active_effects[EffectOnOff.REVERB] = int(bool(
-            data_bits & EffectStatus.REVERB_ON))
-        
-        self.amp_model = AmpModel(shargs.pop(0))
-        
-        # 5 documented reserved, 1 more
-        shargs = shargs[6:]
-        
-        self.amp_params[AmpParam.TONE] = shargs.pop(0)
-        self.amp_params[AmpParam.RESONANCE] = shargs.pop(0)
-        self.amp_params[AmpParam.BRIGHT_CAP] = shargs.pop(0)
-        self.amp_params[AmpParam.LOW_CUT] = shargs.pop(0)
-        pedal1_key = shargs.pop(0)
-        self.amp_params[AmpParam.MID_BOOST] = shargs.pop(0)
-        self.amp_params[AmpParam.BIAS_SHIFT] = shargs.pop(0)        
-        self.amp_params[AmpParam.CLASS] = shargs.pop(0)
-
-        self.pedal1_type = Pedal1Type(shargs.pop(0))
-        pedal1_values, shargs = shargs[:8], shargs[8:]
-        pedal2_key = pedal1_values.pop(3)
-        
-        self.pedal1_values[0] = pedal1_values[0] + pedal1_values[1] * 256
-        if pedal1_key & 0x10:
-            self.pedal1_values[0] += 128
-
-        for i in range(1, 6):
-            self.pedal1_values[i] = pedal1_values[i + 1]
-        
-        self.pedal2_type = Pedal2Type(shargs.pop(0))
-        pedal2_values, shargs = shargs[:8], shargs[8:]
-        pedal2_values.__delitem__(2) # reverb_key ???
-
-        self.pedal2_values[0] = pedal2_values[0] + pedal2_values[1] * 256
-        if pedal2_key & 0x20:
-            self.pedal2_values[0] += 128
-
-        for i in range(1, 6):
-            self.pedal2_values[i] = pedal2_values[i + 1]
-        
-        # 10 following zeros
-        shargs = shargs[10:]
-        
-        self.reverb_type = ReverbType(shargs.pop(0))
-        
-        reverb_values, shargs = shargs[:5], shargs[5:]
-        self.reverb_values = reverb_values.copy()
-
-    def ampfx_data_write(self) -> list[int]:
-        out = [0 for i in range(19)]
-        out.append(self.nr_sens)
-        
-        effect_status = EffectStatus.ALL_OFF
-        if self.active_effects[EffectOnOff.PEDAL1]:
-            effect_status |= EffectStatus.PEDAL1_ON
-        if self.active_effects[EffectOnOff.PEDAL2]:
-            effect_status |= EffectStatus.PEDAL2_ON
-        if self.active_effects[EffectOnOff.REVERB]:
-            effect_status |= EffectStatus.REVERB_ON
-        out.append(effect_status.value)
-        
-        out.append(self.amp_model.value)
-        
-        out += [0 for i in range(6)]
-        
-        out.append(self.amp_params[AmpParam.TONE])
-        out.append(self.amp_params[AmpParam.RESONANCE])
-        out.append(self.amp_params[AmpParam.BRIGHT_CAP])
-        out.append(self.amp_params[AmpParam.LOW_CUT])
-        out.append(0x10 if self.pedal1_values[0] % 256 > 127 else 0)
-        out.append(self.amp_params[AmpParam.MID_BOOST])
-        out.append(self.amp_params[AmpParam.BIAS_SHIFT])
-        out.append(self.amp_params[AmpParam.CLASS])
-        
-        out.append(self.pedal1_type.value)
-        big, small = divmod(self.pedal1_values[0], 256)
-        out.append(small % 128)
-        out.append(big)
-        out.append(self.pedal1_values[1])
-
-        # Amp needs to know if effect2 first value exceed 127
-        out.append(0x20 if self.pedal2_values[0] % 256 > 127 else 0)
-
-        out += self.pedal1_values[2:]
-        
-        out.append(self.pedal2_type.value)
-        big, small = divmod(self.pedal2_values[0], 256)
-        out.append(small % 128)
-        out.append(big)
-        out.append(0)
-        out += self.pedal2_values[1:]
-        
-        for i in range(9):
-            out.append(0)
-        
-        out.append(self.reverb_type.value)
-        out.append(0)
-        out += self.reverb_values
-        
-        out.append(0)
-        
-        return out
+    def ampfx_data_write(self) -> bytearray:
+        return AMPFX_LAYOUT.write(self)
@@ -0,0 +1,105 @@
+import json
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from engine import Engine, EngineCallback
+from vox_emulator import EmulatorClient, VoxEmulator
+from vox_program import VoxProgram
+
+
+class LoadFullAmpTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = Engine()
+        self.engine.project_path = Path(self.tmp_dir.name)
+        self.callbacks = list[tuple[EngineCallback, object]]()
+        self.engine._send_cb = (
+            lambda cb, arg=None: self.callbacks.append((cb, arg)))
+
+    def tearDown(self):
+        self.engine.callbacks.stop()
+        self.tmp_dir.cleanup()
+
+    def _write_file(self, full_dict) -> Path:
+        filepath = Path(self.tmp_dir.name) / 'full_amp.json'
+        with open(filepath, 'w') as f:
+            json.dump(full_dict, f)
+        return filepath
+
+    def test_invalid_file_is_reported_as_failed_upload(self):
+        filepath = self._write_file({'banks': 'not a list'})
+
+        self.engine.load_full_amp(filepath)
+        self.engine.process_event_queue()
+
+        self.assertFalse(self.engine.is_uploading())
+        self.assertEqual(
+            self.callbacks,
+            [(EngineCallback.UPLOAD_FINISHED,
+              [f'bank{n}' for n in range(8)]
+              + [f'ampfx{n}' for n in range(4)])])
+
+    def test_missing_file_is_reported_as_failed_upload(self):
+        self.engine.load_full_amp(
+            Path(self.tmp_dir.name) / 'missing.json', with_ampfxs=False)
+        self.engine.process_event_queue()
+
+        self.assertEqual(
+            self.callbacks,
+            [(EngineCallback.UPLOAD_FINISHED,
+              [f'bank{n}' for n in range(8)])])
+
+    def test_valid_file_is_uploaded(self):
+        program = VoxProgram().to_json_dict()
+        filepath = self._write_file(
+            {'banks': [program] * 8,
+             'ampfxs': [VoxProgram().to_json_dict(for_ampfx=True)] * 4})
+
+        self.engine.load_full_amp(filepath)
+        self.engine.process_event_queue()
+
+        self.assertTrue(self.engine.is_uploading())
+        self.assertEqual(self.engine._upload_job.total, 12)
+        self.assertNotIn(EngineCallback.UPLOAD_FINISHED,
+                         [cb for cb, arg in self.callbacks])
+
+
+class SaveFullAmpTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = Engine()
+        self.engine.project_path = Path(self.tmp_dir.name)
+        self.emulator = VoxEmulator(latency=0.0, byte_rate=1e9)
+        self.client = EmulatorClient(self.emulator)
+        self.client.set_engine(self.engine)
+        self.engine.start_communication(use_cache=False)
+        self.assertTrue(self.client.run_until_idle())
+
+    def tearDown(self):
+        self.engine.callbacks.stop()
+        self.tmp_dir.cleanup()
+
+    def test_unverified_slots_are_read_before_saving(self):
+        # as restored from the cache of an other identical amp
+        for program in self.engine.programs:
+            program.program_name = 'CACHED'
+        self.engine._unverified_banks = set(range(8))
+        self.engine._unverified_ampfxs = set(range(4))
+
+        filepath = Path(self.tmp_dir.name) / 'full_amp.json'
+        self.engine.save_all_amp(filepath)
+        self.assertTrue(self.client.run_until_idle())
+
+        with open(filepath, 'r') as f:
+            full_dict = json.load(f)
+        self.assertEqual(
+            [bank['program_name'] for bank in full_dict['banks']],
+            [f'USER {i + 1}' for i in range(8)])
+
+
+if __name__ == '__main__':
+    unittest.main()
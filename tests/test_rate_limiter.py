@@ -0,0 +1,58 @@
+from pathlib import Path
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from midi_enums import FunctionCode
+from rate_limiter import OutputRateLimiter
+
+
+def _param_change(value: int) -> list[int]:
+    return [0xF0, 0x42, 0x30, 0x00, 0x01, 0x34,
+            FunctionCode.PARAMETER_CHANGE.value, 4, 0, value, 0, 0xF7]
+
+
+class SharedLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch('rate_limiter.time.monotonic',
+                             lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_linked_devices_stay_together(self):
+        limiter = OutputRateLimiter(
+            interactive_rate=120.0, interactive_burst=12, n_devices=2)
+
+        # changes fanned out to two linked devices
+        for value in range(40):
+            limiter.push(_param_change(value), dest='amp0')
+            limiter.push(_param_change(value), dest='amp1')
+
+        sent = {'amp0': 0, 'amp1': 0}
+        while limiter.has_pending():
+            self.now += 0.010
+            for msg, dest in limiter.pop_ready_with_dests():
+                sent[dest] += 1
+                self.assertLessEqual(abs(sent['amp0'] - sent['amp1']), 1)
+
+        self.assertEqual(sent, {'amp0': 40, 'amp1': 40})
+
+    def test_take_pending_keeps_order_and_slowest_rate(self):
+        limiter = OutputRateLimiter(n_devices=2)
+        old = OutputRateLimiter()
+        old.push(_param_change(1), dest='amp1')
+        old.report_drain_failure()
+
+        limiter.take_pending(old)
+
+        self.assertFalse(old.has_pending())
+        self.assertEqual(limiter.factor, old.factor)
+        self.assertEqual(limiter.pop_ready_with_dests(),
+                         [(_param_change(1), 'amp1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
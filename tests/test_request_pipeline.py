@@ -0,0 +1,137 @@
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from midi_enums import FunctionCode
+from request_pipeline import RequestPipeline
+
+
+class ErrorMatchingTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = list[FunctionCode]()
+        self.failed = list[FunctionCode]()
+        self.pipeline = RequestPipeline(self._send)
+        self.pipeline.set_failure_callback(
+            lambda request: self.failed.append(request.function_code))
+
+    def _send(self, function_code: FunctionCode, *args: int,
+              release_cb=None):
+        self.sent.append(function_code)
+        if release_cb is not None:
+            release_cb()
+
+    def test_error_is_not_blamed_on_mode_request(self):
+        mode_request = self.pipeline.send(FunctionCode.MODE_REQUEST)
+        param_change = self.pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+
+        request = self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_ERROR)
+
+        self.assertIs(request, param_change)
+        self.assertIs(request.error_code, FunctionCode.DATA_LOAD_ERROR)
+        self.assertEqual(self.pipeline.in_flight(), [mode_request])
+        self.assertEqual(self.failed, [FunctionCode.PARAMETER_CHANGE])
+
+    def test_error_without_data_sent_is_unexpected(self):
+        self.pipeline.send(FunctionCode.MODE_REQUEST)
+        self.pipeline.send(FunctionCode.PROGRAM_DATA_DUMP_REQUEST, 0, 3)
+
+        self.assertIsNone(self.pipeline.response_received(
+            FunctionCode.DATA_FORMAT_ERROR))
+        self.assertEqual(len(self.pipeline.in_flight()), 2)
+
+    def test_refused_dump_request_takes_the_error(self):
+        self.pipeline.send(FunctionCode.MODE_REQUEST)
+        dump_request = self.pipeline.send(
+            FunctionCode.PROGRAM_DATA_DUMP_REQUEST, 0, 9)
+        param_change = self.pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_ERROR), dump_request)
+        self.assertIn(param_change, self.pipeline.in_flight())
+        self.assertEqual(self.failed,
+                         [FunctionCode.PROGRAM_DATA_DUMP_REQUEST])
+
+    def test_oldest_data_request_takes_the_error(self):
+        first = self.pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+        self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 1, 20, 0)
+
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_ERROR), first)
+
+
+class SupersedeTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = list[FunctionCode]()
+        self.pipeline = RequestPipeline(self._send)
+
+    def _send(self, function_code: FunctionCode, *args: int,
+              release_cb=None):
+        self.sent.append(function_code)
+        if release_cb is not None:
+            release_cb()
+
+    def test_superseded_change_takes_its_own_answer(self):
+        old = self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+        new = self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 60, 0)
+        dump = self.pipeline.send(
+            FunctionCode.PROGRAM_DATA_DUMP, 0, 3, *([0] * 108))
+
+        self.assertTrue(old.superseded)
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_COMPLETED), old)
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_COMPLETED), new)
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_ERROR), dump)
+
+    def test_superseded_change_is_not_retried(self):
+        old = self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+        new = self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 60, 0)
+
+        old.deadline = 0.0
+        self.pipeline.check_timeouts()
+
+        self.assertEqual(self.sent.count(FunctionCode.PARAMETER_CHANGE), 2)
+        self.assertEqual(self.pipeline.in_flight(), [new])
+
+
+class QueueTimeTest(unittest.TestCase):
+    def test_answers_ahead_are_counted_in_queue_time(self):
+        pipeline = RequestPipeline(
+            lambda fc, *args, release_cb=None: release_cb())
+        first = pipeline.send(FunctionCode.PROGRAM_DATA_DUMP_REQUEST, 1, 0)
+        second = pipeline.send(FunctionCode.PROGRAM_DATA_DUMP_REQUEST, 1, 1)
+        param_change = pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+
+        self.assertEqual(first.queue_time, 0.0)
+        self.assertAlmostEqual(param_change.queue_time,
+                               first.transfer_time()
+                               + second.transfer_time())
+        self.assertLess(param_change.transfer_time(),
+                        first.transfer_time())
+
+    def test_first_timeout_covers_the_window(self):
+        pipeline = RequestPipeline(
+            lambda fc, *args, release_cb=None: release_cb(), window=4)
+        dump_request = pipeline.send(
+            FunctionCode.PROGRAM_DATA_DUMP_REQUEST, 1, 0)
+        param_change = pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+
+        self.assertAlmostEqual(pipeline.timeout_for(dump_request),
+                               4 * dump_request.transfer_time())
+        self.assertGreater(pipeline.timeout_for(dump_request),
+                           pipeline.timeout)
+        self.assertEqual(pipeline.timeout_for(param_change),
+                         pipeline.timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+from pathlib import Path
+import sys
+import tempfile
+from typing import Callable
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from effects import AmpParam, VoxIndex
+from engine import SYSEX_BEGIN, CommunicationState, Engine, EngineCallback
+from midi_enums import FunctionCode, MidiConnectState
+
+
+class ProgramNameChangeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = Engine()
+        self.engine.project_path = Path(self.tmp_dir.name)
+        self.callbacks = list[tuple[EngineCallback, object]]()
+        self.engine._send_cb = (
+            lambda cb, arg=None: self.callbacks.append((cb, arg)))
+
+    def tearDown(self):
+        self.engine.callbacks.stop()
+        self.tmp_dir.cleanup()
+
+    def _receive_name_char(self, index: int, char: str):
+        self.engine.receive_sysex(
+            SYSEX_BEGIN + [FunctionCode.PARAMETER_CHANGE.value,
+                           VoxIndex.PROGRAM_NAME.value, index, ord(char), 0]
+            + [247])
+
+    def test_program_name_change_is_a_param_change(self):
+        self.engine.current_program.program_name = 'CLEAN'
+        self._receive_name_char(0, 'G')
+
+        self.assertEqual(self.engine.current_program.program_name, 'GLEAN')
+        self.assertIn(
+            (EngineCallback.PARAM_CHANGED,
+             (self.engine.current_program, VoxIndex.PROGRAM_NAME, 0)),
+            self.callbacks)
+
+    def test_name_char_after_the_end(self):
+        self.engine.current_program.program_name = 'AB'
+        self._receive_name_char(3, 'D')
+
+        self.assertEqual(self.engine.current_program.program_name, 'AB D')
+
+    def test_name_index_out_of_range_is_ignored(self):
+        self.engine.current_program.program_name = 'AB'
+        self._receive_name_char(16, 'D')
+
+        self.assertEqual(self.engine.current_program.program_name, 'AB')
+        self.assertNotIn(EngineCallback.PARAM_CHANGED,
+                         [cb for cb, arg in self.callbacks])
+
+
+
+class DeviceErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = Engine()
+        self.engine.project_path = Path(self.tmp_dir.name)
+        self.engine.set_midi_out_func(lambda msg, release_cb=None: None)
+        self.engine._midi_connect_state = MidiConnectState.CONNECTED
+        self.engine.communication_state = CommunicationState.OK
+        self.callbacks = list[tuple[EngineCallback, object]]()
+        self.engine._send_cb = (
+            lambda cb, arg=None: self.callbacks.append((cb, arg)))
+
+    def tearDown(self):
+        self.engine.callbacks.stop()
+        self.tmp_dir.cleanup()
+
+    def test_refused_param_change_keeps_the_link(self):
+        self.engine.set_param_value(VoxIndex.AMP, AmpParam.GAIN, 30)
+        self.engine.process_event_queue()
+
+        self.engine.receive_sysex(
+            SYSEX_BEGIN + [FunctionCode.DATA_LOAD_ERROR.value, 247])
+
+        # no probe, and no new sync after the answer to a probe
+        self.assertFalse(self.engine.is_probing())
+        self.assertEqual(self.engine.request_pipeline.pending(), [])
+        self.assertIn(
+            (EngineCallback.DATA_ERROR, FunctionCode.PARAMETER_CHANGE),
+            self.callbacks)
+
+
+
+class DeviceInquiryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = Engine()
+        self.engine.project_path = Path(self.tmp_dir.name)
+        self.release_cbs = list[Callable[[], None]]()
+        self.engine.set_midi_out_func(
+            lambda msg, release_cb=None: self.release_cbs.append(release_cb))
+
+    def tearDown(self):
+        self.engine.callbacks.stop()
+        self.tmp_dir.cleanup()
+
+    def test_inquiry_timeout_starts_at_release(self):
+        self.engine._ask_device_identity()
+
+        # inquiry still in the output queue, it can not time out
+        self.assertIsNone(self.engine.next_timeout())
+        self.engine.check_pending_requests()
+        self.assertTrue(self.engine._identity_asked_time)
+
+        self.release_cbs[-1]()
+        self.assertLessEqual(self.engine.next_timeout(),
+                             self.engine.request_pipeline.timeout)
+
+        self.engine.receive_sysex(
+            [0xF0, 0x7E, 0x00, 0x06, 0x02] + [0x42] * 9 + [0xF7])
+        self.assertEqual(self.engine.device_identity, tuple([0x42] * 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from pathlib import Path
+import sys
+import unittest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+
+from midi_enums import FunctionCode
+from request_pipeline import RequestPipeline
+from upload_job import UploadJob, UploadSlot
+from vox_program import VoxProgram
+
+
+class UploadErrorAttributionTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = list[FunctionCode]()
+        self.pipeline = RequestPipeline(self._send)
+        self.finished = list[list[UploadSlot]]()
+
+        self.slot = UploadSlot.bank(2, VoxProgram())
+        self.job = UploadJob(
+            lambda slot: self.pipeline.send(
+                slot.function_code, *slot.args()),
+            [self.slot])
+        self.job.set_finished_callback(self.finished.append)
+
+    def _send(self, function_code: FunctionCode, *args: int,
+              release_cb=None):
+        self.sent.append(function_code)
+        if release_cb is not None:
+            release_cb()
+
+    def test_parameter_change_error_is_not_charged_to_the_slot(self):
+        param_change = self.pipeline.send(
+            FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+        self.job.start()
+
+        # device answers in order, the error is for the parameter change
+        self.assertIs(self.pipeline.response_received(
+            FunctionCode.DATA_LOAD_ERROR), param_change)
+        self.assertEqual(self.slot.attempts, 1)
+        self.assertFalse(self.job.is_finished())
+
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.assertEqual(self.finished, [[]])
+        self.assertEqual(self.sent.count(FunctionCode.PROGRAM_DATA_DUMP), 1)
+
+    def test_refused_slot_is_sent_again(self):
+        self.job.start()
+
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_ERROR)
+        self.assertEqual(self.slot.attempts, 2)
+
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.assertEqual(self.finished, [[]])
+        self.assertEqual(self.sent.count(FunctionCode.PROGRAM_DATA_DUMP), 2)
+
+    def test_error_after_superseded_change_is_charged_to_the_slot(self):
+        other_slot = UploadSlot.bank(4, VoxProgram())
+        job = UploadJob(
+            lambda slot: self.pipeline.send(
+                slot.function_code, *slot.args()),
+            [self.slot, other_slot], window=2)
+        job.set_finished_callback(self.finished.append)
+
+        # the older change is superseded while in flight
+        self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 50, 0)
+        self.pipeline.send(FunctionCode.PARAMETER_CHANGE, 4, 0, 60, 0)
+        job.start()
+        self.assertEqual(self.sent.count(FunctionCode.PROGRAM_DATA_DUMP), 2)
+
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_ERROR)
+        self.assertEqual(self.slot.attempts, 1)
+        self.assertEqual(job.window, 1)
+
+        # answer may be for the refused slot, other slot is sent again
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.assertEqual(other_slot.attempts, 2)
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_COMPLETED)
+        self.assertEqual(job.done, 1)
+        self.assertEqual(self.slot.attempts, 2)
+
+        # device refuses the slot until its retries are exhausted
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_ERROR)
+        self.pipeline.response_received(FunctionCode.DATA_LOAD_ERROR)
+        self.assertEqual(self.slot.attempts, 3)
+        self.assertEqual(self.finished, [[self.slot]])
+
+
+if __name__ == '__main__':
+    unittest.main()